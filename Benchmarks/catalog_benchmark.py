@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import cherrypy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Home_Catalog import HomeCatalog
+
+
+def build_catalog(file_path, device_count):
+    """
+    Write a catalog file with the given number of sensors and a single water pump.
+    """
+    catalog = {
+        "actuators": [{"actuatorID": "waterpump", "actuatorName": "Water Pump", "status": "OFF"}],
+        "sensors": [
+            {"sensorID": f"soil_moisture{i}", "sensorType": "Soil Moisture Sensor", "status": "active"}
+            for i in range(device_count)
+        ],
+        "commands": []
+    }
+    with open(file_path, 'w') as file:
+        json.dump(catalog, file)
+
+
+def time_calls(func, repeat):
+    """
+    Return the average duration of a call in microseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(device_counts=(10, 1000, 100000), repeat=2000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for device_count in device_counts:
+            file_path = os.path.join(tmp_dir, f"catalog_{device_count}.json")
+            build_catalog(file_path, device_count)
+            catalog = HomeCatalog(file_path)
+            # Measure the lookup cost only, not the disk write
+            catalog.save_data = lambda entry: None
+
+            last_id = f"soil_moisture{device_count - 1}"
+            get_us = time_calls(lambda: catalog.GET("sensors", last_id), repeat)
+
+            cherrypy.request.json = {"status": "inactive"}
+            put_us = time_calls(lambda: catalog.PUT("sensors", last_id), repeat)
+
+            print(f"{device_count:>7} devices: GET {get_us:8.2f} us/op, PUT {put_us:8.2f} us/op")
+
+
+if __name__ == '__main__':
+    run()
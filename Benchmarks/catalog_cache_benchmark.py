@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import http.client
+import cherrypy
+from cheroot import wsgi
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Home_Catalog import HomeCatalog
+from catalog_benchmark import build_catalog
+
+
+def client_loop(port, paths, deadline, counts):
+    """
+    GET the paths in turn over one keep-alive connection until the deadline.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    done = 0
+    while time.time() < deadline:
+        connection.request('GET', paths[done % len(paths)])
+        response = connection.getresponse()
+        response.read()
+        done += 1
+    connection.close()
+    counts.append(done)
+
+
+def run_round(port, paths, clients, duration):
+    deadline = time.time() + duration
+    counts = []
+    threads = [threading.Thread(target=client_loop, args=(port, paths, deadline, counts)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / duration
+
+
+def run(device_count=1000, clients=4, duration=3, port=8092):
+    conf = {
+        '/': {
+            'request.dispatch': cherrypy.dispatch.MethodDispatcher(),
+            'tools.response_headers.on': True,
+            'tools.response_headers.headers': [('Content-Type', 'application/json')],
+        }
+    }
+    cherrypy.config.update({'environment': 'embedded', 'log.screen': False})
+    paths = ['/garden/sensors', '/garden/actuators', '/garden/sensors/soil_moisture1', '/garden/actuators/waterpump']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'catalog.json')
+        build_catalog(file_path, device_count)
+        catalog = HomeCatalog(file_path, flush_interval=1)
+        app = cherrypy.tree.mount(catalog, '/garden', conf)
+        cherrypy.server.unsubscribe()
+        cherrypy.engine.start()
+        server = wsgi.Server(('127.0.0.1', port), app, numthreads=clients)
+        server.prepare()
+        server_thread = threading.Thread(target=server.serve, daemon=True)
+        server_thread.start()
+        try:
+            for cache_enabled in (False, True):
+                catalog.cache_enabled = cache_enabled
+                catalog.response_cache.clear()
+                catalog.cache_hits = catalog.cache_misses = 0
+                rate = run_round(port, paths, clients, duration)
+                print(f"cache {'on ' if cache_enabled else 'off'}: {rate:8.0f} requests/s "
+                      f"(hits {catalog.cache_hits}, misses {catalog.cache_misses})")
+        finally:
+            server.stop()
+            cherrypy.engine.exit()
+            catalog.stop()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import http.client
+import cherrypy
+from cheroot import wsgi
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Home_Catalog import HomeCatalog
+
+CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'catalog.json')
+
+
+def client_loop(port, path, method, body, deadline, counts):
+    """
+    Send requests over one keep-alive connection until the deadline and count the successful ones.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/json'}
+    done = 0
+    while time.time() < deadline:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status == 200:
+            done += 1
+    connection.close()
+    counts.append(done)
+
+
+def run_round(app, thread_count, duration, port):
+    """
+    Serve the catalog with thread_count server threads and as many reading clients, plus one writer.
+    """
+    server = wsgi.Server(('127.0.0.1', port), app, numthreads=thread_count + 1)
+    server.prepare()
+    server_thread = threading.Thread(target=server.serve, daemon=True)
+    server_thread.start()
+
+    deadline = time.time() + duration
+    reads, writes = [], []
+    clients = [threading.Thread(target=client_loop, args=(port, '/garden/sensors/soil_moisture1', 'GET', None,
+                                                          deadline, reads))
+               for _ in range(thread_count)]
+    clients.append(threading.Thread(target=client_loop, args=(port, '/garden/actuators/waterpump', 'PUT',
+                                                              json.dumps({"status": "ON"}), deadline, writes)))
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    server.stop()
+    server_thread.join()
+    return sum(reads) / duration, sum(writes) / duration
+
+
+def run(thread_counts=(1, 2, 4, 8, 16), duration=3, port=8091):
+    conf = {
+        '/': {
+            'request.dispatch': cherrypy.dispatch.MethodDispatcher(),
+            'tools.response_headers.on': True,
+            'tools.response_headers.headers': [('Content-Type', 'application/json')],
+        }
+    }
+    cherrypy.config.update({'environment': 'embedded', 'log.screen': False})
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'catalog.json')
+        shutil.copy(CATALOG, file_path)
+        catalog = HomeCatalog(file_path, flush_interval=1)
+        app = cherrypy.tree.mount(catalog, '/garden', conf)
+        # The benchmark runs its own server for each thread count
+        cherrypy.server.unsubscribe()
+        cherrypy.engine.start()
+        try:
+            for thread_count in thread_counts:
+                reads, writes = run_round(app, thread_count, duration, port)
+                print(f"{thread_count:>3} server threads: {reads:9.0f} reads/s, {writes:7.0f} writes/s")
+        finally:
+            cherrypy.engine.exit()
+            catalog.stop()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import tempfile
+import contextlib
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(BASE, 'Control_units (Raspberry Pi)'))
+sys.path.insert(1, os.path.join(BASE, 'Replay'))
+sys.path.insert(2, os.path.join(BASE, 'Device_Connector (Arduino Nano)'))
+import SenML
+from Clock import VirtualClock
+from Control_unit import ControlUnit
+from Mqtt_replay import LogWriter, Replayer, LocalBroker, LocalClient
+from Sensor_fleet import SensorFleet
+
+
+class SimulatedControlUnit(ControlUnit):
+    """
+    ControlUnit with the water pump and the catalog replaced by in-memory state.
+    """
+
+    def __init__(self, clock, client):
+        self.pump_state = "OFF"
+        self.irrigations = []
+        self.sunrises = []
+        super().__init__(None, None, "http://simulation/garden/actuators", clock=clock, client=client)
+
+    def load_expected_topics(self):
+        pass
+
+    def check_water_pump_status(self):
+        return self.pump_state
+
+    def set_water_pump(self, command):
+        self.pump_state = command
+        if command == "ON":
+            self.irrigations.append(self.clock.now())
+        return True
+
+    def update_command_history(self, command_type):
+        pass
+
+    def handle_light(self, value):
+        was_sunrise = self.is_sunrise_time
+        super().handle_light(value)
+        if self.is_sunrise_time and not was_sunrise:
+            self.sunrises.append(self.clock.now())
+
+
+def record_week(path, start_time, days):
+    """
+    Log one garden's simulated readings on the topics ControlUnit subscribes to.
+    """
+    writer = LogWriter(path)
+
+    def publish(topic, message):
+        topic = topic.replace("Garden/zones/garden/", "Garden/")
+        writer.write(message["e"][0]["t"], topic, SenML.dumps(message))
+
+    fleet = SensorFleet(1, seed=3, start_time=start_time)
+    fleet.stream(publish, days * 144, garden_ids=["garden"], batch=False)
+    writer.close()
+    return writer.count
+
+
+def run(days=7):
+    start_time = 1725148800.0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "week.log")
+        messages = record_week(path, start_time, days)
+
+        # water_usage.json and the schedule file are written to the working directory
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            clock = VirtualClock(start_time)
+            broker = LocalBroker()
+            client = LocalClient("CentralControlUnit", broker, None)
+            control_unit = SimulatedControlUnit(clock, client)
+            client.notifier = control_unit
+            Replayer(path, broker.publish, clock=clock).schedule()
+
+            rounds = 0
+            started = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                while clock.time() < start_time + days * 86400:
+                    control_unit.run_round()
+                    clock.sleep(600)
+                    rounds += 1
+            elapsed = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+
+    simulated = clock.time() - start_time
+    print(f"Simulated {simulated / 86400:.1f} days ({messages} readings, {rounds} rounds) in {elapsed:.2f} s, "
+          f"{simulated / elapsed:.0f}x real time")
+    print(f"Sunrises detected: {', '.join(moment.strftime('%a %H:%M') for moment in control_unit.sunrises)}")
+    print(f"Irrigations: {', '.join(moment.strftime('%a %H:%M') for moment in control_unit.irrigations) or 'none'}")
+    print(f"Water used: {control_unit.total_water_used:.2f} liters")
+
+
+if __name__ == '__main__':
+    run()
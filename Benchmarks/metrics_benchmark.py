@@ -0,0 +1,47 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Metrics
+
+
+def handler(topic, payload):
+    return len(payload)
+
+
+def run(calls=1000000):
+    """
+    Cost per call of the instrumentation primitives, enabled and disabled (GARDEN_METRICS=0).
+    """
+    counter = Metrics.Counter("bench_total", "Benchmark counter")
+    histogram = Metrics.Histogram("bench_seconds", "Benchmark histogram")
+    null = Metrics.NULL_METRIC
+
+    cases = [
+        ("counter.inc()", counter.inc, null.inc),
+        ("histogram.observe()", lambda: histogram.observe(0.003), lambda: null.observe(0.003)),
+        ("with histogram.time()", lambda: histogram.time().__enter__().__exit__(None, None, None),
+         lambda: null.time().__enter__().__exit__(None, None, None)),
+        ("timed notify call", lambda: timed_enabled("topic", b"payload"), lambda: timed_disabled("topic", b"payload")),
+    ]
+    timed_enabled = Metrics.timed(histogram)(handler)
+    timed_disabled = Metrics.timed(null)(handler)
+
+    baseline = timeit.timeit(lambda: handler("topic", b"payload"), number=calls) / calls * 1e9
+    print(f"{'plain notify call':<24} {baseline:7.1f} ns")
+    for name, enabled, disabled in cases:
+        enabled_ns = timeit.timeit(enabled, number=calls) / calls * 1e9
+        disabled_ns = timeit.timeit(disabled, number=calls) / calls * 1e9
+        print(f"{name:<24} enabled {enabled_ns:7.1f} ns   disabled {disabled_ns:7.1f} ns")
+
+    registry = Metrics.Registry()
+    registry.register(counter)
+    registry.register(histogram)
+    renders = 1000
+    render_us = timeit.timeit(registry.render, number=renders) / renders * 1e6
+    print(f"Rendering /metrics with one counter and one histogram: {render_us:.1f} us")
+
+
+if __name__ == '__main__':
+    run()
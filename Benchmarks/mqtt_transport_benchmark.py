@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from MyMQTT import MyMQTT
+from AsyncMQTT import AsyncMQTT
+
+
+class Counter:
+    """
+    Notifier that counts the received messages and signals when all of them have arrived.
+    """
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.received = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def notify(self, topic, payload):
+        with self.lock:
+            self.received += 1
+            if self.received == self.expected:
+                self.done.set()
+
+
+def bench_mymqtt(broker, port, subscribers, messages, timeout):
+    counter = Counter(subscribers * messages)
+    clients = [MyMQTT(f"bench_sync_sub{i}", broker, port, counter) for i in range(subscribers)]
+    for client in clients:
+        client.start()
+        client.mySubscribe("Bench/sync/#")
+    publisher = MyMQTT("bench_sync_pub", broker, port, None)
+    publisher.start()
+    time.sleep(1)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        publisher.myPublish(f"Bench/sync/{i % 10}", {"e": [{"n": "bench", "v": i}]})
+    counter.done.wait(timeout)
+    elapsed = time.perf_counter() - start
+    threads = threading.active_count()
+
+    for client in clients + [publisher]:
+        client.stop()
+    return counter.received, elapsed, threads
+
+
+async def bench_asyncmqtt(broker, port, subscribers, messages, timeout):
+    counter = Counter(subscribers * messages)
+    clients = [AsyncMQTT(f"bench_async_sub{i}", broker, port, counter) for i in range(subscribers)]
+    for client in clients:
+        await client.start()
+        client.mySubscribe("Bench/async/#")
+    publisher = AsyncMQTT("bench_async_pub", broker, port, None)
+    await publisher.start()
+    await asyncio.sleep(1)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        publisher.myPublish(f"Bench/async/{i % 10}", {"e": [{"n": "bench", "v": i}]})
+    deadline = start + timeout
+    while not counter.done.is_set() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    threads = threading.active_count()
+
+    for client in clients + [publisher]:
+        await client.stop()
+    return counter.received, elapsed, threads
+
+
+def run(broker="localhost", port=1883, subscribers=10, messages=1000, timeout=60):
+    """
+    Publish messages to subscribers clients on a local broker and report delivered messages per second.
+    """
+    for name, bench in [("MyMQTT", lambda: bench_mymqtt(broker, port, subscribers, messages, timeout)),
+                        ("AsyncMQTT", lambda: asyncio.run(bench_asyncmqtt(broker, port, subscribers, messages,
+                                                                          timeout)))]:
+        received, elapsed, threads = bench()
+        print(f"{name:>9}: {received}/{subscribers * messages} messages in {elapsed:.2f} s, "
+              f"{received / elapsed:8.0f} msg/s, {threads} threads")
+
+
+if __name__ == '__main__':
+    run(*sys.argv[1:2])
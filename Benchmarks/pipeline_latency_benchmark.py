@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import numpy as np
+import cherrypy
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASE)
+sys.path.insert(1, os.path.join(BASE, 'Control_units (Raspberry Pi)'))
+sys.path.insert(2, os.path.join(BASE, 'Device_Connector (Arduino Nano)'))
+from Home_Catalog import HomeCatalog
+from Control_unit import ControlUnit
+from Device_Connector import DeviceConnector
+from Device_Connector_act import DeviceConnectorAct
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'pipeline_latency.json')
+
+# (hop name, mark it starts at, mark it ends at)
+HOPS = [
+    ("publish -> decision", "published", "decision"),
+    ("decision -> actuator", "decision", "actuator"),
+    ("actuator -> catalog", "actuator", "catalog"),
+    ("end to end", "published", "catalog"),
+]
+
+
+def mark(marks, obj, name, key, after=False):
+    """
+    Wrap a method of obj so that the first call of a round records time.perf_counter() in marks[key],
+    when the method is entered or, with after, when it returns.
+    """
+    method = getattr(obj, name)
+
+    def wrapper(*args, **kwargs):
+        if not after:
+            marks.setdefault(key, time.perf_counter())
+        result = method(*args, **kwargs)
+        if after:
+            marks.setdefault(key, time.perf_counter())
+        return result
+
+    setattr(obj, name, wrapper)
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE,
+                               capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_rest_services(directory, broker, port):
+    """
+    Serve the Home Catalog on /garden and the actuator connector on /garden/actuators at 127.0.0.1:8080,
+    each on its own copy of catalog.json, as the components expect.
+    """
+    shutil.copy(os.path.join(BASE, 'catalog.json'), os.path.join(directory, 'catalog.json'))
+    shutil.copy(os.path.join(BASE, 'catalog.json'), os.path.join(directory, 'actuators_catalog.json'))
+    with open(os.path.join(BASE, 'Device_Connector (Arduino Nano)', 'setting_act.json')) as file:
+        act_config = json.load(file)
+
+    conf = {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}}
+    catalog = HomeCatalog(os.path.join(directory, 'catalog.json'))
+    actuators = DeviceConnectorAct("bench_actuators", broker, port, act_config['baseTopic'],
+                                   act_config['devicesList'], os.path.join(directory, 'actuators_catalog.json'))
+    cherrypy.tree.mount(catalog, '/garden', conf)
+    cherrypy.tree.mount(actuators, '/garden/actuators', conf)
+    cherrypy.config.update({'server.socket_host': '127.0.0.1', 'server.socket_port': 8080,
+                            'server.thread_pool': 30, 'log.screen': False})
+    cherrypy.engine.start()
+    return catalog, actuators
+
+
+def start_device_connector(directory, broker, port):
+    with open(os.path.join(BASE, 'Device_Connector (Arduino Nano)', 'setting_sen.json')) as file:
+        config = json.load(file)
+    config.update({'clientID': 'bench_sensors', 'broker': broker, 'port': port, 'batchPublish': False})
+    config_file = os.path.join(directory, 'setting_sen.json')
+    with open(config_file, 'w') as file:
+        json.dump(config, file)
+    connector = DeviceConnector(config_file)
+    # Readings that always call for irrigation: dry soil, mild temperature, no rain
+    for sensor in connector.sensors:
+        for low, high, value in (("min_moisture", "max_moisture", 15), ("min_temp", "max_temp", 20),
+                                 ("min_light", "max_light", 50)):
+            if hasattr(sensor, low):
+                setattr(sensor, low, value)
+                setattr(sensor, high, value + 5)
+        if hasattr(sensor, "max_rain_level"):
+            sensor.max_rain_level = 1.0
+    return connector
+
+
+def percentiles(samples):
+    p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def run(broker="localhost", port=1883, rounds=200, warmup=5, save=True):
+    """
+    Drive full rounds through DeviceConnector -> MQTT -> ControlUnit -> actuator REST -> Home Catalog update, with
+    every component in this process and a local broker, and report the latency of each hop. Throughput counts
+    the time from publishing a round to the pump command, not the irrigation itself.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # ControlUnit writes water_usage.json and its schedule file to the working directory
+        os.chdir(directory)
+        try:
+            catalog, actuators = start_rest_services(directory, broker, port)
+            connector = start_device_connector(directory, broker, port)
+            control_unit = ControlUnit(broker, port, "http://127.0.0.1:8080/garden/actuators")
+            # Short irrigations keep the rounds back to back
+            control_unit.irrigation_duration = 0.2
+            control_unit.round_timeout = 5
+            time.sleep(1)
+
+            marks = {}
+            mark(marks, control_unit, "check_conditions_and_act", "decision")
+            mark(marks, actuators, "control_waterpump", "actuator")
+            # The pump command recorded in the Home Catalog over REST, not the connector's own catalog.json write
+            mark(marks, catalog, "add_command", "catalog", after=True)
+
+            samples = {name: [] for name, _, _ in HOPS}
+            incomplete = 0
+            busy = 0.0
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                for round_number in range(warmup + rounds):
+                    # Every round must be allowed to irrigate
+                    control_unit.reset_daily()
+                    control_unit.sunrise_counter = control_unit.SUNRISE_BUFFER / 2
+                    marks.clear()
+
+                    control_unit.start_data_collection()
+                    marks["published"] = time.perf_counter()
+                    connector.collect_and_publish_data()
+                    control_unit.wait_for_round()
+                    control_unit.check_conditions_and_act()
+                    round_end = time.perf_counter()
+                    control_unit.clock.wait(control_unit.irrigation_complete, 10)
+                    control_unit.irrigation_complete.clear()
+
+                    if round_number < warmup:
+                        continue
+                    busy += round_end - marks["published"]
+                    if not all(key in marks for key in ("decision", "actuator", "catalog")):
+                        incomplete += 1
+                        continue
+                    for name, start, end in HOPS:
+                        samples[name].append(marks[end] - marks[start])
+        finally:
+            cherrypy.engine.exit()
+            control_unit.stop()
+            connector.stop()
+            actuators.stop()
+            catalog.stop()
+            os.chdir(cwd)
+
+    readings = len(control_unit.expected_topics)
+    result = {
+        "date": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "rounds": rounds,
+        "incomplete_rounds": incomplete,
+        "rounds_per_second": round(rounds / busy, 2),
+        "readings_per_second": round(rounds * readings / busy, 1),
+        "hops": {name: percentiles(values) for name, values in samples.items() if values},
+    }
+
+    print(f"{rounds} rounds of {readings} readings, {incomplete} without a pump command, "
+          f"{result['rounds_per_second']} rounds/s, {result['readings_per_second']} readings/s")
+    for name, figures in result["hops"].items():
+        print(f"{name:<22} p50 {figures['p50_ms']:8.2f} ms   p95 {figures['p95_ms']:8.2f} ms   "
+              f"p99 {figures['p99_ms']:8.2f} ms")
+
+    if save:
+        compare_and_save(git_revision(), result)
+    return result
+
+
+def compare_and_save(revision, result):
+    """
+    Print the end-to-end figures of the revisions measured before, then store this run under its revision.
+    """
+    history = {}
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE) as file:
+            history = json.load(file)
+    current = result["hops"].get("end to end")
+    for previous_revision, previous in history.items():
+        if previous_revision == revision or "end to end" not in previous["hops"] or current is None:
+            continue
+        before = previous["hops"]["end to end"]
+        print(f"vs {previous_revision:<14} end to end p50 {before['p50_ms']:8.2f} -> {current['p50_ms']:8.2f} ms, "
+              f"p99 {before['p99_ms']:8.2f} -> {current['p99_ms']:8.2f} ms, "
+              f"{previous['rounds_per_second']} -> {result['rounds_per_second']} rounds/s")
+    history[revision] = result
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'w') as file:
+        json.dump(history, file, indent=2)
+    print(f"Results saved for revision {revision} in {RESULTS_FILE}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end latency of the sensor to actuator pipeline")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--no-save", action="store_true", help="do not store the results for comparison")
+    args = parser.parse_args()
+    run(args.broker, args.port, args.rounds, save=not args.no_save)
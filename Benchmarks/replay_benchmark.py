@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import tempfile
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(BASE, 'Replay'))
+sys.path.insert(1, os.path.join(BASE, 'Device_Connector (Arduino Nano)'))
+import SenML
+from Mqtt_replay import LogWriter, Replayer, LocalBroker, LocalClient
+from Sensor_fleet import SensorFleet
+
+
+class CountingNotifier:
+    def __init__(self):
+        self.messages = 0
+
+    def notify(self, topic, payload):
+        self.messages += 1
+
+
+def record_week(path, gardens, start_time):
+    """
+    Write one simulated week of sensor traffic to a log, each message stamped with its reading time.
+    """
+    writer = LogWriter(path)
+
+    def publish(topic, message):
+        writer.write(message["e"][0]["t"], topic, SenML.dumps(message))
+
+    fleet = SensorFleet(gardens, seed=0, start_time=start_time)
+    fleet.stream(publish, 7 * 144, base_topic="Garden/zones")
+    writer.close()
+    return writer.count
+
+
+def run(gardens=10):
+    start_time = 1725148800.0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "week.log")
+        start = time.perf_counter()
+        messages = record_week(path, gardens, start_time)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+        print(f"Recorded {messages} messages for {gardens} gardens in {elapsed:.2f} s, "
+              f"{size / 1024 / 1024:.1f} MiB, {size / messages:.1f} bytes per message")
+
+        for speed in (None, 1000):
+            broker = LocalBroker()
+            notifier = CountingNotifier()
+            client = LocalClient("counter", broker, notifier)
+            client.mySubscribe("Garden/#")
+            replayer = Replayer(path, broker.publish, speed=speed)
+            # A week at 1000x takes ten minutes, replay its first six hours
+            messages, recorded, elapsed = replayer.run(6 * 3600 if speed else None)
+            print(f"Replay at {'max speed' if speed is None else f'{speed}x':>9}: {messages} messages, "
+                  f"{recorded / 3600:6.1f} simulated hours in {elapsed:6.2f} s "
+                  f"({recorded / elapsed:8.0f}x real time), {notifier.messages} delivered")
+
+
+if __name__ == '__main__':
+    run()
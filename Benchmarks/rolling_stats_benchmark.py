@@ -0,0 +1,37 @@
+import os
+import sys
+import time
+import random
+import statistics
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from RollingStats import RollingWindow
+
+
+def run(window_sizes=(10, 100, 1000, 10000), readings=20000):
+    random.seed(0)
+    values = [random.uniform(0, 100) for _ in range(readings)]
+    for size in window_sizes:
+        # One reading per second, so the window holds the last size readings
+        window = RollingWindow(window=size, capacity=size + 1)
+        start = time.perf_counter()
+        for timestamp, value in enumerate(values):
+            window.add(value, timestamp)
+            window.mean(), window.variance(), window.min(), window.max()
+        rolling_us = (time.perf_counter() - start) / readings * 1e6
+
+        # Baseline: keep the readings in a list and recompute on every update
+        recent = deque(values[:size], maxlen=size)
+        sample = values[:max(readings * 10 // size, 200)]
+        start = time.perf_counter()
+        for value in sample:
+            recent.append(value)
+            statistics.fmean(recent), statistics.pvariance(recent), min(recent), max(recent)
+        recompute_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+        print(f"window {size:>6}: RollingWindow {rolling_us:6.2f} us/reading, recompute {recompute_us:9.2f} us/reading")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from Clock import VirtualClock
+from Scheduler import Scheduler
+
+
+def new_scheduler(state_file, compact_every, pending=0):
+    scheduler = Scheduler(state_file, VirtualClock(0), compact_every=compact_every)
+    scheduler.register("stop_irrigation", lambda zone_id: None)
+    # Jobs scheduled before start() reach the state file in one snapshot
+    for i in range(pending):
+        scheduler.schedule(3600 + i, "stop_irrigation", f"zone{i}", key=f"stop/{i}")
+    scheduler.start()
+    return scheduler
+
+
+def measure(directory, pending, changes, compact_every):
+    """
+    Time schedule/cancel pairs of persistent jobs on top of pending saved jobs, then a restart.
+    """
+    state_file = os.path.join(directory, f"schedule_{pending}_{compact_every}.json")
+    scheduler = new_scheduler(state_file, compact_every, pending)
+
+    start = time.perf_counter()
+    for i in range(changes // 2):
+        job = scheduler.schedule(60, "stop_irrigation", "bench")
+        scheduler.cancel(job)
+    change_ms = (time.perf_counter() - start) / changes * 1000
+
+    start = time.perf_counter()
+    restarted = new_scheduler(state_file, compact_every)
+    restart_ms = (time.perf_counter() - start) * 1000
+    assert len(restarted.persistent_jobs) == pending
+    restarted.stop()
+    return change_ms, restart_ms
+
+
+def run(pending_counts=(10, 1000, 10000), changes=200):
+    with tempfile.TemporaryDirectory() as directory:
+        for pending in pending_counts:
+            # compact_every=1 rewrites the whole state file on every change, as saving used to
+            rewrite_ms, _ = measure(directory, pending, changes, compact_every=1)
+            journal_ms, restart_ms = measure(directory, pending, changes, compact_every=1000)
+            print(f"{pending:>6} pending jobs: journal {journal_ms:7.3f} ms/change, full rewrite {rewrite_ms:8.3f} "
+                  f"ms/change ({rewrite_ms / journal_ms:5.1f}x), restart {restart_ms:7.1f} ms")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+import SenML
+
+
+def single_message(i):
+    """
+    A message as published by DeviceConnector.create_message.
+    """
+    return SenML.create_message(f"Garden/sensors/Garden_Sensors/{i % 9}", f"sensor_{i % 9}",
+                                round(random.uniform(20, 80), 1), '%', '2024-09-01 12:00:00')
+
+
+def multi_record_pack(records):
+    """
+    A pack of readings with numeric times, compressed with a base name and a base time.
+    """
+    start = 1725192000.0
+    resolved = [{"n": f"Garden/sensors/soil_moisture/{i % 9}", "v": round(random.uniform(20, 80), 1),
+                 "u": '%', "t": start + i * 10} for i in range(records)]
+    return SenML.encode(resolved, base_name="Garden/sensors/", base_time=True)
+
+
+def time_loop(function, items, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            function(item)
+    return len(items) * repeat / (time.perf_counter() - start)
+
+
+def report(label, packs, repeat):
+    json_payloads = [SenML.dumps(pack).encode('utf-8') for pack in packs]
+    cbor_payloads = [SenML.dumps(pack, binary=True) for pack in packs]
+    json_size = sum(len(payload) for payload in json_payloads) / len(packs)
+    cbor_size = sum(len(payload) for payload in cbor_payloads) / len(packs)
+
+    json_encode = time_loop(SenML.dumps, packs, repeat)
+    cbor_encode = time_loop(lambda pack: SenML.dumps(pack, binary=True), packs, repeat)
+    json_decode = time_loop(SenML.decode, json_payloads, repeat)
+    cbor_decode = time_loop(SenML.decode, cbor_payloads, repeat)
+    # What the consumers did before the codec: json.loads and pick the first record
+    manual_decode = time_loop(lambda payload: json.loads(payload)["e"][0]["v"], json_payloads, repeat)
+
+    print(label)
+    print(f"  JSON: {json_size:7.1f} bytes, encode {json_encode:9.0f} packs/s, decode {json_decode:9.0f} packs/s")
+    print(f"  CBOR: {cbor_size:7.1f} bytes, encode {cbor_encode:9.0f} packs/s, decode {cbor_decode:9.0f} packs/s "
+          f"({100 * (1 - cbor_size / json_size):.0f}% smaller)")
+    print(f"  json.loads + e[0]: decode {manual_decode:9.0f} packs/s")
+
+
+def run(messages=2000, repeat=5):
+    random.seed(0)
+    report("Single-record messages", [single_message(i) for i in range(messages)], repeat)
+    for records in (10, 100):
+        report(f"{records}-record packs with base name and base time",
+               [multi_record_pack(records) for _ in range(messages // records)], repeat)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Device_Connector (Arduino Nano)'))
+import SenML
+from Sensor_fleet import SensorFleet
+from Sensors import SoilMoistureSen, DHT22Sen, LightSen, RainSen, WaterFlowSen
+
+
+def legacy_round(sensors):
+    for sensor in sensors:
+        sensor.read()
+
+
+def run(garden_counts=(100, 1000, 7143), steps=144):
+    for gardens in garden_counts:
+        sensors = gardens * 14
+        fleet = SensorFleet(gardens, seed=0, start_time=1725148800.0)
+        start = time.perf_counter()
+        fleet.generate(steps)
+        elapsed = time.perf_counter() - start
+        print(f"{sensors:>7} sensors: one simulated day in {elapsed:6.2f} s, "
+              f"{sensors * steps / elapsed:10.0f} readings/s generated")
+
+    # One round of 100k sensors with the per-device classes, for comparison
+    legacy = []
+    for garden in range(garden_counts[-1]):
+        legacy += [SoilMoistureSen(i, "t") for i in range(9)]
+        legacy += [DHT22Sen(0, "t"), LightSen(0, "t"), RainSen(0, "t"), WaterFlowSen(0, "t")]
+    start = time.perf_counter()
+    legacy_round(legacy)
+    elapsed = time.perf_counter() - start
+    print(f"Per-device classes: {len(legacy)} read() calls in {elapsed:.2f} s, {len(legacy) / elapsed:.0f} reads/s")
+
+    # Encoding the readings as SenML for MQTT dominates once they are generated
+    fleet = SensorFleet(garden_counts[-1], seed=0)
+    for batch in (False, True):
+        payload_bytes = [0]
+
+        def publish(topic, message):
+            payload_bytes[0] += len(SenML.dumps(message))
+
+        start = time.perf_counter()
+        sent = fleet.stream(publish, 1, batch=batch)
+        elapsed = time.perf_counter() - start
+        print(f"Stream {'batched' if batch else 'single '}: {sent / elapsed:8.0f} readings/s encoded, "
+              f"{payload_bytes[0] / sent:5.1f} bytes per reading")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Time_series'))
+from Time_series_store import TimeSeriesStore
+
+
+def run(days=90, interval=60, queries=200):
+    """
+    One reading per minute for 90 days, then summaries over ranges of increasing length,
+    from the rollups and by scanning the raw readings.
+    """
+    rng = np.random.default_rng(0)
+    start_time = 1704067200.0
+    timestamps = start_time + np.arange(days * 86400 // interval) * interval
+    values = (40 + 10 * np.sin(timestamps / 86400 * 2 * np.pi) + rng.normal(0, 2, len(timestamps))).tolist()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = TimeSeriesStore(directory)
+        start = time.perf_counter()
+        for timestamp, value in zip(timestamps.tolist(), values):
+            store.append("soil_moisture/1", timestamp, value)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        print(f"Appended {len(timestamps)} readings: {len(timestamps) / elapsed:.0f} readings/s")
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+        print(f"On disk: {size / 1024 / 1024:.1f} MiB including preallocated segment space")
+
+        for range_days in (1, 7, 30, 90):
+            starts = rng.uniform(start_time, start_time + (days - range_days) * 86400 + 1, queries)
+
+            begin = time.perf_counter()
+            for query_start in starts:
+                store.summary("soil_moisture/1", query_start, query_start + range_days * 86400)
+            rollup_ms = (time.perf_counter() - begin) / queries * 1000
+
+            begin = time.perf_counter()
+            for query_start in starts:
+                _, raw = store.range("soil_moisture/1", query_start, query_start + range_days * 86400)
+                raw.mean(), raw.min(), raw.max()
+            raw_ms = (time.perf_counter() - begin) / queries * 1000
+
+            print(f"{range_days:>3} day summary: rollups {rollup_ms:6.3f} ms, raw scan {raw_ms:6.3f} ms")
+
+
+if __name__ == '__main__':
+    run()
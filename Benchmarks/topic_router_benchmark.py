@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from TopicRouter import TopicRouter
+
+
+def linear_match(filters, topic):
+    """
+    Reference matcher: test every registered filter against the topic, level by level.
+    """
+    levels = topic.split("/")
+    matches = []
+    for topic_filter, filter_levels in filters:
+        for position, level in enumerate(filter_levels):
+            if level == "#":
+                matches.append(topic_filter)
+                break
+            if position >= len(levels) or (level != "+" and level != levels[position]):
+                break
+        else:
+            if len(filter_levels) == len(levels):
+                matches.append(topic_filter)
+    return matches
+
+
+def build_filters(count):
+    """
+    Filters shaped like a fleet of gardens: exact sensor topics plus some + and # subscriptions.
+    """
+    filters = []
+    for i in range(count):
+        garden = f"garden{i // 20}"
+        kind = i % 20
+        if kind == 18:
+            filters.append(f"Garden/{garden}/sensors/+/{i}")
+        elif kind == 19:
+            filters.append(f"Garden/{garden}/#")
+        else:
+            filters.append(f"Garden/{garden}/sensors/soil_moisture/{kind}")
+    return filters
+
+
+def run(pattern_counts=(10, 100, 1000, 10000), messages=20000):
+    random.seed(0)
+    for count in pattern_counts:
+        filters = build_filters(count)
+        router = TopicRouter()
+        for topic_filter in filters:
+            router.add(topic_filter, topic_filter)
+        split_filters = [(topic_filter, topic_filter.split("/")) for topic_filter in filters]
+
+        gardens = max(count // 20, 1)
+        topics = [f"Garden/garden{random.randrange(gardens)}/sensors/soil_moisture/{random.randrange(18)}"
+                  for _ in range(messages)]
+
+        start = time.perf_counter()
+        for topic in topics:
+            router.match(topic)
+        trie_us = (time.perf_counter() - start) / messages * 1e6
+
+        linear_messages = topics[:max(messages * 10 // count, 100)]
+        start = time.perf_counter()
+        for topic in linear_messages:
+            linear_match(split_filters, topic)
+        linear_us = (time.perf_counter() - start) / len(linear_messages) * 1e6
+
+        print(f"{count:>6} patterns: trie {trie_us:7.2f} us/msg, linear scan {linear_us:9.2f} us/msg")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+import SenML
+from Scheduler import Scheduler
+from Zone_control_unit import ZoneControlUnit, OTHER_SENSORS
+
+
+class CountingClient:
+    """
+    Stands in for MyMQTT: counts the published commands instead of sending them.
+    """
+
+    def __init__(self):
+        self.published = 0
+
+    def mySubscribe(self, topic):
+        pass
+
+    def myPublish(self, topic, msg):
+        self.published += 1
+
+    def stop(self):
+        pass
+
+
+def round_messages(zone_ids, soil_sensors, lost_ratio=0.0):
+    """
+    One reading per sensor of every zone, pre-encoded, in a shuffled arrival order.
+    A fraction lost_ratio of the zones loses one reading.
+    """
+    messages = []
+    for zone_id in zone_ids:
+        topics = [f"soil_moisture/{i}" for i in range(1, soil_sensors + 1)] + OTHER_SENSORS
+        if random.random() < lost_ratio:
+            topics.pop(random.randrange(len(topics)))
+        for topic in topics:
+            value = {"temperature": 15.0, "humidity": 60.0, "light": 50.0, "rain": 0,
+                     "water_flow": 0.0}.get(topic, random.uniform(10, 60))
+            payload = SenML.dumps(SenML.create_message(topic, "sensor", value, "", "2024-09-01 05:00:00"))
+            messages.append((f"Garden/zones/{zone_id}/sensors/{topic}", payload.encode('utf-8')))
+    random.shuffle(messages)
+    return messages
+
+
+def run(zone_count=1000, soil_sensors=9, rounds=5, lost_ratio=0.1):
+    random.seed(0)
+    zone_ids = [f"zone{i}" for i in range(zone_count)]
+    client = CountingClient()
+    scheduler = Scheduler()
+
+    tracemalloc.start()
+    engine = ZoneControlUnit(None, None, [{"zoneID": zone_id, "soilSensors": soil_sensors} for zone_id in zone_ids],
+                             client=client, scheduler=scheduler)
+    zone_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{zone_count} zones, {soil_sensors + len(OTHER_SENSORS)} sensors each, one MQTT connection")
+    print(f"Zone state: {zone_memory / zone_count:.0f} bytes per zone")
+
+    for lost in (0.0, lost_ratio):
+        total_messages = 0
+        total_time = 0.0
+        deadline_time = 0.0
+        evaluations = engine.evaluations
+        for _ in range(rounds):
+            messages = round_messages(zone_ids, soil_sensors, lost)
+            start = time.perf_counter()
+            for topic, payload in messages:
+                engine.notify(topic, payload)
+            total_time += time.perf_counter() - start
+            total_messages += len(messages)
+
+            # Zones with a lost reading are evaluated when their round deadline fires
+            start = time.perf_counter()
+            scheduler.run_pending(time.time() + engine.round_timeout + 1)
+            deadline_time += time.perf_counter() - start
+
+        print(f"Lost readings in {lost:.0%} of zones: {total_messages / total_time:9.0f} readings/s, "
+              f"{total_time / rounds * 1000:7.1f} ms per fleet round, "
+              f"{engine.evaluations - evaluations} evaluations, deadline pass {deadline_time / rounds * 1000:.1f} ms")
+    print(f"Commands published: {client.published}, partial evaluations: {engine.partial_evaluations}")
+
+
+if __name__ == '__main__':
+    run()
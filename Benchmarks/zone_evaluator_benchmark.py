@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from Control_unit import irrigation_decision
+from Zone_evaluator import ZoneEvaluator, reasons_from_flags, REASONS, MISSING_DATA
+
+
+def random_fleet(zone_count, soil_sensors, rng):
+    """
+    Random zone state around the decision thresholds, with some missing readings.
+    """
+    evaluator = ZoneEvaluator(zone_count, soil_sensors)
+    evaluator.moisture[:] = rng.uniform(10, 50, (zone_count, soil_sensors))
+    evaluator.moisture[rng.random((zone_count, soil_sensors)) < 0.05] = np.nan
+    evaluator.temperature[:] = rng.choice([-5, 3, 4, 10, 20, 30, 35], zone_count) + rng.choice([0, 0.5], zone_count)
+    evaluator.rain_level[:] = rng.integers(0, 8, zone_count)
+    evaluator.light_level[:] = rng.uniform(0, 500, zone_count)
+    evaluator.sunrise_counter[:] = rng.choice([0, 15.5, 59.9, 60], zone_count)
+    evaluator.has_irrigated_today[:] = rng.random(zone_count) < 0.2
+    for column in (evaluator.temperature, evaluator.rain_level, evaluator.light_level):
+        column[rng.random(zone_count) < 0.01] = np.nan
+    return evaluator
+
+
+def scalar_evaluate(evaluator):
+    """
+    Reference: the missing-data check of check_conditions_and_act and irrigation_decision, zone by zone.
+    """
+    decisions = []
+    for position in range(len(evaluator.temperature)):
+        soil_values = [value for value in evaluator.moisture[position].tolist() if value == value]
+        temperature = evaluator.temperature[position].item()
+        rain_level = evaluator.rain_level[position].item()
+        light_level = evaluator.light_level[position].item()
+        if not soil_values or temperature != temperature or rain_level != rain_level or light_level != light_level:
+            decisions.append((False, reasons_from_flags(MISSING_DATA)))
+            continue
+        decisions.append(irrigation_decision(
+            bool(evaluator.has_irrigated_today[position]), evaluator.sunrise_counter[position].item(),
+            sum(soil_values) / len(soil_values), temperature, rain_level, evaluator.moisture_threshold,
+            evaluator.temperature_threshold, evaluator.rain_detected_level, evaluator.do_not_water_temp,
+            evaluator.sunrise_buffer))
+    return decisions
+
+
+def run(zone_counts=(1000, 10000, 100000), soil_sensors=9):
+    rng = np.random.default_rng(0)
+    for zone_count in zone_counts:
+        evaluator = random_fleet(zone_count, soil_sensors, rng)
+
+        start = time.perf_counter()
+        decisions = scalar_evaluate(evaluator)
+        scalar_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        irrigate, flags = evaluator.evaluate()
+        vector_time = time.perf_counter() - start
+
+        mismatches = sum(1 for position, (should_irrigate, reasons) in enumerate(decisions)
+                         if should_irrigate != irrigate[position] or reasons != reasons_from_flags(flags[position]))
+        print(f"{zone_count:>7} zones: scalar {scalar_time * 1000:8.1f} ms, vectorized {vector_time * 1000:6.2f} ms "
+              f"({scalar_time / vector_time:5.0f}x), {int(irrigate.sum())} to irrigate, {mismatches} mismatches")
+        assert mismatches == 0, f"ZoneEvaluator disagrees with irrigation_decision on {mismatches} zones"
+    print("Reason counts in the last fleet:",
+          {text: int((flags & flag != 0).sum()) for flag, text in REASONS})
+
+
+if __name__ == '__main__':
+    run()
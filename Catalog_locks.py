@@ -0,0 +1,85 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Lock that lets any number of readers in at the same time, or a single writer.
+
+    Waiting writers block new readers, so a steady stream of GETs cannot starve a PUT.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+
+class SectionLocks:
+    """
+    One ReadWriteLock per catalog section, created on first use.
+    """
+
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, section):
+        lock = self.locks.get(section)
+        if lock is None:
+            with self.lock:
+                lock = self.locks.setdefault(section, ReadWriteLock())
+        return lock
+
+    def read(self, section):
+        return self.get(section).read()
+
+    def write(self, section):
+        return self.get(section).write()
+
+    @contextmanager
+    def read_all(self, sections):
+        """
+        Read-lock several sections, always in the same order so two callers cannot deadlock.
+        """
+        locks = [self.get(section) for section in sorted(sections)]
+        acquired = []
+        try:
+            for lock in locks:
+                context = lock.read()
+                context.__enter__()
+                acquired.append(context)
+            yield
+        finally:
+            for context in reversed(acquired):
+                context.__exit__(None, None, None)
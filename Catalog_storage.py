@@ -0,0 +1,382 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+def atomic_write_json(file_path, data, indent=None):
+    """
+    Atomically replace a JSON file: write a temporary file, fsync it and rename it over the old one.
+    """
+    temp_file = f"{file_path}.tmp"
+    with open(temp_file, 'w') as file:
+        json.dump(data, file, indent=indent)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file, file_path)
+
+
+def apply_entry(data, entry, positions=None):
+    """
+    Apply one mutation entry to the catalog data.
+
+    Entries are absolute (add replaces, delete ignores missing items, commands are not appended twice)
+    so replaying a journal over a snapshot that already contains some of its entries is safe.
+    positions is an optional {section: {item_id: position}} cache used to speed up replay.
+    """
+    operation = entry["op"]
+    section = entry["section"]
+    items = data.setdefault(section, [])
+    id_key = f"{section[:-1]}ID"
+
+    if operation == "command":
+        if entry["item"] not in items:
+            items.append(entry["item"])
+            if len(items) > 20:
+                del items[:-20]
+        return
+
+    if positions is None:
+        positions = {}
+    section_index = positions.get(section)
+    if section_index is None:
+        section_index = {}
+        for position, item in enumerate(items):
+            section_index.setdefault(item.get(id_key), position)
+        positions[section] = section_index
+
+    if operation == "add":
+        item = entry["item"]
+        position = section_index.get(item[id_key])
+        if position is None:
+            items.append(item)
+            section_index[item[id_key]] = len(items) - 1
+        else:
+            items[position] = item
+    elif operation == "update":
+        position = section_index.get(entry["id"])
+        if position is not None:
+            items[position].update(entry["changes"])
+            if items[position].get(id_key) != entry["id"]:
+                del positions[section]
+    elif operation == "delete":
+        position = section_index.get(entry["id"])
+        if position is not None:
+            del items[position]
+            del positions[section]
+    else:
+        raise ValueError(f"Unknown catalog operation {operation}")
+
+
+def filter_commands(commands, device=None, since=None, limit=100, cursor=None):
+    """
+    Page through an in-memory command list. The cursor is the position to continue from.
+    """
+    start = int(cursor) if cursor else 0
+    matches = []
+    next_cursor = None
+    for position in range(start, len(commands)):
+        command = commands[position]
+        if device is not None and command.get("targetDeviceID") != device:
+            continue
+        if since is not None and command.get("timestamp", "") < since:
+            continue
+        if len(matches) == limit:
+            next_cursor = str(position)
+            break
+        matches.append(command)
+    return matches, next_cursor
+
+
+class JsonFileStorage:
+    """
+    Keeps the whole catalog in one JSON file that is rewritten on every flush.
+    """
+
+    def __init__(self, json_file):
+        self.json_file = json_file
+
+    def load(self):
+        with open(self.json_file, 'r') as file:
+            return json.load(file)
+
+    def append(self, entry):
+        pass
+
+    def flush(self, data):
+        atomic_write_json(self.json_file, data, indent=4)
+
+    def close(self, data):
+        self.flush(data)
+
+    def query_commands(self, data, device=None, since=None, limit=100, cursor=None):
+        return filter_commands(data.get("commands", []), device, since, limit, cursor)
+
+
+class JournalStorage:
+    """
+    Appends every mutation as one JSON line to a journal and periodically compacts it into a snapshot.
+
+    The snapshot is the plain catalog file, so it stays readable by everything that reads catalog.json.
+    Startup loads the snapshot and replays the journal on top of it; a torn last line left by a crash
+    during an append is discarded.
+    """
+
+    def __init__(self, json_file, journal_file=None, compact_every=1000):
+        self.json_file = json_file
+        self.journal_file = journal_file or f"{json_file}.journal"
+        self.compact_every = compact_every
+        self.pending = []
+        self.journal_length = 0
+        self.lock = threading.Lock()
+        self.journal = None
+
+    def load(self):
+        with open(self.json_file, 'r') as file:
+            data = json.load(file)
+
+        entries = []
+        valid_size = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as file:
+                for line in file:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("Incomplete journal line")
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # Torn write: everything from here on was never acknowledged
+                        break
+                    valid_size += len(line)
+
+        positions = {}
+        for entry in entries:
+            apply_entry(data, entry, positions)
+
+        self.journal = open(self.journal_file, 'ab')
+        self.journal.truncate(valid_size)
+        self.journal_length = len(entries)
+        return data
+
+    def append(self, entry):
+        line = json.dumps(entry, separators=(',', ':')).encode('utf-8') + b"\n"
+        with self.lock:
+            self.pending.append(line)
+
+    def flush(self, data):
+        with self.lock:
+            lines, self.pending = self.pending, []
+        if lines:
+            valid_size = self.journal.tell()
+            try:
+                self.journal.write(b"".join(lines))
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+            except Exception:
+                # Cut off a partly written batch and keep it pending, so the next flush retries it
+                try:
+                    self.journal.truncate(valid_size)
+                except OSError:
+                    pass
+                with self.lock:
+                    self.pending[:0] = lines
+                raise
+            self.journal_length += len(lines)
+        if self.journal_length >= self.compact_every:
+            self.compact(data)
+
+    def compact(self, data):
+        """
+        Write a snapshot of the current state and start a new, empty journal.
+        """
+        atomic_write_json(self.json_file, data, indent=4)
+        self.journal.truncate(0)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_length = 0
+
+    def close(self, data):
+        self.flush(data)
+        self.compact(data)
+        self.journal.close()
+
+    def query_commands(self, data, device=None, since=None, limit=100, cursor=None):
+        return filter_commands(data.get("commands", []), device, since, limit, cursor)
+
+
+class SQLiteStorage:
+    """
+    Keeps the catalog in an SQLite database in WAL mode.
+
+    Sensors and actuators get one row per device, and every command is kept in an indexed commands
+    table, so the history can be queried by device and time range without loading it into memory.
+    The in-memory catalog still only holds the last 20 commands, as the REST API always did.
+    The other sections are stored as JSON documents in the meta table. An empty database is seeded
+    from json_file.
+    """
+
+    DEVICE_SECTIONS = {"sensors": "sensorID", "actuators": "actuatorID"}
+
+    def __init__(self, db_file, json_file=None):
+        self.db_file = db_file
+        self.json_file = json_file
+        self.pending = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.connections = []
+
+    def connection(self):
+        """
+        Return the connection of the calling thread. WAL mode lets readers run alongside the writer.
+        """
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def create_tables(self, connection):
+        with connection:
+            for section in self.DEVICE_SECTIONS:
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {section} "
+                                   "(id TEXT PRIMARY KEY, position INTEGER NOT NULL, body TEXT NOT NULL)")
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {section}_position ON {section} (position)")
+            connection.execute("CREATE TABLE IF NOT EXISTS commands "
+                               "(id INTEGER PRIMARY KEY AUTOINCREMENT, command_id TEXT, device TEXT, "
+                               "timestamp TEXT, body TEXT NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS commands_device_time ON commands (device, timestamp)")
+            connection.execute("CREATE INDEX IF NOT EXISTS commands_time ON commands (timestamp)")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (section TEXT PRIMARY KEY, body TEXT NOT NULL)")
+
+    def seed(self, connection, data):
+        """
+        Import a catalog dictionary into the empty database.
+        """
+        with connection:
+            for section, items in data.items():
+                if section in self.DEVICE_SECTIONS:
+                    id_key = self.DEVICE_SECTIONS[section]
+                    connection.executemany(f"INSERT OR REPLACE INTO {section} (id, position, body) VALUES (?, ?, ?)",
+                                           [(item[id_key], position, json.dumps(item))
+                                            for position, item in enumerate(items)])
+                elif section == "commands":
+                    for command in items:
+                        self.insert_command(connection, command)
+                else:
+                    connection.execute("INSERT OR REPLACE INTO meta (section, body) VALUES (?, ?)",
+                                       (section, json.dumps(items)))
+
+    def load(self):
+        connection = self.connection()
+        self.create_tables(connection)
+        empty = all(connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+                    for table in ("meta", "commands", *self.DEVICE_SECTIONS))
+        if empty and self.json_file is not None and os.path.exists(self.json_file):
+            with open(self.json_file, 'r') as file:
+                self.seed(connection, json.load(file))
+
+        data = {}
+        for section, body in connection.execute("SELECT section, body FROM meta"):
+            data[section] = json.loads(body)
+        for section in self.DEVICE_SECTIONS:
+            data[section] = [json.loads(body) for (body,) in
+                             connection.execute(f"SELECT body FROM {section} ORDER BY position")]
+        recent = connection.execute("SELECT body FROM commands ORDER BY id DESC LIMIT 20").fetchall()
+        data["commands"] = [json.loads(body) for (body,) in reversed(recent)]
+        return data
+
+    def insert_command(self, connection, command):
+        connection.execute("INSERT INTO commands (command_id, device, timestamp, body) VALUES (?, ?, ?, ?)",
+                           (command.get("commandID"), command.get("targetDeviceID"), command.get("timestamp"),
+                            json.dumps(command)))
+
+    def apply(self, connection, entry):
+        operation = entry["op"]
+        section = entry["section"]
+
+        if operation == "command":
+            self.insert_command(connection, entry["item"])
+        elif section == "commands":
+            if operation == "update":
+                row = connection.execute("SELECT id, body FROM commands WHERE command_id = ? ORDER BY id DESC LIMIT 1",
+                                         (entry["id"],)).fetchone()
+                if row is not None:
+                    command = json.loads(row[1])
+                    command.update(entry["changes"])
+                    connection.execute("UPDATE commands SET command_id = ?, device = ?, timestamp = ?, body = ? "
+                                       "WHERE id = ?", (command.get("commandID"), command.get("targetDeviceID"),
+                                                        command.get("timestamp"), json.dumps(command), row[0]))
+        elif section in self.DEVICE_SECTIONS:
+            id_key = self.DEVICE_SECTIONS[section]
+            if operation == "add":
+                item = entry["item"]
+                connection.execute(f"INSERT OR REPLACE INTO {section} (id, position, body) VALUES "
+                                   f"(?, (SELECT COALESCE(MAX(position), -1) + 1 FROM {section}), ?)",
+                                   (item[id_key], json.dumps(item)))
+            elif operation == "update":
+                row = connection.execute(f"SELECT body FROM {section} WHERE id = ?", (entry["id"],)).fetchone()
+                if row is not None:
+                    item = json.loads(row[0])
+                    item.update(entry["changes"])
+                    connection.execute(f"UPDATE {section} SET id = ?, body = ? WHERE id = ?",
+                                       (item[id_key], json.dumps(item), entry["id"]))
+            elif operation == "delete":
+                connection.execute(f"DELETE FROM {section} WHERE id = ?", (entry["id"],))
+        else:
+            raise ValueError(f"Unsupported catalog operation {operation} on {section}")
+
+    def append(self, entry):
+        # Serialize now, the catalog keeps mutating the dictionaries the entry refers to
+        entry = json.loads(json.dumps(entry))
+        with self.lock:
+            self.pending.append(entry)
+
+    def flush(self, data):
+        with self.lock:
+            entries, self.pending = self.pending, []
+        if entries:
+            connection = self.connection()
+            try:
+                with connection:
+                    for entry in entries:
+                        try:
+                            self.apply(connection, entry)
+                        except (sqlite3.IntegrityError, ValueError) as e:
+                            # Fails the same way on every retry (e.g. a rename onto an existing ID), so drop
+                            # it; only the failed statement was rolled back, the rest of the batch goes on
+                            print(f"Dropping catalog entry that cannot be stored: {entry}: {e}")
+            except Exception:
+                # The transaction was rolled back, keep the entries pending so the next flush retries them
+                with self.lock:
+                    self.pending[:0] = entries
+                raise
+
+    def close(self, data):
+        self.flush(data)
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+
+    def query_commands(self, data, device=None, since=None, limit=100, cursor=None):
+        """
+        Page through the command history in insertion order. The cursor is the last row ID returned.
+        """
+        conditions = ["id > ?"]
+        arguments = [int(cursor) if cursor else 0]
+        if device is not None:
+            conditions.append("device = ?")
+            arguments.append(device)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            arguments.append(since)
+        arguments.append(limit + 1)
+        rows = self.connection().execute(f"SELECT id, body FROM commands WHERE {' AND '.join(conditions)} "
+                                         "ORDER BY id LIMIT ?", arguments).fetchall()
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return [json.loads(body) for _, body in rows[:limit]], next_cursor
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+
+class WatchServer:
+    """
+    Serves the long poll of HomeCatalog.watch, GET /garden/watch/<section>/<id>?since=&status=&timeout=,
+    from one asyncio thread on its own port.
+
+    A waiting client costs a socket and a future instead of a CherryPy worker thread, so thousands can wait
+    at once; max_watchers only guards against running out of file descriptors. The catalog calls changed()
+    after every mutation, which wakes the waiters of that item on the event loop.
+    """
+
+    def __init__(self, catalog, host='127.0.0.1', port=8081, max_watchers=10000):
+        self.catalog = catalog
+        self.host = host
+        self.port = port
+        self.max_watchers = max_watchers
+        # (section, item_id) -> set of futures of the clients waiting on it
+        self.waiters = {}
+        self.watchers = 0
+        self.tasks = set()
+        self.stopping = False
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+        # With port 0 the system picked one
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.catalog.change_listeners.append(self.changed)
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+    def stop(self):
+        """
+        Answer the waiting clients and stop the server. Subscribed to the cherrypy engine stop.
+        """
+        if self.thread is None:
+            return
+        self.catalog.change_listeners.remove(self.changed)
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+
+    def changed(self, key):
+        # Runs on the thread of the mutating request, under the catalog revision lock
+        if key in self.waiters:
+            self.loop.call_soon_threadsafe(self.wake, key)
+
+    def wake(self, key):
+        for future in self.waiters.get(key, ()):
+            if not future.done():
+                future.set_result(None)
+
+    async def shutdown(self):
+        self.stopping = True
+        self.server.close()
+        for key in list(self.waiters):
+            self.wake(key)
+        if self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), 10)
+                while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                    pass
+            except asyncio.TimeoutError:
+                return
+            status, body = await self.respond(request_line.decode('latin-1').split())
+            reason = REASONS.get(status, "")
+            writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self.tasks.discard(task)
+
+    async def respond(self, request):
+        if len(request) != 3:
+            return 400, b'{"error": "Bad request"}'
+        method, target, _ = request
+        if method != "GET":
+            return 405, b'{"error": "Only GET is supported"}'
+        url = urlsplit(target)
+        path = [unquote(level) for level in url.path.strip("/").split("/")]
+        if len(path) != 4 or path[:2] != ["garden", "watch"] or path[2] not in self.catalog.index:
+            return 404, b'{"error": "Not found"}'
+        section, item_id = path[2], path[3]
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            timeout = min(max(float(params.get("timeout", 30)), 0), 60)
+            since = int(params["since"]) if "since" in params else None
+        except ValueError:
+            return 400, b'{"error": "since and timeout must be numbers"}'
+        status = params.get("status")
+
+        if self.watchers >= self.max_watchers:
+            return 503, b'{"error": "Too many watchers"}'
+        key, since, current_status = self.catalog.watch_start(section, item_id, since)
+        future = self.loop.create_future()
+        waiters = self.waiters.setdefault(key, set())
+        waiters.add(future)
+        self.watchers += 1
+        try:
+            timed_out = False
+            deadline = self.loop.time() + timeout
+            while True:
+                with self.catalog.revision_lock:
+                    if self.stopping or self.catalog.watch_done(key, since, status, current_status):
+                        break
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                try:
+                    await asyncio.wait_for(future, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                if future.done():
+                    # Woken by a change that did not satisfy this watch, wait for the next one
+                    waiters.discard(future)
+                    future = self.loop.create_future()
+                    waiters.add(future)
+        finally:
+            waiters.discard(future)
+            if not waiters and self.waiters.get(key) is waiters:
+                del self.waiters[key]
+            self.watchers -= 1
+        return 200, self.catalog.watch_result(section, item_id, timed_out)
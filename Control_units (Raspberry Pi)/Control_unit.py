@@ -1,21 +1,85 @@
 import json
-import time
 import threading
-from datetime import datetime
 from MyMQTT import MyMQTT
-import cherrypy
+import SenML
+from TopicRouter import TopicRouter
+from Scheduler import Scheduler
+from RollingStats import RollingStats
+from Clock import RealClock
+import Metrics
 import requests
 
+# Topics read in a round when the catalog cannot be reached: 9 soil moisture + temperature + humidity + light + rain + water flow
+DEFAULT_SENSOR_TOPICS = [f"soil_moisture/{i}" for i in range(1, 10)] + ["temperature", "humidity", "light", "rain",
+                                                                       "water_flow"]
+
+NOTIFY_SECONDS = Metrics.histogram("control_unit_notify_seconds", "ControlUnit.notify duration")
+ROUNDS = Metrics.counter("control_unit_rounds_total", "Sampling rounds, by whether every expected reading arrived",
+                         ["result"])
+DECISION_SECONDS = Metrics.histogram("control_unit_decision_seconds",
+                                     "check_conditions_and_act duration, pump commands included")
+IRRIGATIONS = Metrics.counter("control_unit_irrigations_total", "Irrigations started")
+
+# Catalog sensor type -> topics (relative to the sensors prefix) its device connector publishes on
+SENSOR_TYPE_TOPICS = {
+    "Temperature and Humidity Sensor": ["temperature", "humidity"],
+    "Light Sensor": ["light"],
+    "Rain Sensor": ["rain"],
+    "Water Flow Sensor": ["water_flow"],
+}
+
+
+def irrigation_decision(has_irrigated_today, sunrise_counter, average_moisture, temperature, rain_level,
+                        moisture_threshold=30, temperature_threshold=(4, 30), rain_detected_level=4,
+                        do_not_water_temp=4, sunrise_buffer=60):
+    """
+    Decide whether a garden should be irrigated now.
+    Returns (should_irrigate, reasons), reasons listing why it should not.
+    """
+    should_irrigate = (
+            not has_irrigated_today and
+            0 < sunrise_counter < sunrise_buffer and  # Only irrigate in "Pre-sunrise" state
+            average_moisture < moisture_threshold and
+            temperature_threshold[0] <= temperature <= temperature_threshold[1] and
+            rain_level < rain_detected_level and
+            temperature > do_not_water_temp
+    )
+
+    reasons = []
+    if not should_irrigate:
+        if has_irrigated_today:
+            reasons.append("Irrigated today")
+        if not (0 < sunrise_counter < sunrise_buffer):
+            reasons.append("Not within the irrigation window before sunrise")
+        if average_moisture >= moisture_threshold:
+            reasons.append("Soil moisture is sufficient")
+        if temperature < temperature_threshold[0]:
+            reasons.append("Temperature is too low")
+        elif temperature > temperature_threshold[1]:
+            reasons.append("Temperature is too high")
+        if rain_level >= rain_detected_level:
+            reasons.append("Rain is detected")
+        if temperature <= do_not_water_temp:
+            reasons.append("Temperature is too low, not suitable for irrigation")
+    return should_irrigate, reasons
+
+
 class ControlUnit:
-    def __init__(self, broker, port, base_url):
+    """
+    Central irrigation logic of one garden. All times, sleeps and waits go through clock, a RealClock by
+    default; with a VirtualClock (and a client on a local broker) whole days of rounds run at CPU speed.
+    """
+
+    def __init__(self, broker, port, base_url, round_timeout=660, clock=None, client=None):
         self.clientID = "CentralControlUnit"
         self.broker = broker
         self.port = port
         self.topic_prefix = "Garden/sensors/"
         self.rest_api_base_url = base_url
         self.catalog_url = "http://127.0.0.1:8080/garden"  # HomeCatalog URL
+        self.clock = clock or RealClock()
 
-        self.client = MyMQTT(self.clientID, self.broker, self.port, self)
+        self.client = client or MyMQTT(self.clientID, self.broker, self.port, self)
         self.client.start()
 
         # Threshold setting
@@ -28,10 +92,12 @@ class ControlUnit:
         self.SUNRISE_BUFFER = 60  # One hour before sunrise (60 minutes)
         self.sunrise_counter = 0
         self.is_sunrise_time = False
-        self.last_check_time = datetime.now()
+        self.last_check_time = self.clock.now()
 
         # Sensor data storage
         self.soil_moisture_values = {}
+        # Rolling statistics of every sensor over the last hour, keyed by topic relative to topic_prefix
+        self.stats = RollingStats(window=3600, capacity=64)
         self.temperature = None
         self.humidity = None
         self.light_level = None
@@ -43,7 +109,7 @@ class ControlUnit:
         self.irrigation_timer = None
         self.irrigation_start_time = None
         self.irrigation_water_used = 0
-        self.last_water_flow_time = time.time()
+        self.last_water_flow_time = self.clock.time()
         self.total_water_used = self.load_water_usage()
         self.current_water_flow = 0
 
@@ -53,15 +119,33 @@ class ControlUnit:
         self.data_collection_in_progress = False
         self.has_irrigated_today = False
 
-        # Data count
-        self.data_count = 0
-        self.total_sensors = 14  # 9 soil moisture + temperature + humidity + light + rain + water flow
+        # Sampling round: the topics expected from the catalog and those received so far.
+        # The condition is notified as soon as the last expected reading arrives; round_timeout (seconds)
+        # bounds the wait, after which the round is evaluated on the readings it got.
+        self.round_timeout = round_timeout
+        self.expected_topics = {self.topic_prefix + topic for topic in DEFAULT_SENSOR_TOPICS}
+        self.received_topics = set()
+        self.round_condition = threading.Condition()
 
         # Synchronous event
         self.irrigation_complete = threading.Event()
 
+        self.router = TopicRouter()
+        self.router.add(self.topic_prefix + "soil_moisture/+",
+                        lambda topic, value: self.handle_soil_moisture(topic.split('/')[-1], value))
+        self.router.add(self.topic_prefix + "temperature", lambda topic, value: self.handle_temperature(value))
+        self.router.add(self.topic_prefix + "humidity", lambda topic, value: self.handle_humidity(value))
+        self.router.add(self.topic_prefix + "light", lambda topic, value: self.handle_light(value))
+        self.router.add(self.topic_prefix + "rain", lambda topic, value: self.handle_rain(value))
+        self.router.add(self.topic_prefix + "water_flow", lambda topic, value: self.handle_water_flow(value))
+
         self.client.mySubscribe(self.topic_prefix + "#")
 
+        # The irrigation stop is saved with its deadline, so a restart during irrigation still turns the pump off
+        self.scheduler = Scheduler('control_unit_schedule.json', self.clock)
+        self.scheduler.register("stop_irrigation", self.stop_irrigation)
+        self.scheduler.start()
+
     def load_water_usage(self):
         try:
             with open('water_usage.json', 'r') as f:
@@ -73,55 +157,85 @@ class ControlUnit:
     def save_water_usage(self):
         data = {
             'total_water_used': round(self.total_water_used, 4),
-            'last_updated': datetime.now().isoformat()
+            'last_updated': self.clock.now().isoformat()
         }
         with open('water_usage.json', 'w') as f:
             json.dump(data, f, indent=2)
             print(f"Water usage data has been saved. Total water usage: {self.total_water_used:.4f} liters")
 
+    @Metrics.timed(NOTIFY_SECONDS)
     def notify(self, topic, payload):
         if not self.data_collection_in_progress:
             return  #If not in the data collection phase, ignore the incoming data
 
         try:
-            msg = json.loads(payload)
-            sensor_data = msg["e"][0]
-            value = sensor_data["v"]
-
-            if "soil_moisture" in topic:
-                sensor_id = topic.split('/')[-1]
-                self.handle_soil_moisture(sensor_id, value)
-            elif "temperature" in topic:
-                self.handle_temperature(value)
-            elif "humidity" in topic:
-                self.handle_humidity(value)
-            elif "light" in topic:
-                self.handle_light(value)
-            elif "rain" in topic:
-                self.handle_rain(value)
-            elif "water_flow" in topic:
-                self.handle_water_flow(value)
-
-            self.data_count += 1
-            if self.data_count == self.total_sensors:
-                self.data_collection_in_progress = False
-                self.check_conditions_and_act()
+            value = SenML.decode(payload)[0]["v"]
+
+            with self.round_condition:
+                if not self.data_collection_in_progress or not self.router.dispatch(topic, value):
+                    return
+
+                self.stats.add(topic[len(self.topic_prefix):], value, self.clock.time())
+                # A set, so a duplicated reading cannot end the round early
+                self.received_topics.add(topic)
+                if self.expected_topics <= self.received_topics:
+                    self.data_collection_in_progress = False
+                    self.round_condition.notify_all()
 
         except Exception as e:
             print(f"Error occurred while processing sensor data: {e}")
 
+    def load_expected_topics(self):
+        """
+        Refresh the set of topics a round waits for from the active sensors registered in the catalog.
+        The previous set is kept if the catalog cannot be reached.
+        """
+        try:
+            response = requests.get(f"{self.catalog_url}/sensors", timeout=5)
+            response.raise_for_status()
+            topics = set()
+            for sensor in response.json():
+                if sensor.get("status", "active") == "active":
+                    topics.update(self.topic_prefix + topic for topic in self.sensor_topics(sensor))
+            if topics:
+                self.expected_topics = topics
+        except Exception as e:
+            print(f"Error loading the sensor list from the catalog, expecting {len(self.expected_topics)} readings: {e}")
+
+    def sensor_topics(self, sensor):
+        if sensor.get("sensorType") == "Soil Moisture Sensor":
+            return [f"soil_moisture/{sensor['sensorID'][len('soil_moisture'):]}"]
+        return SENSOR_TYPE_TOPICS.get(sensor.get("sensorType"), [])
+
+    def wait_for_round(self):
+        """
+        Block until every expected reading of the round has arrived or the round deadline passes.
+        Returns True if the round is complete.
+        """
+        with self.round_condition:
+            complete = self.clock.wait_for(self.round_condition, lambda: not self.data_collection_in_progress,
+                                           self.round_timeout)
+            self.data_collection_in_progress = False
+        ROUNDS.labels("complete" if complete else "partial").inc()
+        if not complete:
+            missing = sorted(topic[len(self.topic_prefix):] for topic in self.expected_topics - self.received_topics)
+            print(f"Round deadline reached, evaluating partial data. Missing readings: {', '.join(missing)}")
+        return complete
+
     def reset_data(self):
         self.soil_moisture_values.clear()
         self.temperature = None
         self.humidity = None
         self.rain_level = None
         self.water_flow = None
-        self.data_count = 0
+        self.received_topics = set()
         # Do not reset self.light_level, self.last_check_time, self.sunrise_counter, and self.is_sunrise_time
 
     def start_data_collection(self):
-        self.reset_data()
-        self.data_collection_in_progress = True
+        self.load_expected_topics()
+        with self.round_condition:
+            self.reset_data()
+            self.data_collection_in_progress = True
         print("A new round of data collection begins...")
 
     def handle_soil_moisture(self, sensor_id, value):
@@ -137,7 +251,7 @@ class ControlUnit:
         print(f"Humidity: {value:.2f}%")
 
     def handle_light(self, value):
-        current_time = datetime.now()
+        current_time = self.clock.now()
         if self.light_level is None:
             self.last_check_time = current_time
 
@@ -169,7 +283,7 @@ class ControlUnit:
 
     def handle_water_flow(self, value):
         self.current_water_flow = value
-        current_time = time.time()
+        current_time = self.clock.time()
         if self.irrigation_start_time is not None:
             time_diff = current_time - self.last_water_flow_time
             water_used = value * time_diff / 60  # Calculate the water consumption during this time interval
@@ -178,12 +292,11 @@ class ControlUnit:
             self.last_water_flow_time = current_time
         print(f"Current water flow: {value:.4f} L/min")
 
-    def start_data_collection(self):
-        self.reset_data()
-        self.data_collection_in_progress = True
-
+    @Metrics.timed(DECISION_SECONDS)
     def check_conditions_and_act(self):
-        if len(self.soil_moisture_values) < 9 or self.temperature is None or self.light_level is None or self.rain_level is None:
+        # Partial rounds are evaluated on the soil moisture sensors that reported, but never without
+        # the temperature, light and rain readings the safety conditions depend on
+        if not self.soil_moisture_values or self.temperature is None or self.light_level is None or self.rain_level is None:
             print("Not all necessary sensor data has been received.")
             self.irrigation_complete.set()
             return
@@ -191,35 +304,15 @@ class ControlUnit:
         average_moisture = sum(self.soil_moisture_values.values()) / len(self.soil_moisture_values)
         print(f"Average soil moisture: {average_moisture:.2f}% (threshold: {self.moisture_threshold}%)")
 
-        should_irrigate = (
-                not self.has_irrigated_today and
-                0 < self.sunrise_counter < self.SUNRISE_BUFFER and  # Only irrigate in "Pre-sunrise" state
-                average_moisture < self.moisture_threshold and
-                self.temperature_threshold[0] <= self.temperature <= self.temperature_threshold[1] and
-                self.rain_level < self.rain_detected_level and
-                self.temperature > self.do_not_water_temp
-        )
+        should_irrigate, reasons = irrigation_decision(
+            self.has_irrigated_today, self.sunrise_counter, average_moisture, self.temperature, self.rain_level,
+            self.moisture_threshold, self.temperature_threshold, self.rain_detected_level, self.do_not_water_temp,
+            self.SUNRISE_BUFFER)
 
         if should_irrigate:
             self.irrigation_in_progress = True
             self.start_irrigation()
         else:
-            reasons = []
-            if self.has_irrigated_today:
-                reasons.append("Irrigated today")
-            if not (0 < self.sunrise_counter < self.SUNRISE_BUFFER):
-                reasons.append("Not within the irrigation window before sunrise")
-            if average_moisture >= self.moisture_threshold:
-                reasons.append("Soil moisture is sufficient")
-            if self.temperature < self.temperature_threshold[0]:
-                reasons.append("Temperature is too low")
-            elif self.temperature > self.temperature_threshold[1]:
-                reasons.append("Temperature is too high")
-            if self.rain_level >= self.rain_detected_level:
-                reasons.append("Rain is detected")
-            if self.temperature <= self.do_not_water_temp:
-                reasons.append("Temperature is too low, not suitable for irrigation")
-
             if reasons:
                 print(f"No irrigation. Reasons: {', '.join(reasons)}")
                 self.update_led_warning(True, ', '.join(reasons))
@@ -230,64 +323,69 @@ class ControlUnit:
 
     def check_water_pump_status(self):
         try:
-            catalog_url = f"{self.rest_api_base_url}/water_pump"
-            response = cherrypy.lib.httputil.urlopen(catalog_url, method='GET')
-            result = json.loads(response.read().decode('utf-8'))
-            return result.get('water_pump_state')
+            response = requests.get(f"{self.rest_api_base_url}/waterpump", timeout=5)
+            return response.json().get('waterpump_state')
         except Exception as e:
             print(f"Error checking water pump status: {e}")
             return None
 
+    def set_water_pump(self, command):
+        """
+        Send an ON or OFF command to the water pump actuator and return whether it succeeded.
+        """
+        response = requests.post(f"{self.rest_api_base_url}/waterpump", json={"command": command}, timeout=5)
+        return response.json().get('status') == 'success'
+
     def start_irrigation(self):
         current_status = self.check_water_pump_status()
         if current_status == "ON":
             print("Water pump is already ON")
+            self.irrigation_in_progress = False
+            self.irrigation_complete.set()
             return
 
         if self.irrigation_start_time is None:
             try:
-                response = cherrypy.lib.httputil.urljoin(self.rest_api_base_url, "water_pump")
-                result = cherrypy.lib.jsontools.json_decode(
-                    cherrypy.lib.httputil.urlopen(
-                        response,
-                        method='POST',
-                        headers=[('Content-Type', 'application/json')],
-                        body=json.dumps({"command": "ON"})
-                    ).read()
-                )
-                if result.get('status') == 'success':
-                    self.irrigation_start_time = time.time()
+                if self.set_water_pump("ON"):
+                    self.irrigation_start_time = self.clock.time()
                     self.irrigation_water_used = 0
-                    self.last_water_flow_time = time.time()
+                    self.last_water_flow_time = self.irrigation_start_time
+                    IRRIGATIONS.inc()
                     print(f"Start irrigation. Estimated duration: {self.irrigation_duration} seconds")
                     self.update_led_warning(False)
-                    self.irrigation_timer = threading.Timer(self.irrigation_duration, self.stop_irrigation)
-                    self.irrigation_timer.start()
+                    self.irrigation_timer = self.scheduler.schedule(self.irrigation_duration, "stop_irrigation",
+                                                                    self.irrigation_start_time,
+                                                                    key="stop_irrigation")
                     self.update_command_history("turn_on")  # Update command history
+                    return
                 else:
                     print("Failed to start the water pump.")
             except Exception as e:
                 print(f"Error starting the pump: {e}")
+        # Irrigation did not start, let the round finish
+        self.irrigation_in_progress = False
+        self.irrigation_complete.set()
+
+    def stop_irrigation(self, start_time=None):
+        if self.irrigation_start_time is None and start_time is not None:
+            # Stop restored from the schedule after a restart. It ran outside any round of this process,
+            # so it only switches the pump off and leaves the round state alone
+            self.stop_restored_irrigation()
+            return
 
-    def stop_irrigation(self):
         current_status = self.check_water_pump_status()
         if current_status == "OFF":
             print("Water pump is already OFF")
+            self.irrigation_start_time = None
+            self.irrigation_timer = None
+            self.irrigation_in_progress = False
+            self.irrigation_complete.set()
             return
 
         if self.irrigation_start_time is not None:
             try:
-                response = cherrypy.lib.httputil.urljoin(self.rest_api_base_url, "water_pump")
-                result = cherrypy.lib.jsontools.json_decode(
-                    cherrypy.lib.httputil.urlopen(
-                        response,
-                        method='POST',
-                        headers=[('Content-Type', 'application/json')],
-                        body=json.dumps({"command": "OFF"})
-                    ).read()
-                )
-                if result.get('status') == 'success':
-                    irrigation_duration = time.time() - self.irrigation_start_time
+                if self.set_water_pump("OFF"):
+                    irrigation_duration = self.clock.time() - self.irrigation_start_time
                     average_flow = self.irrigation_water_used / (
                                 irrigation_duration / 60) if irrigation_duration > 0 else 0
                     total_water_used = average_flow * irrigation_duration / 60
@@ -304,23 +402,34 @@ class ControlUnit:
                     self.irrigation_start_time = None
                     self.irrigation_water_used = 0
                     if self.irrigation_timer:
-                        self.irrigation_timer.cancel()
+                        self.scheduler.cancel(self.irrigation_timer)
                         self.irrigation_timer = None
-                        self.irrigation_in_progress = False
-                        self.has_irrigated_today = True
-                        self.irrigation_complete.set()
-                        self.update_command_history("turn_off")  # Update command history
+                    self.irrigation_in_progress = False
+                    self.has_irrigated_today = True
+                    self.irrigation_complete.set()
+                    self.update_command_history("turn_off")  # Update command history
                 else:
                     print("Failed to stop the pump.")
             except Exception as e:
                 print(f"Error occurred while stopping the pump: {e}")
 
+    def stop_restored_irrigation(self):
+        try:
+            if self.check_water_pump_status() == "OFF":
+                print("Water pump is already OFF")
+            elif self.set_water_pump("OFF"):
+                print("Stopped the irrigation left running before the restart")
+                self.update_command_history("turn_off")
+            else:
+                print("Failed to stop the pump.")
+        except Exception as e:
+            print(f"Error occurred while stopping the pump: {e}")
+
     def update_led_warning(self, warning_on, warning_message=""):
         if warning_on != self.led_warning_state:
             self.led_warning_state = warning_on
             command_topic = "Garden/actuators/LED"
-            command_msg = json.dumps(
-                {"bn": "Garden/commands/", "e": [{"n": "LED", "v": 1 if warning_on else 0, "t": str(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())))}]})
+            command_msg = {"bn": "Garden/commands/", "e": [{"n": "LED", "v": 1 if warning_on else 0, "t": str(self.clock.now().strftime('%Y-%m-%d %H:%M:%S'))}]}
             self.client.myPublish(command_topic, command_msg)
             print(f"LED warning{'ON' if warning_on else 'OFF'}。{warning_message if warning_on else ''}")
 
@@ -331,7 +440,7 @@ class ControlUnit:
                 "commandType": command_type,
                 "parameters": None,
                 "status": "completed",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": self.clock.now().isoformat()
             }
             response = requests.post(f"{self.catalog_url}/commands", json=command)
             if response.status_code == 200:
@@ -341,33 +450,50 @@ class ControlUnit:
         except Exception as e:
             print(f"Error updating command history: {e}")
 
-    def run(self):
-        try:
-            while True:
-                current_date = datetime.now().date()
-                if current_date != getattr(self, 'current_date', None):
-                    self.reset_daily()
-                    self.current_date = current_date
-
-                self.start_data_collection()
+    def run_round(self):
+        """
+        One sampling round: collect the readings, decide, and wait for a started irrigation to finish.
+        """
+        current_date = self.clock.now().date()
+        if current_date != getattr(self, 'current_date', None):
+            self.reset_daily()
+            self.current_date = current_date
 
-                while self.data_collection_in_progress:
-                    time.sleep(0.1)
+        self.start_data_collection()
+        self.wait_for_round()
+        self.check_conditions_and_act()
 
-                self.irrigation_complete.wait()
-                self.irrigation_complete.clear()
+        self.clock.wait(self.irrigation_complete)
+        self.irrigation_complete.clear()
 
-                print(f"This loop ends. Current sunrise_counter: {self.sunrise_counter:.2f} minutes")
-                print(f"Is it sunrise time: {'Yes' if self.is_sunrise_time else 'No'}")
-                print(f"Has it been irrigated today: {'Yes' if self.has_irrigated_today else 'No'}")
+        print(f"This loop ends. Current sunrise_counter: {self.sunrise_counter:.2f} minutes")
+        print(f"Is it sunrise time: {'Yes' if self.is_sunrise_time else 'No'}")
+        print(f"Has it been irrigated today: {'Yes' if self.has_irrigated_today else 'No'}")
+        self.print_statistics()
 
-                time.sleep(600)  # Check every 60 minutes
+    def run(self):
+        try:
+            while True:
+                self.run_round()
+                self.clock.sleep(600)  # Check every 10 minutes
 
         except KeyboardInterrupt:
             print("Control unit shutting down...")
-            if self.irrigation_timer:
-                self.irrigation_timer.cancel()
-            self.client.stop()
+            self.stop()
+
+    def stop(self):
+        # A pending irrigation stop stays saved and runs on the next start
+        self.scheduler.stop()
+        self.client.stop()
+
+    def print_statistics(self):
+        for name in ("temperature", "humidity", "light"):
+            sensor = self.stats.get(name)
+            if sensor is not None:
+                sensor.expire(self.clock.time())
+                if sensor.count:
+                    print(f"Last hour {name}: mean {sensor.mean():.2f}, min {sensor.min():.2f}, "
+                          f"max {sensor.max():.2f}, EWMA {sensor.ewma:.2f}")
 
     def reset_daily(self):
         self.has_irrigated_today = False
@@ -379,5 +505,6 @@ if __name__ == "__main__":
     broker = "mqtt.eclipseprojects.io"
     port = 1883
     base_url = "http://127.0.0.1:8080/garden/actuators"
+    Metrics.serve(9101)
     control_unit = ControlUnit(broker, port, base_url)
     control_unit.run()
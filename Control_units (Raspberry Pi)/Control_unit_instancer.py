@@ -1,15 +1,18 @@
 from Control_unit import ControlUnit
+import Metrics
 
 class ControlUnitInstancer:
     def __init__(self):
         self.config = {
             "broker": "mqtt.eclipseprojects.io",
             "port": 1883,
-            "baseUrl": "http://127.0.0.1:8080/garden/actuators"
+            "baseUrl": "http://127.0.0.1:8080/garden/actuators",
+            "metricsPort": 9101
         }
         self.control_unit = None
 
     def start(self):
+        Metrics.serve(self.config['metricsPort'])
         self.control_unit = ControlUnit(
             broker=self.config['broker'],
             port=self.config['port'],
@@ -0,0 +1,165 @@
+import math
+import time
+from array import array
+
+
+class RollingWindow:
+    """
+    Statistics of the readings of one sensor over the last window seconds.
+
+    Readings are kept in ring buffers preallocated for capacity entries, so memory stays fixed however
+    long the process runs; when a window holds more than capacity readings the oldest ones are dropped
+    early. Mean and variance come from running sums, min and max from monotonic queues of reading
+    sequence numbers, so every update and query is O(1) amortized. The EWMA is over all readings.
+    """
+
+    __slots__ = ("window", "capacity", "ewma_alpha", "times", "values", "sequence", "count", "total",
+                 "total_squares", "min_queue", "min_head", "min_length", "max_queue", "max_head", "max_length",
+                 "ewma", "last")
+
+    def __init__(self, window=3600, capacity=1024, ewma_alpha=0.2):
+        self.window = window
+        self.capacity = capacity
+        self.ewma_alpha = ewma_alpha
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        # Sequence number of the next reading; reading s is stored at position s % capacity
+        self.sequence = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min_queue = array('q', bytes(8 * capacity))
+        self.min_head = 0
+        self.min_length = 0
+        self.max_queue = array('q', bytes(8 * capacity))
+        self.max_head = 0
+        self.max_length = 0
+        self.ewma = None
+        self.last = None
+
+    def add(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        value = float(value)
+        self.expire(timestamp)
+        if self.count == self.capacity:
+            self.drop_oldest()
+
+        position = self.sequence % self.capacity
+        self.times[position] = timestamp
+        self.values[position] = value
+        self.count += 1
+        self.total += value
+        self.total_squares += value * value
+        self.push_min(self.sequence, value)
+        self.push_max(self.sequence, value)
+        self.sequence += 1
+        if self.sequence % self.capacity == 0:
+            # Cancel the rounding drift of the running sums, once per capacity readings
+            self.recompute_sums()
+
+        self.ewma = value if self.ewma is None else self.ewma + self.ewma_alpha * (value - self.ewma)
+        self.last = value
+
+    def expire(self, now=None):
+        """
+        Drop the readings older than the window.
+        """
+        if now is None:
+            now = time.time()
+        horizon = now - self.window
+        while self.count and self.times[(self.sequence - self.count) % self.capacity] < horizon:
+            self.drop_oldest()
+
+    def drop_oldest(self):
+        oldest = self.sequence - self.count
+        value = self.values[oldest % self.capacity]
+        self.count -= 1
+        if self.count == 0:
+            self.total = 0.0
+            self.total_squares = 0.0
+        else:
+            self.total -= value
+            self.total_squares -= value * value
+        if self.min_length and self.min_queue[self.min_head] == oldest:
+            self.min_head = (self.min_head + 1) % self.capacity
+            self.min_length -= 1
+        if self.max_length and self.max_queue[self.max_head] == oldest:
+            self.max_head = (self.max_head + 1) % self.capacity
+            self.max_length -= 1
+
+    def push_min(self, sequence, value):
+        # Readings that are not smaller than the new one can never be the minimum again
+        while self.min_length:
+            tail = (self.min_head + self.min_length - 1) % self.capacity
+            if self.values[self.min_queue[tail] % self.capacity] < value:
+                break
+            self.min_length -= 1
+        self.min_queue[(self.min_head + self.min_length) % self.capacity] = sequence
+        self.min_length += 1
+
+    def push_max(self, sequence, value):
+        while self.max_length:
+            tail = (self.max_head + self.max_length - 1) % self.capacity
+            if self.values[self.max_queue[tail] % self.capacity] > value:
+                break
+            self.max_length -= 1
+        self.max_queue[(self.max_head + self.max_length) % self.capacity] = sequence
+        self.max_length += 1
+
+    def recompute_sums(self):
+        self.total = 0.0
+        self.total_squares = 0.0
+        for sequence in range(self.sequence - self.count, self.sequence):
+            value = self.values[sequence % self.capacity]
+            self.total += value
+            self.total_squares += value * value
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def variance(self):
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return max(self.total_squares / self.count - mean * mean, 0.0)
+
+    def std(self):
+        variance = self.variance()
+        return None if variance is None else math.sqrt(variance)
+
+    def min(self):
+        return self.values[self.min_queue[self.min_head] % self.capacity] if self.count else None
+
+    def max(self):
+        return self.values[self.max_queue[self.max_head] % self.capacity] if self.count else None
+
+    def summary(self, now=None):
+        self.expire(now)
+        return {"count": self.count, "mean": self.mean(), "min": self.min(), "max": self.max(),
+                "variance": self.variance(), "ewma": self.ewma, "last": self.last}
+
+
+class RollingStats:
+    """
+    One RollingWindow per sensor name, created on its first reading.
+    """
+
+    def __init__(self, window=3600, capacity=1024, ewma_alpha=0.2):
+        self.window = window
+        self.capacity = capacity
+        self.ewma_alpha = ewma_alpha
+        self.sensors = {}
+
+    def add(self, name, value, timestamp=None):
+        sensor = self.sensors.get(name)
+        if sensor is None:
+            sensor = self.sensors[name] = RollingWindow(self.window, self.capacity, self.ewma_alpha)
+        sensor.add(value, timestamp)
+        return sensor
+
+    def get(self, name):
+        return self.sensors.get(name)
+
+    def summary(self, now=None):
+        return {name: sensor.summary(now) for name, sensor in self.sensors.items()}
@@ -0,0 +1,299 @@
+import os
+import json
+import heapq
+import itertools
+import threading
+from Clock import RealClock
+
+
+class Job:
+    __slots__ = ("when", "sequence", "callback", "args", "key", "cancelled")
+
+    def __init__(self, when, sequence, callback, args, key=None):
+        self.when = when
+        self.sequence = sequence
+        self.callback = callback
+        self.args = args
+        self.key = key
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.sequence) < (other.when, other.sequence)
+
+    @property
+    def persistent(self):
+        return isinstance(self.callback, str)
+
+
+class Scheduler:
+    """
+    Runs callbacks at given times on one thread, whatever the number of pending jobs.
+
+    Jobs are kept in a heap ordered by due time; a cancelled job stays in the heap and is skipped when
+    it comes due. run_pending() runs the due jobs on the calling thread, so the scheduler can also be
+    driven without start(), e.g. by a benchmark.
+
+    A job whose callback is the name of an action registered with register() is persistent: with a
+    state_file, pending persistent jobs (due time, action, JSON arguments) are saved and restored by
+    start(), so a pump switch-off survives a restart. Every change is appended as one JSON line to a
+    journal next to the state file and fsynced before the call returns; concurrent changes share the
+    fsync. The state file is a snapshot rewritten every compact_every changes, at start() and at stop(),
+    so a change costs the same with ten or ten thousand pending jobs. Jobs that came due while the process
+    was down run as soon as the scheduler starts. A job is removed from the state only after it has run,
+    so actions must be safe to repeat. Scheduling a job with the key of a pending one replaces it.
+
+    Times come from clock. With a VirtualClock no thread is started: every job registers a timer on the
+    clock, and runs when whoever drives the clock moves it past the job's due time.
+    """
+
+    def __init__(self, state_file=None, clock=None, compact_every=1000):
+        self.state_file = state_file
+        self.journal_file = f"{state_file}.journal" if state_file else None
+        self.compact_every = compact_every
+        # Opened by start(); until then changes are only in memory and reach the state file with its snapshot
+        self.journal = None
+        self.journal_length = 0
+        self.journal_pending = []
+        self.clock = clock or RealClock()
+        self.heap = []
+        self.actions = {}
+        self.keys = {}
+        self.persistent_jobs = set()
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.save_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def register(self, action, callback):
+        self.actions[action] = callback
+
+    def schedule(self, delay, callback, *args, key=None):
+        return self.schedule_at(self.clock.time() + delay, callback, *args, key=key)
+
+    def schedule_at(self, when, callback, *args, key=None):
+        """
+        Run callback(*args) at the given epoch time. callback is a function, or the name of a registered
+        action to make the job persistent.
+        """
+        if isinstance(callback, str) and callback not in self.actions:
+            raise ValueError(f"Unknown scheduler action {callback}")
+        job = Job(when, next(self.sequence), callback, args, key)
+        with self.condition:
+            replaced = key is not None and self.cancel_locked(self.keys.get(key))
+            if key is not None:
+                self.keys[key] = job
+            if job.persistent:
+                self.persistent_jobs.add(job)
+                self.record_locked({"op": "add", **self.job_state(job)})
+            heapq.heappush(self.heap, job)
+            if self.heap[0] is job:
+                # New earliest deadline, the worker has to shorten its wait
+                self.condition.notify()
+        if job.persistent or replaced:
+            self.save()
+        if self.clock.virtual:
+            self.clock.call_at(when, self.run_pending)
+        return job
+
+    def cancel(self, job):
+        with self.condition:
+            persistent = self.cancel_locked(job)
+        if persistent:
+            self.save()
+
+    def cancel_key(self, key):
+        with self.condition:
+            persistent = self.cancel_locked(self.keys.get(key))
+        if persistent:
+            self.save()
+
+    def cancel_locked(self, job):
+        """
+        Mark a job cancelled and return whether the saved state changed.
+        """
+        if job is None or job.cancelled:
+            return False
+        job.cancelled = True
+        if job.key is not None and self.keys.get(job.key) is job:
+            del self.keys[job.key]
+        return self.forget_locked(job)
+
+    def forget_locked(self, job):
+        """
+        Drop a job from the persistent ones and queue its removal for the journal; return whether it was one.
+        """
+        if job not in self.persistent_jobs:
+            return False
+        self.persistent_jobs.discard(job)
+        self.record_locked({"op": "remove", "id": job.sequence})
+        return True
+
+    def pending(self):
+        with self.condition:
+            return sum(not job.cancelled for job in self.heap)
+
+    def pop_due(self, now):
+        with self.condition:
+            due = []
+            while self.heap and self.heap[0].when <= now:
+                job = heapq.heappop(self.heap)
+                if not job.cancelled:
+                    due.append(job)
+            return due
+
+    def run_pending(self, now=None):
+        """
+        Run every job due at now (default: the current time) and return how many ran.
+        """
+        due = self.pop_due(self.clock.time() if now is None else now)
+        for job in due:
+            self.execute(job)
+        return len(due)
+
+    def execute(self, job):
+        callback = self.actions[job.callback] if job.persistent else job.callback
+        try:
+            callback(*job.args)
+        except Exception as e:
+            print(f"Error in scheduled job {getattr(callback, '__name__', callback)}: {e}")
+        with self.condition:
+            if job.key is not None and self.keys.get(job.key) is job:
+                del self.keys[job.key]
+            persistent = self.forget_locked(job)
+        if persistent:
+            self.save()
+
+    @staticmethod
+    def job_state(job):
+        return {"id": job.sequence, "when": job.when, "action": job.callback, "args": list(job.args), "key": job.key}
+
+    def record_locked(self, entry):
+        # Called under the condition, so the journal gets the changes in the order they were made
+        if self.journal is not None:
+            self.journal_pending.append(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b"\n")
+
+    def save(self):
+        """
+        Write the queued changes to the journal and fsync it, compacting it into the state file when it is long.
+        """
+        with self.save_lock:
+            with self.condition:
+                lines, self.journal_pending = self.journal_pending, []
+            if not lines:
+                # Another thread wrote them while this one waited for the lock
+                return
+            self.journal.write(b"".join(lines))
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.journal_length += len(lines)
+            if self.journal_length >= self.compact_every:
+                self.compact_locked()
+
+    def compact(self):
+        with self.save_lock:
+            self.compact_locked()
+
+    def compact_locked(self):
+        """
+        Snapshot the persistent jobs into the state file and start a new, empty journal.
+        """
+        with self.condition:
+            # The snapshot includes the changes still queued for the journal
+            jobs = [self.job_state(job) for job in sorted(self.persistent_jobs)]
+            self.journal_pending = []
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as file:
+            json.dump(jobs, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.state_file)
+        self.journal.truncate(0)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_length = 0
+
+    def saved_jobs(self):
+        """
+        Return the persistent jobs in the state file with its journal replayed, and the size of the valid
+        part of the journal.
+        """
+        jobs = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as file:
+                for position, job in enumerate(json.load(file)):
+                    jobs[job.get("id", position)] = job
+        valid_size = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as file:
+                for line in file:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("Incomplete journal line")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write: everything from here on was never acknowledged
+                        break
+                    valid_size += len(line)
+                    if entry["op"] == "add":
+                        jobs[entry["id"]] = {name: value for name, value in entry.items() if name != "op"}
+                    else:
+                        jobs.pop(entry["id"], None)
+        return sorted(jobs.values(), key=lambda job: job["when"]), valid_size
+
+    def load(self):
+        """
+        Restore the persistent jobs saved in the state file and its journal, then compact them into a new
+        snapshot and open the journal. Actions must be registered first.
+        """
+        if self.state_file is None or self.journal is not None:
+            return 0
+        jobs, valid_size = self.saved_jobs()
+        restored = 0
+        for job in jobs:
+            if job["action"] not in self.actions:
+                print(f"Dropping saved job of unknown action {job['action']}")
+                continue
+            self.schedule_at(job["when"], job["action"], *job["args"], key=job.get("key"))
+            restored += 1
+        if restored:
+            print(f"Restored {restored} scheduled jobs from {self.state_file}")
+        # The restored jobs got new IDs, and jobs scheduled before start() are not in the journal either
+        self.journal = open(self.journal_file, 'ab')
+        self.journal.truncate(valid_size)
+        self.compact()
+        return restored
+
+    def start(self):
+        self.load()
+        self.running = True
+        if self.clock.virtual:
+            return
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the worker thread. Pending persistent jobs stay saved for the next start.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.journal is not None:
+            self.compact()
+
+    def loop(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    while self.heap and self.heap[0].cancelled:
+                        heapq.heappop(self.heap)
+                    if self.heap and self.heap[0].when <= self.clock.time():
+                        break
+                    self.condition.wait(self.heap[0].when - self.clock.time() if self.heap else None)
+                if not self.running:
+                    return
+            self.run_pending()
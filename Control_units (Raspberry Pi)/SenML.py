@@ -0,0 +1,306 @@
+import json
+import struct
+
+# CBOR labels of the SenML fields (RFC 8428, section 6)
+CBOR_LABELS = {"bn": -2, "bt": -3, "bu": -4, "bv": -5, "n": 0, "u": 1, "v": 2, "vs": 3, "vb": 4, "s": 5, "t": 6,
+               "ut": 7, "vd": 8}
+CBOR_NAMES = {label: name for name, label in CBOR_LABELS.items()}
+# Types of the fields loads accepts; "t" may also be the formatted local time published by the device connectors
+NUMBER, STRING, BOOLEAN = {int, float}, {str}, {bool}
+FIELD_TYPES = {"bt": NUMBER, "bv": NUMBER, "v": NUMBER, "s": NUMBER, "ut": NUMBER, "bn": STRING, "bu": STRING,
+               "n": STRING, "u": STRING, "vs": STRING, "vd": STRING, "vb": BOOLEAN, "t": NUMBER | STRING}
+
+
+class DoubleEncodedError(ValueError):
+    """
+    Raised in strict mode for a payload that is a JSON string containing the JSON of a pack.
+    """
+
+
+def create_message(base_name, name, value, unit, timestamp):
+    """
+    Build the single-record pack published by the device connectors.
+    """
+    return {"bn": base_name, "e": [{"n": name, "v": value, "u": unit, "t": timestamp}]}
+
+
+def encode(records, base_name=None, base_time=None):
+    """
+    Build a pack from fully resolved records ({"n", "v", "u", "t"}).
+
+    With base_name, names starting with it are stored relative to it. With base_time (numeric times
+    only), times are stored relative to it; base_time=True uses the time of the first record.
+    """
+    if base_time is True:
+        base_time = records[0]["t"] if records and isinstance(records[0].get("t"), (int, float)) else None
+    pack = {}
+    if base_name is not None:
+        pack["bn"] = base_name
+    if base_time is not None:
+        pack["bt"] = base_time
+    entries = []
+    for record in records:
+        entry = dict(record)
+        name = entry.get("n")
+        if base_name is not None and name is not None and name.startswith(base_name):
+            entry["n"] = name[len(base_name):]
+        if base_time is not None and isinstance(entry.get("t"), (int, float)):
+            entry["t"] = entry["t"] - base_time
+        entries.append(entry)
+    pack["e"] = entries
+    return pack
+
+
+def loads(payload, strict=False):
+    """
+    Parse a JSON or CBOR payload into a pack.
+
+    A JSON string holding the JSON of a pack, as produced by encoding an already encoded message,
+    is unwrapped, or rejected with DoubleEncodedError when strict is set. A payload that is not a
+    well-formed pack raises ValueError.
+    """
+    if isinstance(payload, (bytes, bytearray)) and payload[:1] and payload[0] >> 5 in (4, 5):
+        # CBOR array or map; JSON payloads start with an ASCII character
+        try:
+            return validate(cbor_to_pack(payload))
+        except (IndexError, TypeError, struct.error) as e:
+            raise ValueError(f"Malformed SenML CBOR payload: {e}") from e
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8')
+    pack = json.loads(payload)
+    if isinstance(pack, str):
+        if strict:
+            raise DoubleEncodedError("SenML payload is double-encoded")
+        pack = json.loads(pack)
+    return validate(pack)
+
+
+def validate(pack):
+    """
+    Check that a parsed pack is an object whose "e" is a list of records and whose fields have their
+    SenML types, raising ValueError otherwise. Returns the pack.
+    """
+    if not isinstance(pack, dict):
+        raise ValueError(f"SenML pack must be an object, not {type(pack).__name__}")
+    entries = pack.get("e", [])
+    if not isinstance(entries, list):
+        raise ValueError(f"SenML pack field e must be a list, not {type(entries).__name__}")
+    for name, value in pack.items():
+        if name != "e" and type(value) not in FIELD_TYPES.get(name, (type(value),)):
+            raise ValueError(f"SenML pack field {name} cannot be {type(value).__name__}")
+    relative_time = "bt" in pack
+    for position, entry in enumerate(entries):
+        if type(entry) is not dict:
+            raise ValueError(f"SenML record {position} must be an object, not {type(entry).__name__}")
+        # Exact types, so a bool is not taken for a number
+        for name, value in entry.items():
+            if type(value) not in FIELD_TYPES.get(name, (type(value),)):
+                raise ValueError(f"SenML record {position} field {name} cannot be {type(value).__name__}")
+        if relative_time and type(entry.get("t")) is str:
+            raise ValueError(f"SenML record {position} field t must be a number relative to bt")
+    return pack
+
+
+def is_double_encoded(payload):
+    try:
+        loads(payload, strict=True)
+    except DoubleEncodedError:
+        return True
+    return False
+
+
+def decode(payload, strict=False):
+    """
+    Parse a payload (bytes, str or pack dictionary) and return its records with base name and base time
+    applied, so every record has its full name and absolute time. Raises ValueError for a malformed pack,
+    one without records, or a record left without a name.
+    """
+    pack = validate(payload) if isinstance(payload, dict) else loads(payload, strict)
+    if "e" not in pack:
+        raise ValueError("SenML pack has no records")
+    base_name = pack.get("bn", "")
+    base_time = pack.get("bt")
+    base_unit = pack.get("bu")
+    records = []
+    for position, entry in enumerate(pack["e"]):
+        record = dict(entry)
+        record["n"] = base_name + entry.get("n", "")
+        if not record["n"]:
+            raise ValueError(f"SenML record {position} has no name")
+        if base_time is not None:
+            record["t"] = base_time + entry.get("t", 0)
+        if base_unit is not None and "u" not in record:
+            record["u"] = base_unit
+        records.append(record)
+    return records
+
+
+def dumps(pack, binary=False):
+    """
+    Serialize a pack as compact JSON text, or as CBOR bytes when binary is set.
+    """
+    if binary:
+        return pack_to_cbor(pack)
+    return json.dumps(pack, separators=(',', ':'))
+
+
+def pack_to_cbor(pack):
+    """
+    Encode a pack in the CBOR representation of SenML: an array of records with integer labels,
+    the base fields carried by the first record.
+    """
+    base = {key: value for key, value in pack.items() if key != "e"}
+    records = []
+    for position, entry in enumerate(pack["e"]):
+        record = dict(base, **entry) if position == 0 else entry
+        records.append({CBOR_LABELS.get(key, key): value for key, value in record.items()})
+    out = bytearray()
+    _cbor_write(out, records)
+    return bytes(out)
+
+
+def cbor_to_pack(data):
+    records, _ = _cbor_read(data, 0)
+    if isinstance(records, dict):
+        records = [records]
+    pack = {}
+    entries = []
+    if not isinstance(records, list):
+        raise ValueError(f"SenML CBOR pack must be an array or a map, not {type(records).__name__}")
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"SenML CBOR record must be a map, not {type(record).__name__}")
+        entry = {}
+        for label, value in record.items():
+            name = CBOR_NAMES.get(label, label)
+            if name in ("bn", "bt", "bu", "bv"):
+                pack[name] = value
+            else:
+                entry[name] = value
+        entries.append(entry)
+    pack["e"] = entries
+    return pack
+
+
+def _cbor_head(out, major, value):
+    if value < 24:
+        out.append(major << 5 | value)
+    elif value < 0x100:
+        out += struct.pack(">BB", major << 5 | 24, value)
+    elif value < 0x10000:
+        out += struct.pack(">BH", major << 5 | 25, value)
+    elif value < 0x100000000:
+        out += struct.pack(">BI", major << 5 | 26, value)
+    else:
+        out += struct.pack(">BQ", major << 5 | 27, value)
+
+
+def _cbor_write(out, value):
+    if value is None:
+        out.append(0xf6)
+    elif value is True:
+        out.append(0xf5)
+    elif value is False:
+        out.append(0xf4)
+    elif isinstance(value, int):
+        if value >= 0:
+            _cbor_head(out, 0, value)
+        else:
+            _cbor_head(out, 1, -1 - value)
+    elif isinstance(value, float):
+        # The shortest of half, single and double precision that gives the value back exactly
+        if value != value:
+            out += b"\xf9\x7e\x00"
+            return
+        for initial, fmt in ((0xf9, ">e"), (0xfa, ">f")):
+            try:
+                packed = struct.pack(fmt, value)
+            except OverflowError:
+                continue
+            if struct.unpack(fmt, packed)[0] == value:
+                out.append(initial)
+                out += packed
+                return
+        out.append(0xfb)
+        out += struct.pack(">d", value)
+    elif isinstance(value, str):
+        encoded = value.encode('utf-8')
+        _cbor_head(out, 3, len(encoded))
+        out += encoded
+    elif isinstance(value, (bytes, bytearray)):
+        _cbor_head(out, 2, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        _cbor_head(out, 4, len(value))
+        for item in value:
+            _cbor_write(out, item)
+    elif isinstance(value, dict):
+        _cbor_head(out, 5, len(value))
+        for key, item in value.items():
+            _cbor_write(out, key)
+            _cbor_write(out, item)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} as CBOR")
+
+
+def _cbor_read(data, position):
+    initial = data[position]
+    major, info = initial >> 5, initial & 0x1f
+    position += 1
+    if major == 7:
+        if info == 20:
+            return False, position
+        if info == 21:
+            return True, position
+        if info == 22:
+            return None, position
+        if info == 25:
+            return _half_to_float(struct.unpack_from(">H", data, position)[0]), position + 2
+        if info == 26:
+            return struct.unpack_from(">f", data, position)[0], position + 4
+        if info == 27:
+            return struct.unpack_from(">d", data, position)[0], position + 8
+        raise ValueError(f"Unsupported CBOR simple value {info}")
+
+    if info < 24:
+        argument = info
+    elif info in (24, 25, 26, 27):
+        size = 1 << (info - 24)
+        argument = int.from_bytes(data[position:position + size], 'big')
+        position += size
+    else:
+        raise ValueError("Indefinite-length CBOR items are not supported")
+
+    if major == 0:
+        return argument, position
+    if major == 1:
+        return -1 - argument, position
+    if major == 2:
+        return bytes(data[position:position + argument]), position + argument
+    if major == 3:
+        return bytes(data[position:position + argument]).decode('utf-8'), position + argument
+    if major == 4:
+        items = []
+        for _ in range(argument):
+            item, position = _cbor_read(data, position)
+            items.append(item)
+        return items, position
+    if major == 5:
+        items = {}
+        for _ in range(argument):
+            key, position = _cbor_read(data, position)
+            items[key], position = _cbor_read(data, position)
+        return items, position
+    raise ValueError(f"Unsupported CBOR major type {major}")
+
+
+def _half_to_float(half):
+    exponent = (half >> 10) & 0x1f
+    mantissa = half & 0x3ff
+    if exponent == 0:
+        value = mantissa * 2 ** -24
+    elif exponent == 31:
+        value = float('inf') if mantissa == 0 else float('nan')
+    else:
+        value = (mantissa + 1024) * 2 ** (exponent - 25)
+    return -value if half & 0x8000 else value
@@ -0,0 +1,261 @@
+import json
+import time
+import threading
+from MyMQTT import MyMQTT
+import SenML
+from Scheduler import Scheduler
+from Control_unit import irrigation_decision
+
+# Sensor slots of a zone after its soil moisture sensors
+OTHER_SENSORS = ["temperature", "humidity", "light", "rain", "water_flow"]
+
+
+class ZoneState:
+    """
+    Sensor readings and irrigation state of one zone.
+
+    received is a bitmask over the sensor slots of the zone (its soil moisture sensors, then OTHER_SENSORS),
+    so checking a round for completeness is one integer comparison.
+    """
+
+    __slots__ = ("zone_id", "base_topic", "soil_moisture", "temperature", "humidity", "light_level", "rain_level",
+                 "water_flow", "sunrise_counter", "is_sunrise_time", "last_light_time", "has_irrigated_today", "day",
+                 "irrigating", "led_warning", "received", "expected", "deadline_job")
+
+    def __init__(self, zone_id, soil_sensors, base_topic):
+        self.zone_id = zone_id
+        self.base_topic = base_topic
+        self.soil_moisture = [None] * soil_sensors
+        self.temperature = None
+        self.humidity = None
+        self.light_level = None
+        self.rain_level = None
+        self.water_flow = None
+        self.sunrise_counter = 0
+        self.is_sunrise_time = False
+        self.last_light_time = None
+        self.has_irrigated_today = False
+        self.day = None
+        self.irrigating = False
+        self.led_warning = False
+        self.received = 0
+        self.expected = (1 << (soil_sensors + len(OTHER_SENSORS))) - 1
+        self.deadline_job = None
+
+    def reset_round(self):
+        for position in range(len(self.soil_moisture)):
+            self.soil_moisture[position] = None
+        self.temperature = None
+        self.humidity = None
+        self.rain_level = None
+        self.water_flow = None
+        self.received = 0
+        # light_level and the sunrise state carry over to the next round, as in ControlUnit
+
+
+class ZoneControlUnit:
+    """
+    Irrigation controller for many garden zones in one process.
+
+    All zones share one MQTT connection and one subscription, Garden/zones/+/sensors/#, and readings are
+    demultiplexed by the zone ID in the topic. A zone's round starts with its first reading and is
+    evaluated as soon as all its sensors have reported, or round_timeout seconds later on partial data.
+    Round deadlines and irrigation stops of every zone run on one shared Scheduler thread, and the zones
+    take their time from the scheduler's clock, so a scheduler on a VirtualClock simulates them. The pump and
+    LED of a zone are driven through MQTT commands on Garden/zones/<zoneID>/commands/waterpump and
+    Garden/zones/<zoneID>/actuators/LED, which DeviceConnectorAct subscribes to for its zoneID.
+    """
+
+    def __init__(self, broker, port, zones, client=None, scheduler=None, round_timeout=120, irrigation_duration=30):
+        self.clientID = "ZoneControlUnit"
+        self.topic_prefix = "Garden/zones/"
+        self.round_timeout = round_timeout
+        self.irrigation_duration = irrigation_duration
+
+        # Threshold setting, shared by all zones
+        self.moisture_threshold = 30
+        self.temperature_threshold = [4, 30]
+        self.rain_detected_level = 4
+        self.do_not_water_temp = 4
+        self.SUNRISE_LUX = 100
+        self.SUNRISE_BUFFER = 60
+
+        self.zones = {}
+        for zone in zones:
+            zone_id = zone["zoneID"]
+            self.zones[zone_id] = ZoneState(zone_id, zone.get("soilSensors", 9), self.topic_prefix + zone_id)
+        # Sensor name -> slot offset after the soil moisture sensors
+        self.sensor_slots = {name: position for position, name in enumerate(OTHER_SENSORS)}
+
+        self.lock = threading.Lock()
+        self.evaluations = 0
+        self.partial_evaluations = 0
+        self.irrigations = 0
+
+        # Irrigation stops are persistent jobs, so a pump left ON is switched off after a restart
+        self.scheduler = scheduler or Scheduler('zone_control_unit_schedule.json')
+        self.scheduler.register("stop_irrigation", self.stop_irrigation)
+        self.clock = self.scheduler.clock
+
+        self.client = client
+        if self.client is None:
+            self.client = MyMQTT(self.clientID, broker, port, self)
+            self.client.start()
+        self.client.mySubscribe(self.topic_prefix + "+/sensors/#")
+
+        if scheduler is None:
+            # Restored stops may run right away, so the client has to exist first
+            self.scheduler.start()
+
+    def notify(self, topic, payload):
+        # Garden/zones/<zoneID>/sensors/<sensor>[/<soil sensor number>]
+        levels = topic.split("/")
+        if len(levels) < 5 or levels[3] != "sensors":
+            return
+        zone = self.zones.get(levels[2])
+        if zone is None:
+            return
+
+        try:
+            value = SenML.decode(payload)[0]["v"]
+        except Exception as e:
+            print(f"Error decoding reading of zone {zone.zone_id} on {topic}: {e}")
+            return
+
+        with self.lock:
+            slot = self.store_reading(zone, levels[4:], value)
+            if slot is None or zone.irrigating:
+                return
+            if zone.received == 0:
+                zone.deadline_job = self.scheduler.schedule(self.round_timeout, self.round_deadline, zone)
+            zone.received |= 1 << slot
+            if zone.received == zone.expected:
+                self.scheduler.cancel(zone.deadline_job)
+                zone.deadline_job = None
+                self.evaluate(zone)
+
+    def store_reading(self, zone, sensor, value):
+        """
+        Store a reading in its zone and return the sensor slot, or None for an unknown sensor.
+        """
+        soil_count = len(zone.soil_moisture)
+        if sensor[0] == "soil_moisture":
+            if len(sensor) != 2 or not sensor[1].isdigit() or not 1 <= int(sensor[1]) <= soil_count:
+                return None
+            zone.soil_moisture[int(sensor[1]) - 1] = value
+            return int(sensor[1]) - 1
+        offset = self.sensor_slots.get(sensor[0])
+        if offset is None or len(sensor) != 1:
+            return None
+        if sensor[0] == "temperature":
+            zone.temperature = value
+        elif sensor[0] == "humidity":
+            zone.humidity = value
+        elif sensor[0] == "light":
+            self.handle_light(zone, value)
+        elif sensor[0] == "rain":
+            zone.rain_level = value
+        else:
+            zone.water_flow = value
+        return soil_count + offset
+
+    def handle_light(self, zone, value):
+        current_time = self.clock.time()
+        if zone.last_light_time is None:
+            zone.last_light_time = current_time
+        time_diff = (current_time - zone.last_light_time) / 60
+        zone.last_light_time = current_time
+        zone.light_level = value
+
+        if value < self.SUNRISE_LUX:
+            zone.sunrise_counter = max(0, zone.sunrise_counter - time_diff)
+        else:
+            zone.sunrise_counter = min(self.SUNRISE_BUFFER, zone.sunrise_counter + time_diff)
+
+        if zone.sunrise_counter == 0:
+            zone.is_sunrise_time = False
+        elif zone.sunrise_counter >= self.SUNRISE_BUFFER:
+            zone.is_sunrise_time = True
+
+    def round_deadline(self, zone):
+        with self.lock:
+            if zone.deadline_job is None or zone.received == 0:
+                return
+            zone.deadline_job = None
+            self.partial_evaluations += 1
+            self.evaluate(zone)
+
+    def evaluate(self, zone):
+        """
+        Decide on irrigation for a zone at the end of its round. Called with the lock held.
+        """
+        self.evaluations += 1
+        today = self.clock.now().date()
+        if zone.day != today:
+            zone.day = today
+            zone.has_irrigated_today = False
+
+        soil_values = [value for value in zone.soil_moisture if value is not None]
+        if not soil_values or zone.temperature is None or zone.light_level is None or zone.rain_level is None:
+            print(f"Zone {zone.zone_id}: not all necessary sensor data has been received.")
+            zone.reset_round()
+            return
+
+        should_irrigate, reasons = irrigation_decision(
+            zone.has_irrigated_today, zone.sunrise_counter, sum(soil_values) / len(soil_values), zone.temperature,
+            zone.rain_level, self.moisture_threshold, self.temperature_threshold, self.rain_detected_level,
+            self.do_not_water_temp, self.SUNRISE_BUFFER)
+        zone.reset_round()
+
+        if should_irrigate:
+            zone.irrigating = True
+            self.irrigations += 1
+            self.update_led_warning(zone, False)
+            self.publish_pump_command(zone, 1)
+            self.scheduler.schedule(self.irrigation_duration, "stop_irrigation", zone.zone_id,
+                                    key=f"stop_irrigation/{zone.zone_id}")
+        else:
+            self.update_led_warning(zone, bool(reasons))
+
+    def stop_irrigation(self, zone_id):
+        zone = self.zones.get(zone_id)
+        if zone is None:
+            print(f"Dropping irrigation stop of unknown zone {zone_id}")
+            return
+        with self.lock:
+            self.publish_pump_command(zone, 0)
+            # A stop restored after a restart only switches the pump off, the zone did not irrigate in this process
+            if zone.irrigating:
+                zone.irrigating = False
+                zone.has_irrigated_today = True
+
+    def publish_pump_command(self, zone, value):
+        self.client.myPublish(f"{zone.base_topic}/commands/waterpump", self.command_message(zone, "waterpump", value))
+
+    def update_led_warning(self, zone, warning_on):
+        if warning_on != zone.led_warning:
+            zone.led_warning = warning_on
+            self.client.myPublish(f"{zone.base_topic}/actuators/LED",
+                                  self.command_message(zone, "LED", 1 if warning_on else 0))
+
+    def command_message(self, zone, name, value):
+        return SenML.create_message(f"{zone.base_topic}/commands/", name, value, "binary",
+                                    self.clock.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+    def stop(self):
+        self.client.stop()
+        self.scheduler.stop()
+
+
+if __name__ == "__main__":
+    with open('setting_zones.json', 'r') as file:
+        config = json.load(file)
+    control_unit = ZoneControlUnit(config['broker'], config['port'], config['zones'])
+    try:
+        while True:
+            time.sleep(600)
+            print(f"Evaluations: {control_unit.evaluations} ({control_unit.partial_evaluations} on partial data), "
+                  f"irrigations: {control_unit.irrigations}")
+    except KeyboardInterrupt:
+        print("Zone control unit shutting down...")
+        control_unit.stop()
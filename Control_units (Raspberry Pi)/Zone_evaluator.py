@@ -0,0 +1,116 @@
+import numpy as np
+
+# Reason bit flags, in the order irrigation_decision lists its reasons
+IRRIGATED_TODAY = 1
+OUTSIDE_SUNRISE_WINDOW = 2
+MOISTURE_SUFFICIENT = 4
+TEMPERATURE_TOO_LOW = 8
+TEMPERATURE_TOO_HIGH = 16
+RAIN_DETECTED = 32
+TOO_COLD_TO_WATER = 64
+# Not a reason of irrigation_decision: the zone lacks the readings needed to decide
+MISSING_DATA = 128
+
+REASONS = [
+    (IRRIGATED_TODAY, "Irrigated today"),
+    (OUTSIDE_SUNRISE_WINDOW, "Not within the irrigation window before sunrise"),
+    (MOISTURE_SUFFICIENT, "Soil moisture is sufficient"),
+    (TEMPERATURE_TOO_LOW, "Temperature is too low"),
+    (TEMPERATURE_TOO_HIGH, "Temperature is too high"),
+    (RAIN_DETECTED, "Rain is detected"),
+    (TOO_COLD_TO_WATER, "Temperature is too low, not suitable for irrigation"),
+    (MISSING_DATA, "Not all necessary sensor data has been received"),
+]
+
+
+def reasons_from_flags(flags):
+    """
+    Turn the reason bit flags of one zone into the reason list irrigation_decision would return.
+    """
+    return [text for flag, text in REASONS if flags & flag]
+
+
+class ZoneEvaluator:
+    """
+    Irrigation decisions for a whole fleet of zones in one vectorized pass.
+
+    Zone state is held column-wise in NumPy arrays indexed by zone position; a missing reading is NaN.
+    evaluate() returns the irrigation mask and the reason bit flags of every zone and gives the same
+    decisions as irrigation_decision applied zone by zone, which stays the reference implementation.
+    """
+
+    def __init__(self, zone_count, soil_sensors=9, moisture_threshold=30, temperature_threshold=(4, 30),
+                 rain_detected_level=4, do_not_water_temp=4, sunrise_buffer=60):
+        self.moisture = np.full((zone_count, soil_sensors), np.nan)
+        self.temperature = np.full(zone_count, np.nan)
+        self.rain_level = np.full(zone_count, np.nan)
+        self.light_level = np.full(zone_count, np.nan)
+        self.sunrise_counter = np.zeros(zone_count)
+        self.has_irrigated_today = np.zeros(zone_count, dtype=bool)
+
+        self.moisture_threshold = moisture_threshold
+        self.temperature_threshold = temperature_threshold
+        self.rain_detected_level = rain_detected_level
+        self.do_not_water_temp = do_not_water_temp
+        self.sunrise_buffer = sunrise_buffer
+
+    @classmethod
+    def from_zones(cls, zones, **thresholds):
+        """
+        Build an evaluator from ZoneState objects, in the given order.
+        """
+        zones = list(zones)
+        soil_sensors = max((len(zone.soil_moisture) for zone in zones), default=0)
+        evaluator = cls(len(zones), soil_sensors, **thresholds)
+        for position, zone in enumerate(zones):
+            evaluator.set_zone(position, zone.soil_moisture, zone.temperature, zone.rain_level, zone.light_level,
+                               zone.sunrise_counter, zone.has_irrigated_today)
+        return evaluator
+
+    def set_zone(self, position, soil_moisture, temperature, rain_level, light_level, sunrise_counter,
+                 has_irrigated_today):
+        self.moisture[position] = np.nan
+        self.moisture[position, :len(soil_moisture)] = [np.nan if value is None else value for value in soil_moisture]
+        self.temperature[position] = np.nan if temperature is None else temperature
+        self.rain_level[position] = np.nan if rain_level is None else rain_level
+        self.light_level[position] = np.nan if light_level is None else light_level
+        self.sunrise_counter[position] = sunrise_counter
+        self.has_irrigated_today[position] = has_irrigated_today
+
+    def average_moisture(self):
+        """
+        Mean of the soil moisture readings of every zone, NaN for a zone without any.
+        """
+        readings = ~np.isnan(self.moisture)
+        counts = readings.sum(axis=1)
+        # Added column by column, in sensor order, to round like the scalar sum(); NumPy's pairwise sum
+        # along a row can land on the other side of the threshold
+        totals = np.zeros(len(self.moisture))
+        for column in range(self.moisture.shape[1]):
+            totals = totals + np.where(readings[:, column], self.moisture[:, column], 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return totals / counts
+
+    def evaluate(self):
+        """
+        Return (irrigate, flags): a boolean mask of the zones to irrigate and their reason bit flags.
+        """
+        average_moisture = self.average_moisture()
+        temperature = self.temperature
+        low, high = self.temperature_threshold
+
+        # NaN compares False everywhere, so zones with missing data only get MISSING_DATA
+        missing = np.isnan(average_moisture) | np.isnan(temperature) | np.isnan(self.rain_level) | \
+            np.isnan(self.light_level)
+        flags = np.zeros(len(temperature), dtype=np.uint8)
+        flags |= np.where(self.has_irrigated_today, IRRIGATED_TODAY, 0).astype(np.uint8)
+        flags |= np.where((self.sunrise_counter <= 0) | (self.sunrise_counter >= self.sunrise_buffer),
+                          OUTSIDE_SUNRISE_WINDOW, 0).astype(np.uint8)
+        with np.errstate(invalid='ignore'):
+            flags |= np.where(average_moisture >= self.moisture_threshold, MOISTURE_SUFFICIENT, 0).astype(np.uint8)
+            flags |= np.where(temperature < low, TEMPERATURE_TOO_LOW, 0).astype(np.uint8)
+            flags |= np.where(temperature > high, TEMPERATURE_TOO_HIGH, 0).astype(np.uint8)
+            flags |= np.where(self.rain_level >= self.rain_detected_level, RAIN_DETECTED, 0).astype(np.uint8)
+            flags |= np.where(temperature <= self.do_not_water_temp, TOO_COLD_TO_WATER, 0).astype(np.uint8)
+        flags = np.where(missing, MISSING_DATA, flags).astype(np.uint8)
+        return flags == 0, flags
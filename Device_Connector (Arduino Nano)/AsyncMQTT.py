@@ -0,0 +1,187 @@
+import json
+import struct
+import asyncio
+import inspect
+from collections import deque
+import paho.mqtt.client as PahoMQTT
+from MyMQTT import unpack_batch
+
+
+class AsyncMQTT:
+    """
+    asyncio counterpart of MyMQTT with the same start/mySubscribe/myPublish/notify contract.
+
+    The paho client runs on the event loop through its socket callbacks instead of a loop_start() thread,
+    so any number of clients can share one loop. Received messages go through a bounded queue to the
+    notifier; notify may be a plain method or a coroutine. When the queue is full the client stops
+    sees TCP backpressure.
+
+    When the connection drops, the client reconnects with exponential backoff between min_reconnect_delay
+    and max_reconnect_delay seconds, and subscribes again to its topics.
+    """
+
+    def __init__(self, clientID, broker, port, notifier, queue_size=1000, qos_policy=None, default_qos=2,
+                 min_reconnect_delay=1, max_reconnect_delay=60):
+        self.broker = broker
+        self.port = port
+        self.notifier = notifier
+        self.clientID = clientID
+        self.queue_size = queue_size
+        self._topics = []
+        self._isSubscriber = False
+        self._loop = None
+        self._queue = None
+        self._overflow = deque()
+        self._socket = None
+        self._reading_paused = False
+        self._tasks = []
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._reconnect_delay = min_reconnect_delay
+        # QoS per topic filter (e.g. {"Garden/sensors/#": 0}), the first matching filter wins
+        self.qos_policy = qos_policy or {}
+        self.default_qos = default_qos
+        self._qos_cache = {}
+        # create an instance of paho.mqtt.client
+        self._paho_mqtt = PahoMQTT.Client(clientID, True)
+        # register the callbacks
+        self._paho_mqtt.on_connect = self.myOnConnect
+        self._paho_mqtt.on_message = self.myOnMessageReceived
+        self._paho_mqtt.on_socket_open = self._on_socket_open
+        self._paho_mqtt.on_socket_close = self._on_socket_close
+        self._paho_mqtt.on_socket_register_write = self._on_socket_register_write
+        self._paho_mqtt.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def myOnConnect(self, paho_mqtt, userdata, flags, rc):
+        print("Connected to %s with result code: %d" % (self.broker, rc))
+        if rc == 0:
+            self._reconnect_delay = self.min_reconnect_delay
+
+    def myOnMessageReceived(self, paho_mqtt, userdata, msg):
+        # Runs on the event loop, inside loop_read
+        if msg.topic.endswith("/batch"):
+            try:
+                messages = list(unpack_batch(msg.payload))
+            except (ValueError, KeyError, IndexError, TypeError, struct.error) as e:
+                # Raising here would abort loop_read and stop the delivery of every subscription
+                print(f"Dropping malformed batch on topic {msg.topic}: {e}")
+                return
+        else:
+            messages = [(msg.topic, msg.payload)]
+        for message in messages:
+            if self._overflow or self._queue.full():
+                self._overflow.append(message)
+                self._pause_reading()
+            else:
+                self._queue.put_nowait(message)
+
+    def qos_for(self, topic):
+        qos = self._qos_cache.get(topic)
+        if qos is None:
+            qos = self.default_qos
+            for topic_filter, filter_qos in self.qos_policy.items():
+                if PahoMQTT.topic_matches_sub(topic_filter, topic):
+                    qos = filter_qos
+                    break
+            self._qos_cache[topic] = qos
+        return qos
+
+    def myPublish(self, topic, msg):
+        # publish a message with a certain topic, at the QoS configured for it
+        # str and bytes are already encoded (e.g. SenML.dumps output) and are sent as they are
+        payload = msg if isinstance(msg, (str, bytes)) else json.dumps(msg)
+        self._paho_mqtt.publish(topic, payload, self.qos_for(topic))
+
+    def mySubscribe(self, topic):
+        # subscribe for a topic
+        self._paho_mqtt.subscribe(topic, 2)
+        # just to remember that it works also as a subscriber
+        self._isSubscriber = True
+        self._topics.append(topic)
+        print("subscribed to %s" % (topic))
+
+    async def start(self):
+        # manage connection to broker on the running event loop
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._paho_mqtt.connect(self.broker, self.port)
+        self._tasks = [self._loop.create_task(self._misc_loop()), self._loop.create_task(self._dispatch_loop())]
+
+    def unsubscribe(self):
+        if (self._isSubscriber):
+            # remember to unsuscribe if it is working also as subscriber
+            self._paho_mqtt.unsubscribe(self._topics)
+
+    async def stop(self):
+        if (self._isSubscriber):
+            # remember to unsuscribe if it is working also as subscriber
+            self._paho_mqtt.unsubscribe(self._topics)
+
+        self._paho_mqtt.disconnect()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _dispatch_loop(self):
+        while True:
+            topic, payload = await self._queue.get()
+            while self._overflow and not self._queue.full():
+                self._queue.put_nowait(self._overflow.popleft())
+            if not self._overflow:
+                self._resume_reading()
+            try:
+                result = self.notifier.notify(topic, payload)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Error in notify for topic {topic}: {e}")
+
+    async def _misc_loop(self):
+        # keepalive pings, retries and reconnection, which loop_start() would otherwise do on its thread
+        while True:
+            if self._paho_mqtt.loop_misc() == PahoMQTT.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(1)
+                continue
+            # The connection is lost, the delay is reset once the broker accepts a connection again
+            await asyncio.sleep(self._reconnect_delay)
+            self._reconnect_delay = min(self._reconnect_delay * 2, self.max_reconnect_delay)
+            try:
+                # The new socket is registered on the loop by _on_socket_open
+                self._paho_mqtt.reconnect()
+            except OSError as e:
+                print(f"Reconnection to {self.broker} failed: {e}")
+                continue
+            if self._isSubscriber:
+                # The session is clean, so the broker forgot the subscriptions
+                for topic in self._topics:
+                    self._paho_mqtt.subscribe(topic, 2)
+
+    def _pause_reading(self):
+        if not self._reading_paused and self._socket is not None:
+            self._loop.remove_reader(self._socket)
+            self._reading_paused = True
+
+    def _resume_reading(self):
+        if self._reading_paused and self._socket is not None:
+            self._loop.add_reader(self._socket, self._paho_mqtt.loop_read)
+            self._reading_paused = False
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._socket = sock
+        if self._overflow:
+            # Reconnected while the notifier is still behind, _dispatch_loop resumes reading
+            self._reading_paused = True
+        else:
+            self._reading_paused = False
+            self._loop.add_reader(sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+        self._socket = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
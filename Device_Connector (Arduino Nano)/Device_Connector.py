@@ -1,17 +1,29 @@
-import time
 import json
-from MyMQTT import MyMQTT
+from MyMQTT import MyMQTT, pack_batch
+import SenML
+from Clock import RealClock
+import Metrics
 from Sensors import SoilMoistureSen, DHT22Sen, LightSen, RainSen, WaterFlowSen
 
+ROUND_SECONDS = Metrics.histogram("sensors_round_seconds", "Time to read and publish one round of all sensors")
+READINGS_PUBLISHED = Metrics.counter("sensors_readings_published_total", "Sensor readings published")
+
 class DeviceConnector:
-    def __init__(self, config_file):
+    def __init__(self, config_file, clock=None):
         """
         Initialize the DeviceConnector class, load the configuration file and set up the sensor.
+        The clock (a RealClock by default) times the readings and the sleep between rounds.
         """
+        self.clock = clock or RealClock()
         self.config = self.load_config(config_file)
         self.clientID = self.config['clientID']
         self.base_topic = self.config['baseTopic']
-        self.mqtt_client = MyMQTT(self.clientID, broker='mqtt.eclipseprojects.io', port=1883, notifier=None)
+        # Publish a whole sampling round as one SenML pack on <baseTopic>/batch instead of one message per reading
+        self.batch_publish = self.config.get('batchPublish', False)
+        # "cbor" publishes compact binary SenML instead of JSON text
+        self.binary_payload = self.config.get('payloadFormat', 'json') == 'cbor'
+        self.mqtt_client = MyMQTT(self.clientID, broker=self.config.get('broker', 'mqtt.eclipseprojects.io'),
+                                  port=self.config.get('port', 1883), notifier=None, qos_policy=self.config.get('qos'))
         self.mqtt_client.start()
         self.sensors = self.initialize_sensors()
 
@@ -40,10 +52,12 @@ class DeviceConnector:
                 sensors.append(WaterFlowSen(device['deviceID'], device['servicesDetails'][0]['topic']))
         return sensors
 
+    @Metrics.timed(ROUND_SECONDS)
     def collect_and_publish_data(self):
         """
         Collect sensor data and publish it via MQTT.
         """
+        messages = []
         for sensor in self.sensors:
             sensor_data = sensor.read()
 
@@ -56,10 +70,8 @@ class DeviceConnector:
                 elif isinstance(sensor, DHT22Sen):
                     temp_message = self.create_message(sensor.device_id, sensor_data['temperature'], '°C')
                     humidity_message = self.create_message(sensor.device_id, sensor_data['humidity'], '%')
-                    self.mqtt_client.myPublish(sensor.topic[0], temp_message)
-                    print(f"Publish a message to a topic {sensor.topic[0]}: {temp_message}")
-                    self.mqtt_client.myPublish(sensor.topic[1], humidity_message)
-                    print(f"Publish a message to a topic {sensor.topic[1]}: {humidity_message}")
+                    messages.append((sensor.topic[0], temp_message))
+                    messages.append((sensor.topic[1], humidity_message))
                     continue
                 elif isinstance(sensor, RainSen):
                     message = self.create_message(sensor.device_id, sensor_data, 'unknown')
@@ -69,32 +81,31 @@ class DeviceConnector:
                     message = self.create_message(sensor.device_id, sensor_data, 'unknown')
 
             topic = sensor.topic[0] if isinstance(sensor.topic, list) else sensor.topic
-            self.mqtt_client.myPublish(topic, message)
-            print(f"Publish a message to a topic {topic}: {message}")
+            messages.append((topic, message))
+
+        readings = len(messages)
+        if self.batch_publish:
+            messages = [(f"{self.base_topic}/batch", pack_batch(self.base_topic, messages))]
+        for topic, message in messages:
+            self.mqtt_client.myPublish(topic, SenML.dumps(message, binary=self.binary_payload))
+        READINGS_PUBLISHED.inc(readings)
+        print(f"Published {readings} readings{' in one batch' if self.batch_publish else ''}")
 
     def create_message(self, device_id, data, unit, timestamp=None):
         """
         Create a structured message for publishing, containing sensor data and unit information.
         """
         if timestamp is None:
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
+            timestamp = self.clock.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        msg = {
-            "bn": f"{self.base_topic}/sensors/{self.clientID}/{device_id}",
-            "e": [{
-                "n": f"sensor_{device_id}",
-                "v": data,
-                "u": unit,
-                "t": timestamp
-            }]
-        }
-        return msg
+        return SenML.create_message(f"{self.base_topic}/sensors/{self.clientID}/{device_id}",
+                                    f"sensor_{device_id}", data, unit, timestamp)
 
     def run(self):
         try:
             while True:
                 self.collect_and_publish_data()
-                time.sleep(600)  # Publish data from all sensors every 10 minutes
+                self.clock.sleep(600)  # Publish data from all sensors every 10 minutes
         except KeyboardInterrupt:
             self.stop()
 
@@ -107,6 +118,7 @@ class DeviceConnector:
 
 if __name__ == '__main__':
     config_file = 'setting_sen.json'
+    Metrics.serve(9102)
     device_connector = DeviceConnector(config_file)
     device_connector.run()
 
@@ -1,26 +1,39 @@
 import json
 import time
 import os
+import threading
 import cherrypy
 from MyMQTT import MyMQTT
+import SenML
+from TopicRouter import TopicRouter
 from Sensors import LED, WaterPump
+import Metrics
+
+NOTIFY_SECONDS = Metrics.histogram("actuators_notify_seconds", "DeviceConnectorAct.notify duration")
+REQUEST_SECONDS = Metrics.histogram("actuators_request_seconds", "Actuator REST request duration", ["method"])
+CATALOG_UPDATE_SECONDS = Metrics.histogram("actuators_catalog_update_seconds", "Time to write a status to catalog.json")
+PUMP_COMMANDS = Metrics.counter("actuators_pump_commands_total", "Water pump state changes", ["command"])
 
 class DeviceConnectorAct:
     exposed = True
 
-    def __init__(self, clientID, broker, port, base_topic, devicesList, catalog_path):
+    def __init__(self, clientID, broker, port, base_topic, devicesList, catalog_path, zone_id=None):
         """
         Initialize the DeviceConnectorAct class to set up the MQTT connection and initialize the device.
+        Without a zone_id the actuators follow the commands of every zone.
         """
         self.clientID = clientID
         self.broker = broker
         self.port = port
         self.base_topic = base_topic
+        # ZoneControlUnit publishes the commands of a zone under Garden/zones/<zoneID>
+        self.zone_topic = f"Garden/zones/{zone_id or '+'}"
         self.devicesList = devicesList
         self.catalog_path = catalog_path
 
-        # Initialize the MQTT client
-        self.mqtt_client = MyMQTT(self.clientID, self.broker, self.port, self)
+        # Initialize the MQTT client. Handlers rewrite the catalog file, so they run off the MQTT network thread;
+        # only the latest command per topic matters, so a backlog is coalesced
+        self.mqtt_client = MyMQTT(self.clientID, self.broker, self.port, self, workers=2, overflow="coalesce")
         self.mqtt_client.start()
 
         # Initialize the executor
@@ -30,10 +43,21 @@ class DeviceConnectorAct:
         # Initialization state
         self.led_state = "OFF"
         self.waterpump_state = "OFF"
+        # MQTT workers and REST requests both switch the pump and rewrite the catalog file
+        self.waterpump_lock = threading.Lock()
+
+        self.router = TopicRouter()
+        self.router.add(self.led.topic, lambda topic, message: self.handle_led(message))
+        self.router.add(self.waterpump.topic, lambda topic, message: self.handle_waterpump(message))
+        self.router.add(f"{self.zone_topic}/commands/waterpump", lambda topic, message: self.handle_waterpump(message))
+        self.router.add(f"{self.zone_topic}/actuators/LED", lambda topic, message: self.handle_led(message))
 
-        # Subscribe to topic
+        # Subscribe to the device topics and to the zone commands
         self.mqtt_client.mySubscribe(f"{self.base_topic}/#")
+        self.mqtt_client.mySubscribe(f"{self.zone_topic}/commands/waterpump")
+        self.mqtt_client.mySubscribe(f"{self.zone_topic}/actuators/LED")
 
+    @Metrics.timed(CATALOG_UPDATE_SECONDS)
     def update_catalog(self, device_id, status):
         """
        Updates the status of the device in the catalog.json file.
@@ -91,21 +115,19 @@ class DeviceConnectorAct:
     def stop(self):
         self.mqtt_client.stop()
 
+    @Metrics.timed(NOTIFY_SECONDS)
     def notify(self, topic, msg):
         """
         Process received MQTT messages.
         """
         print(f"Received message: {msg} from topic: {topic}")
         try:
-            message = json.loads(msg)
-        except json.JSONDecodeError:
+            message = SenML.loads(msg)
+        except ValueError:
             print("The message format is incorrect and cannot be parsed.")
             return
 
-        if "LED" in topic:
-            self.handle_led(message)
-        elif "waterpump" in topic:
-            self.handle_waterpump(message)
+        self.router.dispatch(topic, message)
 
     def handle_led(self, message):
         """
@@ -168,31 +190,34 @@ class DeviceConnectorAct:
         """
         Method to control the pump status. Can be called through REST API.
         """
-        if self.waterpump_state != command:
+        with self.waterpump_lock:
+            if self.waterpump_state == command:
+                print(f"Water pump is already {command}")
+                return {"status": "error", "message": f"Water pump is already {command}"}
             self.waterpump.set_state(command == "ON")
             self.waterpump_state = command
+            PUMP_COMMANDS.labels(command).inc()
             self.update_catalog('waterpump', command)
 
-            # Build and publish an MQTT message to update other subscribers
-            mqtt_message = {
-                "bn": f"{self.base_topic}/commands/waterpump",
-                "e": [
-                    {
-                        "n": "waterpump",
-                        "v": 1 if command == "ON" else 0,
-                        "u": "binary",
-                        "t": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
-                    }
-                ]
-            }
-            self.mqtt_client.myPublish(f"{self.base_topic}/commands/waterpump", mqtt_message)
-            print(f"Publishing MQTT message: {mqtt_message}")
-            return {"status": "success", "message": f"Water pump turned {command}"}
-        else:
-            print(f"Water pump is already {command}")
-            return {"status": "error", "message": f"Water pump is already {command}"}
+        # Build and publish an MQTT message to update other subscribers. It goes to the status topic, on the
+        # command topic it would come back to handle_waterpump
+        mqtt_message = {
+            "bn": f"{self.base_topic}/status/waterpump",
+            "e": [
+                {
+                    "n": "waterpump",
+                    "v": 1 if command == "ON" else 0,
+                    "u": "binary",
+                    "t": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
+                }
+            ]
+        }
+        self.mqtt_client.myPublish(f"{self.base_topic}/status/waterpump", mqtt_message)
+        print(f"Publishing MQTT message: {mqtt_message}")
+        return {"status": "success", "message": f"Water pump turned {command}"}
 
     @cherrypy.tools.json_out()
+    @Metrics.timed(REQUEST_SECONDS.labels("GET"))
     def GET(self, *uri, **params):
         """
         Get the current status of the pump.
@@ -204,6 +229,7 @@ class DeviceConnectorAct:
 
     @cherrypy.tools.json_in()
     @cherrypy.tools.json_out()
+    @Metrics.timed(REQUEST_SECONDS.labels("POST"))
     def POST(self, *uri, **params):
         """
         Change the pump status.
@@ -237,9 +263,11 @@ if __name__ == '__main__':
         port=config['port'],
         base_topic=config['baseTopic'],
         devicesList=config['devicesList'],
-        catalog_path=catalog_path)
+        catalog_path=catalog_path,
+        zone_id=config.get('zoneID'))
 
     cherrypy.tree.mount(device_connector_act, '/garden/actuators', cherrypy_config)
+    cherrypy.tree.mount(Metrics.MetricsPage(), '/metrics', cherrypy_config)
     cherrypy.server.socket_host = '127.0.0.1'
     cherrypy.server.socket_port = 8080
     cherrypy.engine.start()
@@ -1,4 +1,5 @@
 from Device_Connector import DeviceConnector
+import Metrics
 
 
 class DCInstancer:
@@ -7,6 +8,7 @@ class DCInstancer:
         self.device_connector = None
 
     def start(self):
+        Metrics.serve(9102)
         self.device_connector = DeviceConnector(self.config_file)
         self.device_connector.run()
 
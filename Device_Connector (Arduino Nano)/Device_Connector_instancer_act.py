@@ -1,6 +1,7 @@
 import json
 import cherrypy
 from Device_Connector_act import DeviceConnectorAct
+import Metrics
 
 
 class DCInstancerAct:
@@ -45,6 +46,7 @@ class DCInstancerAct:
         }
 
         cherrypy.tree.mount(self.device_connector_act, '/garden/actuators', cherrypy_config)
+        cherrypy.tree.mount(Metrics.MetricsPage(), '/metrics', cherrypy_config)
         cherrypy.server.socket_host = '127.0.0.1'
         cherrypy.server.socket_port = 8080
         cherrypy.engine.start()
@@ -0,0 +1,150 @@
+import time
+import numpy as np
+import SenML
+from MyMQTT import pack_batch
+
+
+class SensorFleet:
+    """
+    Simulates the sensors of many gardens at once, as arrays of gardens x time steps.
+
+    Every garden has soil_sensors soil moisture sensors plus temperature, humidity, light, rain and water
+    flow, like the setting_sen.json garden. The readings follow simple physical processes instead of
+    independent random draws: light follows a clear-sky day curve dimmed by clouds, temperature a daily
+    cycle plus weather noise, humidity moves against temperature and rises with rain, rain comes in
+    spells from a two-state Markov chain, and soil moisture dries with heat and light and is wetted by
+    rain and irrigation. Time only advances in generate(), so simulated weeks take seconds.
+    """
+
+    def __init__(self, gardens, soil_sensors=9, step=600, start_time=None, seed=None, sunrise_hour=6.0,
+                 sunset_hour=20.0, peak_lux=1000.0, rain_start_probability=0.01, rain_stop_probability=0.15):
+        self.rng = np.random.default_rng(seed)
+        self.gardens = gardens
+        self.soil_sensors = soil_sensors
+        self.step = step
+        self.time = time.time() if start_time is None else start_time
+        self.sunrise_hour = sunrise_hour
+        self.sunset_hour = sunset_hour
+        self.peak_lux = peak_lux
+        self.rain_start_probability = rain_start_probability
+        self.rain_stop_probability = rain_stop_probability
+
+        # Per garden climate and per sensor calibration
+        self.mean_temperature = self.rng.normal(18, 4, gardens)
+        self.temperature_swing = self.rng.uniform(4, 8, gardens)
+        self.sensor_offset = self.rng.normal(0, 2, (gardens, soil_sensors))
+        self.drying_rate = self.rng.uniform(0.05, 0.15, (gardens, soil_sensors))
+        # Process state
+        self.soil_moisture = self.rng.uniform(30, 60, (gardens, soil_sensors))
+        self.weather = np.zeros(gardens)
+        self.clouds = self.rng.uniform(0, 0.5, gardens)
+        self.raining = np.zeros(gardens, dtype=bool)
+        self.irrigation_left = np.zeros(gardens)
+
+    def irrigate(self, gardens, duration):
+        """
+        Start irrigating the given gardens (index array or boolean mask) for duration seconds.
+        """
+        self.irrigation_left[gardens] = duration
+
+    def generate(self, steps):
+        """
+        Advance the simulation by steps time steps and return the readings:
+        {"time": (steps,), "soil_moisture": (steps, gardens, soil_sensors), and (steps, gardens) arrays for
+        "temperature", "humidity", "light", "rain" and "water_flow"}.
+        """
+        gardens = self.gardens
+        times = self.time + self.step * np.arange(1, steps + 1)
+        readings = {
+            "time": times,
+            "soil_moisture": np.empty((steps, gardens, self.soil_sensors), dtype=np.float32),
+            "temperature": np.empty((steps, gardens), dtype=np.float32),
+            "humidity": np.empty((steps, gardens), dtype=np.float32),
+            "light": np.empty((steps, gardens), dtype=np.float32),
+            "rain": np.empty((steps, gardens), dtype=np.float32),
+            "water_flow": np.empty((steps, gardens), dtype=np.float32),
+        }
+        # Hour of the local day, like the rest of the system
+        hours = np.array([moment.tm_hour + moment.tm_min / 60 + moment.tm_sec / 3600
+                          for moment in map(time.localtime, times.tolist())])
+        daylight = np.clip(np.sin(np.pi * (hours - self.sunrise_hour) / (self.sunset_hour - self.sunrise_hour)), 0,
+                           None) * ((hours > self.sunrise_hour) & (hours < self.sunset_hour))
+        # Warmest in mid afternoon
+        daily_cycle = np.sin(2 * np.pi * (hours - 9) / 24)
+        # Persistence of the AR(1) weather and cloud processes per step
+        persistence = np.exp(-self.step / 21600)
+
+        for index in range(steps):
+            starts = self.rng.random(gardens) < self.rain_start_probability
+            stops = self.rng.random(gardens) < self.rain_stop_probability
+            self.raining = (self.raining & ~stops) | (~self.raining & starts)
+            rain = np.where(self.raining, np.minimum(self.rng.gamma(2.0, 1.5, gardens), 10.0), 0.0)
+
+            self.weather = persistence * self.weather + self.rng.normal(0, 1.0, gardens) * np.sqrt(1 - persistence ** 2)
+            self.clouds = np.clip(persistence * self.clouds + (1 - persistence) * np.where(self.raining, 0.9, 0.2) +
+                                  self.rng.normal(0, 0.05, gardens), 0, 1)
+
+            light = self.peak_lux * daylight[index] * (1 - 0.8 * self.clouds) + self.rng.normal(0, 2, gardens)
+            temperature = (self.mean_temperature + self.temperature_swing * daily_cycle[index] + 2 * self.weather -
+                           2 * self.raining + self.rng.normal(0, 0.3, gardens))
+            humidity = np.clip(60 - 2.5 * (temperature - self.mean_temperature) + 25 * self.raining +
+                               self.rng.normal(0, 2, gardens), 15, 100)
+
+            irrigating = self.irrigation_left > 0
+            water_flow = np.where(irrigating, self.rng.normal(2.5, 0.2, gardens), 0.0)
+            self.irrigation_left = np.maximum(self.irrigation_left - self.step, 0)
+
+            # Evaporation grows with temperature and sunlight; rain and irrigation wet every sensor of a garden
+            evaporation = np.clip(temperature, 0, None) / 20 + light / self.peak_lux
+            # Wet soil loses water faster than dry soil
+            wetting = 0.5 * rain + 0.4 * water_flow * min(self.step, 600) / 60
+            drying = self.drying_rate * evaporation[:, None] * self.soil_moisture / 40 * self.step / 600
+            self.soil_moisture = np.clip(self.soil_moisture - drying + wetting[:, None], 0, 100)
+
+            readings["soil_moisture"][index] = np.clip(self.soil_moisture + self.sensor_offset +
+                                                       self.rng.normal(0, 0.5, self.soil_moisture.shape), 0, 100)
+            readings["temperature"][index] = temperature
+            readings["humidity"][index] = humidity
+            readings["light"][index] = np.clip(light, 0, None)
+            readings["rain"][index] = rain
+            readings["water_flow"][index] = water_flow
+
+        self.time = times[-1]
+        return readings
+
+    def stream(self, publish, steps, rate=None, base_topic="Garden/zones", garden_ids=None, batch=True):
+        """
+        Generate steps time steps and hand the readings to publish(topic, message) as SenML, addressed to
+        <base_topic>/<gardenID>/sensors/... like the zones of ZoneControlUnit.
+
+        With batch, each garden's step goes out as one pack on <base_topic>/<gardenID>/batch. rate limits
+        the output to that many readings per second; None sends as fast as possible.
+        Returns the number of readings sent.
+        """
+        garden_ids = garden_ids or [f"zone{garden}" for garden in range(self.gardens)]
+        names = [f"soil_moisture/{sensor + 1}" for sensor in range(self.soil_sensors)] + \
+            ["temperature", "humidity", "light", "rain", "water_flow"]
+        units = ["%"] * self.soil_sensors + ["°C", "%", "lux", "unknown", "L/min"]
+        readings = self.generate(steps)
+        sent = 0
+        started = time.perf_counter()
+        for index, timestamp in enumerate(readings["time"].tolist()):
+            columns = np.concatenate([readings["soil_moisture"][index],
+                                      np.stack([readings[name][index] for name in names[self.soil_sensors:]], axis=1)],
+                                     axis=1).astype(np.float64).round(2).tolist()
+            for garden, values in zip(garden_ids, columns):
+                garden_topic = f"{base_topic}/{garden}"
+                messages = [(f"{garden_topic}/sensors/{name}", SenML.create_message(
+                    f"{garden_topic}/sensors/{name}", name, value, unit, timestamp))
+                    for name, value, unit in zip(names, values, units)]
+                if batch:
+                    publish(f"{garden_topic}/batch", pack_batch(garden_topic, messages))
+                else:
+                    for topic, message in messages:
+                        publish(topic, message)
+                sent += len(messages)
+                if rate:
+                    ahead = sent / rate - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        return sent
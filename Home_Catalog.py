@@ -1,43 +1,358 @@
 import cherrypy
 import json
+import threading
+import time
+from collections import deque
+from Catalog_locks import SectionLocks
+from Catalog_storage import JournalStorage, JsonFileStorage, SQLiteStorage
+from Catalog_watch import WatchServer
+import Metrics
+
+REQUEST_SECONDS = Metrics.histogram("catalog_request_seconds", "Home Catalog REST request duration", ["method"])
+SAVE_SECONDS = Metrics.histogram("catalog_save_seconds", "Time to record a catalog mutation with the storage backend")
 
 
 class HomeCatalog:
     exposed = True
 
-    def __init__(self, json_file):
+    def __init__(self, json_file, flush_interval=0, storage=None, max_watchers=8, cache_enabled=True):
+        """
+        flush_interval is the largest acceptable data-loss window in seconds. With 0 every change
+        is written before the request returns, otherwise changes are written behind by a flusher thread.
+        storage is the persistence backend, by default a journal next to the json_file snapshot.
+        max_watchers bounds how many server threads long-poll watch requests may hold at once.
+        cache_enabled keeps the encoded GET responses until a mutation invalidates them.
+        """
         self.json_file = json_file
+        self.flush_interval = flush_interval
+        self.storage = storage if storage is not None else JournalStorage(json_file)
+        self.dirty = False
+        self.flush_lock = threading.Lock()
+        # Readers of a section never block each other, a writer only blocks its own section
+        self.locks = SectionLocks()
+        # Revisions restart with every process, the epoch keeps ETags of an earlier run from matching
+        self.epoch = int(time.time())
+        self.revision = 0
+        self.section_revisions = {}
+        self.item_revisions = {}
+        self.item_status = {}
+        self.revision_lock = threading.Lock()
+        # Watchers wait on this condition, every mutation wakes them up
+        self.change_condition = threading.Condition(self.revision_lock)
+        self.watch_slots = threading.BoundedSemaphore(max_watchers)
+        # Called with (section, item_id) after every mutation, under the revision lock
+        self.change_listeners = []
+        self.changes = deque(maxlen=1000)
+        # (section, item_id or None) -> (encoded JSON body, ETag)
+        self.cache_enabled = cache_enabled
+        self.response_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stop_event = threading.Event()
         self.load_data()
+        Metrics.add_collector(self.metrics_samples)
+
+        self.flusher = None
+        if self.flush_interval > 0:
+            self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+            self.flusher.start()
 
     def load_data(self):
-        with open(self.json_file, 'r') as file:
-            self.data = json.load(file)
+        self.data = self.storage.load()
+        self.build_index()
 
-    def save_data(self):
-        with open(self.json_file, 'w') as file:
-            json.dump(self.data, file, indent=4)
+    def build_index(self):
+        """
+        Build the per-section index mapping each item ID to its position in the section list.
+        """
+        self.index = {}
+        for section, items in self.data.items():
+            if isinstance(items, list):
+                self.index[section] = self.index_items(section, items)
 
-    @cherrypy.tools.json_out()
+    def index_items(self, section, items, start=0, index=None):
+        """
+        Index the items of a section starting at the given position.
+        """
+        id_key = f"{section[:-1]}ID"
+        if index is None:
+            index = {}
+        for position in range(start, len(items)):
+            item_id = items[position].get(id_key)
+            if item_id is not None:
+                index.setdefault(item_id, position)
+        return index
+
+    def find_item(self, section, item_id):
+        """
+        Return the position of an item in its section, or None if it does not exist.
+        """
+        return self.index.get(section, {}).get(item_id)
+
+    @Metrics.timed(SAVE_SECONDS)
+    def save_data(self, entry):
+        """
+        Record a mutation entry (see Catalog_storage.apply_entry) with the storage backend.
+        Called while holding the write lock of the mutated section.
+        """
+        self.storage.append(entry)
+        self.dirty = True
+        self.invalidate(entry)
+        with self.revision_lock:
+            self.revision += 1
+            self.section_revisions[entry["section"]] = self.revision
+            if "item" in entry:
+                key = (entry["section"], entry["item"].get(f"{entry['section'][:-1]}ID"))
+                self.item_status[key] = entry["item"].get("status")
+            else:
+                key = (entry["section"], entry["id"])
+                if entry["op"] == "delete":
+                    self.item_status[key] = None
+                elif "status" in entry["changes"]:
+                    self.item_status[key] = entry["changes"]["status"]
+            self.item_revisions[key] = self.revision
+            # Stored encoded, the entry refers to dictionaries that later requests keep changing
+            self.changes.append((self.revision, json.dumps(dict(entry, revision=self.revision))))
+            self.change_condition.notify_all()
+            for listener in self.change_listeners:
+                listener(key)
+
+    def invalidate(self, entry):
+        """
+        Drop the cached responses a mutation entry makes stale. Called while holding the section write lock.
+        """
+        section = entry["section"]
+        id_key = f"{section[:-1]}ID"
+        renamed = entry["op"] == "update" and entry["changes"].get(id_key, entry["id"]) != entry["id"]
+        if entry["op"] == "command" or renamed:
+            # Commands are trimmed to the last 20 and a rename moves an item, so drop the whole section
+            for key in list(self.response_cache):
+                if key[0] == section:
+                    self.response_cache.pop(key, None)
+        else:
+            item_id = entry["item"].get(id_key) if "item" in entry else entry["id"]
+            self.response_cache.pop((section, None), None)
+            self.response_cache.pop((section, item_id), None)
+
+    def commit(self):
+        """
+        Called after the section lock is released. Without write-behind the change is on disk
+        before the request returns, otherwise the flusher coalesces all changes of the interval.
+        """
+        if self.flush_interval == 0 and not self.flush():
+            raise cherrypy.HTTPError(500, "Error writing catalog")
+
+    def flush(self):
+        """
+        Write pending changes to disk, if there are any. Returns False if the write failed,
+        the changes then stay pending for the next flush.
+        """
+        with self.flush_lock:
+            if not self.dirty:
+                return True
+            self.dirty = False
+            try:
+                with self.locks.read_all(list(self.data)):
+                    self.storage.flush(self.data)
+            except Exception as e:
+                self.dirty = True
+                cherrypy.log(f"Error writing catalog: {str(e)}")
+                return False
+            return True
+
+    def flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        """
+        Stop the flusher and write any pending changes. Subscribed to the cherrypy engine stop.
+        """
+        self.stop_event.set()
+        with self.change_condition:
+            self.change_condition.notify_all()
+        if self.flusher is not None:
+            self.flusher.join()
+        Metrics.remove_collector(self.metrics_samples)
+        self.flush()
+        with self.flush_lock, self.locks.read_all(list(self.data)):
+            self.storage.close(self.data)
+
+    def metrics_samples(self):
+        """
+        Response cache and revision figures as metrics collector samples.
+        """
+        return [
+            ("catalog_cache_hits_total", "counter", "GET responses served from the response cache", {},
+             self.cache_hits),
+            ("catalog_cache_misses_total", "counter", "GET responses rendered because they were not cached", {},
+             self.cache_misses),
+            ("catalog_cache_entries", "gauge", "Encoded responses in the response cache", {}, len(self.response_cache)),
+            ("catalog_revision", "gauge", "Mutations since the catalog started", {}, self.revision),
+        ]
+
+    def encode(self, value):
+        # Encoded here instead of by json_out so that it happens while the section is read-locked
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return json.dumps(value).encode('utf-8')
+
+    def check_etag(self, etag):
+        """
+        Set the ETag of the response and answer 304 Not Modified if the client already has that revision.
+        """
+        cherrypy.response.headers['ETag'] = etag
+        if_none_match = cherrypy.request.headers.get('If-None-Match')
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            raise cherrypy.HTTPRedirect([], 304)
+
+    @Metrics.timed(REQUEST_SECONDS.labels("GET"))
     def GET(self, *path, **params):
         if len(path) == 0:
-            return "Welcome to HomeCatalog API"
+            return self.encode("Welcome to HomeCatalog API")
 
         section = path[0]
+        if section == "commands" and len(path) == 1 and params:
+            return self.get_command_history(**params)
+        if section == "changes" and len(path) == 1:
+            return self.get_changes(**params)
+        if section == "watch" and len(path) == 3:
+            return self.watch(path[1], path[2], **params)
         if section in self.data:
-            if len(path) > 1:
-                item_id = path[1]
-                items = self.data[section]
-                for item in items:
-                    if item.get(f"{section[:-1]}ID") == item_id:
-                        return item
-                raise cherrypy.NotFound()
+            item_id = path[1] if len(path) > 1 else None
+            # Hits are served without locking: a mutation invalidates its entries before its request returns
+            cached = self.response_cache.get((section, item_id))
+            if cached is None:
+                self.cache_misses += 1
+                cached = self.render(section, item_id)
             else:
-                return self.data[section]
+                self.cache_hits += 1
+            body, etag = cached
+            self.check_etag(etag)
+            cherrypy.response.headers['Content-Type'] = 'application/json'
+            return body
         else:
             raise cherrypy.NotFound()
 
+    def render(self, section, item_id):
+        """
+        Encode a section or one of its items together with its ETag, and cache the result.
+        """
+        with self.locks.read(section):
+            if item_id is None:
+                value = self.data[section]
+                etag = f'"{self.epoch}-{section}-{self.section_revisions.get(section, 0)}"'
+            else:
+                position = self.find_item(section, item_id)
+                if position is None:
+                    raise cherrypy.NotFound()
+                value = self.data[section][position]
+                etag = f'"{self.epoch}-{section}/{item_id}-{self.item_revisions.get((section, item_id), 0)}"'
+            rendered = (json.dumps(value).encode('utf-8'), etag)
+            if self.cache_enabled:
+                self.response_cache[(section, item_id)] = rendered
+            return rendered
+
+    def get_changes(self, since=0, epoch=None):
+        """
+        GET /garden/changes?since=<rev> returns the mutations after revision since. When they are
+        no longer retained, or epoch shows the revision belongs to an earlier run, "reset" tells the
+        client to fetch the sections again.
+        """
+        try:
+            since = int(since)
+        except ValueError:
+            raise cherrypy.HTTPError(400, "since must be an integer")
+        with self.revision_lock:
+            revision = self.revision
+            changes = [change for change_revision, change in self.changes if change_revision > since]
+            oldest = self.changes[0][0] if self.changes else revision + 1
+        reset = (epoch is not None and str(epoch) != str(self.epoch)) or since > revision or since < oldest - 1
+        if reset:
+            changes = []
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return (f'{{"epoch": {self.epoch}, "revision": {revision}, "reset": {json.dumps(reset)}, '
+                f'"changes": [{", ".join(changes)}]}}').encode('utf-8')
+
+    def watch(self, section, item_id, since=None, status=None, timeout=30):
+        """
+        GET /garden/watch/<section>/<id>?since=<rev>&status=<status>&timeout=<s> long-polls one item.
+
+        Returns as soon as the item changes after revision since (by default, after the request arrived),
+        or as soon as its status equals status, or when the timeout expires.
+        Every waiting request holds a server thread, so at most max_watchers wait at once and the others get
+        503; Catalog_watch.WatchServer serves the same long poll without a thread per waiter.
+        """
+        if section not in self.index:
+            raise cherrypy.NotFound()
+        try:
+            timeout = min(max(float(timeout), 0), 60)
+            since = int(since) if since is not None else None
+        except ValueError:
+            raise cherrypy.HTTPError(400, "since and timeout must be numbers")
+
+        if not self.watch_slots.acquire(blocking=False):
+            # Keep server threads free for ordinary requests
+            cherrypy.response.headers['Retry-After'] = '1'
+            raise cherrypy.HTTPError(503, "Too many watchers")
+        try:
+            key, since, current_status = self.watch_start(section, item_id, since)
+            with self.change_condition:
+                timed_out = not self.change_condition.wait_for(
+                    lambda: self.watch_done(key, since, status, current_status), timeout)
+        finally:
+            self.watch_slots.release()
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return self.watch_result(section, item_id, timed_out)
+
+    def watch_start(self, section, item_id, since=None):
+        """
+        Return the (section, item_id) key of a watched item, the revision to watch from and its current status.
+        """
+        key = (section, item_id)
+        with self.locks.read(section):
+            position = self.find_item(section, item_id)
+            current_status = self.data[section][position].get("status") if position is not None else None
+        with self.revision_lock:
+            if since is None:
+                since = self.item_revisions.get(key, 0)
+        return key, since, current_status
+
+    def watch_done(self, key, since, status, current_status):
+        """
+        Whether a watch on key can return. Called while holding the revision lock.
+        """
+        if self.stop_event.is_set():
+            return True
+        if status is not None:
+            return self.item_status.get(key, current_status) == status
+        return self.item_revisions.get(key, 0) > since
+
+    def watch_result(self, section, item_id, timed_out):
+        """
+        Encoded response of a finished watch.
+        """
+        with self.revision_lock:
+            revision = self.item_revisions.get((section, item_id), 0)
+        with self.locks.read(section):
+            position = self.find_item(section, item_id)
+            item = self.data[section][position] if position is not None else None
+            return json.dumps({"revision": revision, "timed_out": timed_out, "item": item}).encode('utf-8')
+
+    def get_command_history(self, device=None, since=None, limit=100, cursor=None):
+        """
+        GET /garden/commands?device=...&since=...&limit=...&cursor=... pages through the command history.
+        """
+        try:
+            limit = min(max(int(limit), 1), 1000)
+        except ValueError:
+            raise cherrypy.HTTPError(400, "limit must be an integer")
+        with self.locks.read("commands"):
+            commands, next_cursor = self.storage.query_commands(self.data, device, since, limit, cursor)
+            return self.encode({"commands": commands, "next_cursor": next_cursor})
+
     @cherrypy.tools.json_in()
     @cherrypy.tools.json_out()
+    @Metrics.timed(REQUEST_SECONDS.labels("POST"))
     def POST(self, *path, **params):
         try:
             if len(path) == 0:
@@ -46,22 +361,32 @@ class HomeCatalog:
             section = path[0]
             if section == "commands":
                 return self.add_command()
+            elif section in ["actuators", "sensors"] and path[1:] == ("batch",):
+                return self.add_devices(section)
             elif section in ["actuators", "sensors"]:
                 return self.add_device(section)
             else:
                 return {"error": "Invalid section"}
 
+        except cherrypy.HTTPError:
+            raise
         except Exception as e:
             cherrypy.log(f"Error in POST method: {str(e)}")
             return {"error": "An unexpected error occurred", "details": str(e)}
 
     def add_command(self):
         new_command = cherrypy.request.json
-        new_command["commandID"] = f"cmd{len(self.data['commands']) + 1}"
-        self.data['commands'].append(new_command)
-        if len(self.data['commands']) > 20:
-            self.data['commands'] = self.data['commands'][-20:]
-        self.save_data()
+        with self.locks.write('commands'):
+            new_command["commandID"] = f"cmd{len(self.data['commands']) + 1}"
+            self.data['commands'].append(new_command)
+            if len(self.data['commands']) > 20:
+                self.data['commands'] = self.data['commands'][-20:]
+                self.index['commands'] = self.index_items('commands', self.data['commands'])
+            else:
+                self.index_items('commands', self.data['commands'], len(self.data['commands']) - 1,
+                                 self.index['commands'])
+            self.save_data({"op": "command", "section": "commands", "item": new_command})
+        self.commit()
         return {"message": "Command added successfully", "commandID": new_command["commandID"]}
 
     def add_device(self, section):
@@ -72,15 +397,97 @@ class HomeCatalog:
 
         item_id = new_item[id_key]
 
-        if any(item.get(id_key) == item_id for item in self.data[section]):
-            return {"error": f"{section.capitalize()} with {id_key} {item_id} already exists"}
+        with self.locks.write(section):
+            if self.find_item(section, item_id) is not None:
+                return {"error": f"{section.capitalize()} with {id_key} {item_id} already exists"}
 
-        self.data[section].append(new_item)
-        self.save_data()
+            self.data[section].append(new_item)
+            self.index[section][item_id] = len(self.data[section]) - 1
+            self.save_data({"op": "add", "section": section, "item": new_item})
+        self.commit()
         return {"message": f"{section.capitalize()} added successfully", id_key: item_id}
 
+    def add_devices(self, section):
+        """
+        POST /garden/<section>/batch adds an array of devices: all of them are validated in one pass,
+        then either all are added and persisted with a single write, or none is.
+        """
+        new_items = cherrypy.request.json
+        if not isinstance(new_items, list):
+            return {"error": "A list of devices is required"}
+        id_key = f"{section[:-1]}ID"
+
+        with self.locks.write(section):
+            results = []
+            seen = set()
+            for new_item in new_items:
+                item_id = new_item.get(id_key) if isinstance(new_item, dict) else None
+                if item_id is None:
+                    results.append({id_key: None, "error": f"{id_key} is required"})
+                elif item_id in seen or self.find_item(section, item_id) is not None:
+                    results.append({id_key: item_id,
+                                    "error": f"{section.capitalize()} with {id_key} {item_id} already exists"})
+                else:
+                    results.append({id_key: item_id, "message": "added"})
+                seen.add(item_id)
+
+            applied = all("error" not in result for result in results)
+            if applied:
+                for new_item in new_items:
+                    self.data[section].append(new_item)
+                    self.index[section][new_item[id_key]] = len(self.data[section]) - 1
+                    self.save_data({"op": "add", "section": section, "item": new_item})
+        if applied:
+            self.commit()
+            return {"message": f"{len(new_items)} {section} added successfully", "applied": True, "results": results}
+        for result in results:
+            if "error" not in result:
+                result["message"] = "not applied"
+        return {"error": f"No {section} added, the batch contains invalid devices", "applied": False,
+                "results": results}
+
+    def update_devices(self, section):
+        """
+        PUT /garden/<section>/batch applies an array of updates, each carrying the ID of its device,
+        with the same all-or-nothing validation as add_devices.
+        """
+        updates = cherrypy.request.json
+        if not isinstance(updates, list):
+            return {"error": "A list of updates is required"}
+        id_key = f"{section[:-1]}ID"
+
+        with self.locks.write(section):
+            results = []
+            for update_data in updates:
+                item_id = update_data.get(id_key) if isinstance(update_data, dict) else None
+                if item_id is None:
+                    results.append({id_key: None, "error": f"{id_key} is required"})
+                elif self.find_item(section, item_id) is None:
+                    results.append({id_key: item_id,
+                                    "error": f"{section.capitalize()} with {id_key} {item_id} not found"})
+                elif update_data.get('status', 'ON') not in ['ON', 'OFF', 'active', 'inactive']:
+                    results.append({id_key: item_id, "error": "Invalid status value"})
+                else:
+                    results.append({id_key: item_id, "message": "updated"})
+
+            applied = all("error" not in result for result in results)
+            if applied:
+                for update_data in updates:
+                    item_id = update_data[id_key]
+                    self.data[section][self.find_item(section, item_id)].update(update_data)
+                    self.save_data({"op": "update", "section": section, "id": item_id, "changes": update_data})
+        if applied:
+            self.commit()
+            return {"message": f"{len(updates)} {section} updated successfully", "applied": True, "results": results}
+        for result in results:
+            if "error" not in result:
+                result["message"] = "not applied"
+        return {"error": f"No {section} updated, the batch contains invalid updates", "applied": False,
+                "results": results}
+
     @cherrypy.tools.json_in()
     @cherrypy.tools.json_out()
+    @Metrics.timed(REQUEST_SECONDS.labels("PUT"))
     def PUT(self, *path, **params):
         if len(path) < 2:
             return {"error": "Invalid path"}
@@ -88,22 +495,29 @@ class HomeCatalog:
         section, item_id = path[0], path[1]
         if section not in self.data:
             return {"error": "Invalid section"}
+        if section in ["actuators", "sensors"] and path[1:] == ("batch",):
+            return self.update_devices(section)
 
         id_key = f"{section[:-1]}ID"
-        items = self.data[section]
-        for index, item in enumerate(items):
-            if item.get(id_key) == item_id:
-                update_data = cherrypy.request.json
-                if 'status' in update_data:
-                    if update_data['status'] not in ['ON', 'OFF', 'active', 'inactive']:
-                        return {"error": "Invalid status value"}
-                items[index].update(update_data)
-                self.save_data()
-                return {"message": f"{section.capitalize()} updated successfully", id_key: item_id}
-
-        return {"error": f"{section.capitalize()} with {id_key} {item_id} not found"}
+        update_data = cherrypy.request.json
+        with self.locks.write(section):
+            position = self.find_item(section, item_id)
+            if position is None:
+                return {"error": f"{section.capitalize()} with {id_key} {item_id} not found"}
+
+            if 'status' in update_data:
+                if update_data['status'] not in ['ON', 'OFF', 'active', 'inactive']:
+                    return {"error": "Invalid status value"}
+            self.data[section][position].update(update_data)
+            if update_data.get(id_key, item_id) != item_id:
+                # The item was renamed, so move its index entry to the new ID
+                self.index[section] = self.index_items(section, self.data[section])
+            self.save_data({"op": "update", "section": section, "id": item_id, "changes": update_data})
+        self.commit()
+        return {"message": f"{section.capitalize()} updated successfully", id_key: item_id}
 
     @cherrypy.tools.json_out()
+    @Metrics.timed(REQUEST_SECONDS.labels("DELETE"))
     def DELETE(self, *path, **params):
         if len(path) < 2:
             return {"error": "Invalid path"}
@@ -113,14 +527,26 @@ class HomeCatalog:
             return {"error": "Can only delete actuators or sensors"}
 
         id_key = f"{section[:-1]}ID"
-        items = self.data[section]
-        for index, item in enumerate(items):
-            if item.get(id_key) == item_id:
-                del items[index]
-                self.save_data()
-                return {"message": f"{section.capitalize()} deleted successfully", id_key: item_id}
+        with self.locks.write(section):
+            position = self.find_item(section, item_id)
+            if position is None:
+                return {"error": f"{section.capitalize()} with {id_key} {item_id} not found"}
 
-        return {"error": f"{section.capitalize()} with {id_key} {item_id} not found"}
+            items = self.data[section]
+            del items[position]
+            # Only the items after the deleted one change position
+            section_index = self.index[section]
+            del section_index[item_id]
+            for new_position in range(position, len(items)):
+                moved_id = items[new_position].get(id_key)
+                if moved_id is None:
+                    continue
+                old_position = section_index.get(moved_id)
+                if old_position is None or old_position > new_position:
+                    section_index[moved_id] = new_position
+            self.save_data({"op": "delete", "section": section, "id": item_id})
+        self.commit()
+        return {"message": f"{section.capitalize()} deleted successfully", id_key: item_id}
 
 if __name__ == '__main__':
     conf = {
@@ -132,8 +558,27 @@ if __name__ == '__main__':
         }
     }
 
-    cherrypy.tree.mount(HomeCatalog('catalog.json'), '/garden', conf)
+    flush_interval = 1  # Largest acceptable data-loss window in seconds, 0 writes every change synchronously
+    storage_backend = 'journal'  # 'journal', 'json' or 'sqlite'
+    storages = {
+        'journal': lambda: JournalStorage('catalog.json'),
+        'json': lambda: JsonFileStorage('catalog.json'),
+        'sqlite': lambda: SQLiteStorage('catalog.db', json_file='catalog.json'),
+    }
+    thread_pool = 30
+    max_watchers = 20  # Long polls on /garden/watch each hold one of the thread_pool server threads
+    watch_port = 8081  # WatchServer long polls hold no thread, use this port for many waiting clients
+    catalog = HomeCatalog('catalog.json', flush_interval=flush_interval, storage=storages[storage_backend](),
+                          max_watchers=max_watchers)
+    watch_server = WatchServer(catalog, port=watch_port)
+    watch_server.start()
+    cherrypy.engine.subscribe('stop', watch_server.stop)
+    cherrypy.engine.subscribe('stop', catalog.stop)
+
+    cherrypy.tree.mount(catalog, '/garden', conf)
+    cherrypy.tree.mount(Metrics.MetricsPage(), '/metrics', conf)
     cherrypy.config.update({'server.socket_host': '127.0.0.1'})
     cherrypy.config.update({'server.socket_port': 8080})
+    cherrypy.config.update({'server.thread_pool': thread_pool})
     cherrypy.engine.start()
     cherrypy.engine.block()
@@ -0,0 +1,127 @@
+import time
+import heapq
+import itertools
+import threading
+from datetime import datetime
+
+
+class RealClock:
+    """
+    Wall-clock time and blocking waits, what the components use in production.
+    """
+    virtual = False
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        return event.wait(timeout)
+
+    def wait_for(self, condition, predicate, timeout=None):
+        """
+        condition.wait_for(predicate, timeout), the condition must be held by the caller.
+        """
+        return condition.wait_for(predicate, timeout)
+
+    def call_at(self, when, callback, *args):
+        timer = threading.Timer(max(0.0, when - time.time()), callback, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+class _Timer:
+    __slots__ = ("when", "sequence", "callback", "args", "cancelled")
+
+    def __init__(self, when, sequence, callback, args):
+        self.when = when
+        self.sequence = sequence
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.sequence) < (other.when, other.sequence)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """
+    Simulated time that only moves when a component sleeps or waits, or when advance_to() is called.
+
+    Timers registered with call_at() run on the thread that moves the clock, in due order, with the clock
+    set to their due time. Waiting for an event or a condition runs the timers up to the timeout and stops
+    as soon as the predicate holds, so a control loop waiting for readings or for the end of an irrigation
+    returns as soon as a timer (a replayed message, a scheduler job) produces them, without wall-clock delays.
+    A simulated week then runs at CPU speed. Meant to be driven from a single thread.
+    """
+    virtual = True
+
+    def __init__(self, start=None):
+        self.current = time.time() if start is None else start
+        self.timers = []
+        self.sequence = itertools.count()
+        self.lock = threading.RLock()
+
+    def time(self):
+        return self.current
+
+    def now(self):
+        return datetime.fromtimestamp(self.current)
+
+    def call_at(self, when, callback, *args):
+        timer = _Timer(when, next(self.sequence), callback, args)
+        with self.lock:
+            heapq.heappush(self.timers, timer)
+        return timer
+
+    def next_timer(self):
+        with self.lock:
+            while self.timers and self.timers[0].cancelled:
+                heapq.heappop(self.timers)
+            return self.timers[0].when if self.timers else None
+
+    def run_next(self, until):
+        """
+        Run the earliest timer due at or before until and return whether there was one.
+        """
+        with self.lock:
+            when = self.next_timer()
+            if when is None or when > until:
+                return False
+            timer = heapq.heappop(self.timers)
+            self.current = max(self.current, timer.when)
+        timer.callback(*timer.args)
+        return True
+
+    def advance_to(self, when):
+        while self.run_next(when):
+            pass
+        self.current = max(self.current, when)
+
+    def sleep(self, seconds):
+        self.advance_to(self.current + seconds)
+
+    def wait_for(self, condition, predicate, timeout=None):
+        """
+        Run timers until predicate() holds, for at most timeout simulated seconds. Without a timeout
+        the wait ends when no timer is left. The condition is not needed and only kept for symmetry.
+        """
+        deadline = None if timeout is None else self.current + timeout
+        while not predicate():
+            if not self.run_next(float("inf") if deadline is None else deadline):
+                if deadline is not None:
+                    self.current = max(self.current, deadline)
+                return predicate()
+        return True
+
+    def wait(self, event, timeout=None):
+        return self.wait_for(None, event.is_set, timeout)
@@ -0,0 +1,243 @@
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+from MyMQTT import MyMQTT, unpack_batch
+from TopicRouter import TopicRouter
+from Clock import VirtualClock
+
+# Log records: a topic definition gives a topic an ID the first time it is seen, a message refers to it
+TOPIC_RECORD = 0
+MESSAGE_RECORD = 1
+TOPIC_HEADER = struct.Struct("<BHH")      # type, topic ID, topic length
+MESSAGE_HEADER = struct.Struct("<BdHI")   # type, timestamp, topic ID, payload length
+
+
+class LogWriter:
+    """
+    Appends MQTT messages to a compact binary log. Topics are written once and then referred to by ID.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.topics = {}
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def write(self, timestamp, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self.lock:
+            topic_id = self.topics.get(topic)
+            if topic_id is None:
+                topic_id = self.topics[topic] = len(self.topics)
+                encoded = topic.encode('utf-8')
+                self.file.write(TOPIC_HEADER.pack(TOPIC_RECORD, topic_id, len(encoded)) + encoded)
+            self.file.write(MESSAGE_HEADER.pack(MESSAGE_RECORD, timestamp, topic_id, len(payload)) + payload)
+            self.count += 1
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_log(path):
+    """
+    Yield the (timestamp, topic, payload) messages of a log in recording order.
+    A record cut short by a crash of the recorder ends the log.
+    """
+    topics = {}
+    with open(path, 'rb') as file:
+        data = file.read()
+    position = 0
+    while position < len(data):
+        if data[position] == TOPIC_RECORD:
+            if position + TOPIC_HEADER.size > len(data):
+                return
+            _, topic_id, length = TOPIC_HEADER.unpack_from(data, position)
+            position += TOPIC_HEADER.size
+            topics[topic_id] = data[position:position + length].decode('utf-8')
+            position += length
+        else:
+            if position + MESSAGE_HEADER.size > len(data):
+                return
+            _, timestamp, topic_id, length = MESSAGE_HEADER.unpack_from(data, position)
+            position += MESSAGE_HEADER.size
+            if position + length > len(data):
+                return
+            yield timestamp, topics[topic_id], data[position:position + length]
+            position += length
+
+
+class Recorder:
+    """
+    MQTT notifier that writes everything it receives to a log, stamped with the reception time.
+    """
+
+    def __init__(self, path):
+        self.writer = LogWriter(path)
+
+    def notify(self, topic, payload):
+        self.writer.write(time.time(), topic, payload)
+
+    def close(self):
+        self.writer.close()
+
+
+class LocalBroker:
+    """
+    In-process stand-in for an MQTT broker. publish() hands the message to every subscribed client
+    synchronously, in subscription order, so a replay gives the same result every time.
+    """
+
+    def __init__(self):
+        self.router = TopicRouter()
+        self.published = 0
+
+    def subscribe(self, topic_filter, client):
+        self.router.add(topic_filter, client.deliver)
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.published += 1
+        self.router.dispatch(topic, payload)
+
+
+class LocalClient:
+    """
+    Client of a LocalBroker with the interface of MyMQTT, to put in place of MyMQTT in a component.
+    """
+
+    def __init__(self, clientID, broker, notifier):
+        self.clientID = clientID
+        self.broker = broker
+        self.notifier = notifier
+        self._topics = []
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def mySubscribe(self, topic):
+        self.broker.subscribe(topic, self)
+        self._topics.append(topic)
+
+    def unsubscribe(self):
+        pass
+
+    def myPublish(self, topic, msg):
+        payload = msg if isinstance(msg, (str, bytes)) else json.dumps(msg)
+        self.broker.publish(topic, payload)
+
+    def deliver(self, topic, payload):
+        # Batches are split like MyMQTT does before calling notify
+        if topic.endswith("/batch"):
+            for message_topic, message in unpack_batch(payload):
+                self.notifier.notify(message_topic, message)
+        else:
+            self.notifier.notify(topic, payload)
+
+
+class Replayer:
+    """
+    Publishes the messages of a log again, with the original spacing divided by speed.
+
+    speed=1 replays in real time, speed=1000 a thousand times faster, and speed=None as fast as
+    possible. The virtual clock (by default one starting at the first message) is advanced to each
+    message's recorded time just before the message is published, running the timers due before it,
+    so components reading the clock see the recorded timeline whatever the speed.
+
+    schedule() instead puts the messages on the clock as timers, for a simulation driven by the
+    components' own sleeps and waits.
+    """
+
+    def __init__(self, path, publish, speed=1.0, clock=None):
+        self.path = path
+        self.publish = publish
+        self.speed = speed
+        self.clock = clock
+        self.messages = None
+
+    def run(self, duration=None):
+        """
+        Replay the log, or its first duration seconds, and return (messages, recorded seconds, wall seconds).
+        """
+        count = 0
+        first = last = None
+        started = time.perf_counter()
+        for timestamp, topic, payload in read_log(self.path):
+            if first is None:
+                first = timestamp
+                if self.clock is None:
+                    self.clock = VirtualClock(timestamp)
+            if duration is not None and timestamp - first > duration:
+                break
+            last = timestamp
+            if self.speed:
+                delay = (timestamp - first) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            self.clock.advance_to(timestamp)
+            self.publish(topic, payload)
+            count += 1
+        return count, (last - first) if count else 0.0, time.perf_counter() - started
+
+    def schedule(self):
+        """
+        Publish every message of the log when the clock reaches its recorded time. Only the next message
+        is on the clock at any time, so the log is not loaded into timers all at once.
+        """
+        if self.clock is None:
+            raise ValueError("schedule() needs the VirtualClock of the simulation")
+        self.messages = read_log(self.path)
+        self.schedule_next()
+
+    def schedule_next(self):
+        message = next(self.messages, None)
+        if message is not None:
+            self.clock.call_at(message[0], self.deliver, message[1], message[2])
+
+    def deliver(self, topic, payload):
+        self.publish(topic, payload)
+        self.schedule_next()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record Garden MQTT traffic to a log, or replay a log")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("log")
+    parser.add_argument("--broker", default="mqtt.eclipseprojects.io")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--topic", default="Garden/#")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        recorder = Recorder(args.log)
+        client = MyMQTT("GardenRecorder", args.broker, args.port, recorder)
+        client.start()
+        client.mySubscribe(args.topic)
+        try:
+            while True:
+                time.sleep(10)
+                recorder.writer.flush()
+                print(f"Recorded {recorder.writer.count} messages")
+        except KeyboardInterrupt:
+            client.stop()
+            recorder.close()
+    else:
+        client = MyMQTT("GardenReplayer", args.broker, args.port, None)
+        client.start()
+        messages, recorded, elapsed = Replayer(args.log, client.myPublish, args.speed or None).run()
+        print(f"Replayed {messages} messages covering {recorded:.0f} s in {elapsed:.1f} s")
+        client.stop()
+        sys.exit(0)
@@ -0,0 +1,81 @@
+class _Node:
+    __slots__ = ("children", "handlers", "multi_level_handlers")
+
+    def __init__(self):
+        self.children = {}
+        # Handlers of filters ending at this node, and of filters ending with "#" right below it
+        self.handlers = []
+        self.multi_level_handlers = []
+
+
+class TopicRouter:
+    """
+    Routes MQTT topics to the handlers registered for matching topic filters.
+
+    Filters follow MQTT wildcard semantics: "+" matches exactly one level and "#", only allowed as the
+    last level, matches the parent level and any number of levels below it. Filters are stored in a trie
+    keyed by level, so routing a message is one walk over its topic levels, whatever the number of filters.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.count = 0
+
+    def add(self, topic_filter, handler):
+        """
+        Register handler(topic, *args) for a topic filter.
+        """
+        levels = topic_filter.split("/")
+        if "#" in levels[:-1] or any(("#" in level or "+" in level) and len(level) > 1 for level in levels):
+            raise ValueError(f"Invalid topic filter {topic_filter}")
+
+        node = self.root
+        for level in levels:
+            if level == "#":
+                node.multi_level_handlers.append((self.count, handler))
+                break
+            node = node.children.setdefault(level, _Node())
+        else:
+            node.handlers.append((self.count, handler))
+        self.count += 1
+
+    def match(self, topic):
+        """
+        Return the handlers whose filters match the topic, in registration order.
+        """
+        levels = topic.split("/")
+        # Wildcards at the first level do not match topics starting with "$" (MQTT 4.7.2)
+        system_topic = topic.startswith("$")
+        matches = []
+        nodes = [self.root]
+        for depth, level in enumerate(levels):
+            next_nodes = []
+            for node in nodes:
+                if node.multi_level_handlers and not (system_topic and depth == 0):
+                    matches.extend(node.multi_level_handlers)
+                child = node.children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+                if not (system_topic and depth == 0):
+                    child = node.children.get("+")
+                    if child is not None:
+                        next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                break
+        for node in nodes:
+            matches.extend(node.handlers)
+            # "a/#" also matches "a"
+            matches.extend(node.multi_level_handlers)
+        if len(matches) > 1:
+            matches.sort(key=lambda match: match[0])
+        return [handler for _, handler in matches]
+
+    def dispatch(self, topic, *args):
+        """
+        Call every handler matching the topic and return how many were called.
+        """
+        handlers = self.match(topic)
+        for handler in handlers:
+            handler(topic, *args)
+        return len(handlers)
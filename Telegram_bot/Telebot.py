@@ -1,12 +1,13 @@
 import telepot
 import time
 import datetime
-import threading
 from telepot.loop import MessageLoop
 from telepot.namedtuple import InlineKeyboardMarkup, InlineKeyboardButton
 import requests
 import json
 from MyMQTT import MyMQTT
+from Scheduler import Scheduler
+import SenML
 import logging
 
 # Configure logging
@@ -25,14 +26,21 @@ class IcscBot:
         self.topics = topics
         self.home_catalog_url = home_catalog_url
         self.thingspeak_config = thingspeak_config
-        self.irrigation_timer = None
         self.last_chat_id = None
+        # Last actuator list and its ETag, so unchanged status is answered with 304 Not Modified
+        self.actuators_etag = None
+        self.actuators = None
 
-        # Create MyMQTT instance
-        self.client_mqtt = MyMQTT(clientID, broker, port, self)
+        # Create MyMQTT instance; notify makes Telegram HTTP calls, so it runs off the MQTT network thread
+        self.client_mqtt = MyMQTT(clientID, broker, port, self, workers=2, overflow="drop_oldest")
+
+        # Pump auto-off, saved with its deadline so it still happens if the bot restarts in between
+        self.scheduler = Scheduler('bot_schedule.json')
+        self.scheduler.register("auto_turn_off_pump", self.auto_turn_off_pump)
 
     def start(self):
         MessageLoop(self.bot, self.callback_dict).run_as_thread()
+        self.scheduler.start()
         self.client_mqtt.start()
         self.client_mqtt.mySubscribe(self.topics["LED"])
         logging.info(f"Subscribed to {self.topics['LED']}")
@@ -76,17 +84,23 @@ class IcscBot:
 
     def get_device_status(self):
         try:
-            response = requests.get(f"{self.home_catalog_url}/garden/actuators")
-            if response.status_code == 200:
+            headers = {'If-None-Match': self.actuators_etag} if self.actuators_etag else {}
+            response = requests.get(f"{self.home_catalog_url}/garden/actuators", headers=headers)
+            if response.status_code == 304:
+                actuators = self.actuators
+            elif response.status_code == 200:
                 actuators = response.json()
-                logging.debug(f"Raw actuator data: {actuators}")
-                status_text = "Current Device Status:\n"
-                for actuator in actuators:
-                    status_text += f"{actuator['actuatorName']}: {actuator['status']}\n"
-                return status_text
+                self.actuators = actuators
+                self.actuators_etag = response.headers.get('ETag')
             else:
                 logging.error(f"Failed to get device status. Status code: {response.status_code}")
                 return "Failed to get device status."
+
+            logging.debug(f"Raw actuator data: {actuators}")
+            status_text = "Current Device Status:\n"
+            for actuator in actuators:
+                status_text += f"{actuator['actuatorName']}: {actuator['status']}\n"
+            return status_text
         except requests.RequestException as e:
             logging.error(f"Error getting device status: {str(e)}")
             return f"Error getting device status: {str(e)}"
@@ -160,26 +174,17 @@ class IcscBot:
 
                 if action == "turn_on":
                     self.last_chat_id = chat_ID
-                    if self.irrigation_timer:
-                        self.irrigation_timer.cancel()
-                    self.irrigation_timer = threading.Timer(600, self.auto_turn_off_pump)
-                    self.irrigation_timer.start()
+                    # Replaces the auto-off of an earlier turn_on
+                    self.scheduler.schedule(600, "auto_turn_off_pump", chat_ID, key="pump_auto_off")
                     message += " The pump will automatically turn off after 10 minutes."
-                elif action == "turn_off" and self.irrigation_timer:
-                    self.irrigation_timer.cancel()
-                    self.irrigation_timer = None
-
-                for i in range(5):
-                    time.sleep(1)
-                    current_status = self.get_device_status()
-                    logging.debug(f"Attempt {i + 1}: Current status after command: {current_status}")
-                    if ("Water Pump: ON" in current_status and action == "turn_on") or \
-                            ("Water Pump: OFF" in current_status and action == "turn_off"):
-                        logging.info("Pump status successfully updated and confirmed.")
-                        break
+                elif action == "turn_off":
+                    self.scheduler.cancel_key("pump_auto_off")
+
+                if self.wait_for_status(pump_id, status_payload["status"], timeout=5):
+                    logging.info("Pump status successfully updated and confirmed.")
                 else:
                     message += " However, the status may not have updated immediately. Please check again later."
-                    logging.warning("Pump status not confirmed after 5 attempts.")
+                    logging.warning("Pump status not confirmed within 5 seconds.")
             else:
                 message = f"Failed to {action.replace('turn_', '').replace('on', 'turn on').replace('off', 'turn off')} the water pump. Server response: {response.text}"
                 logging.error(f"Failed to control pump. Server response: {response.text}")
@@ -193,13 +198,28 @@ class IcscBot:
             logging.error(f"Unexpected error in control_pump: {str(e)}")
             return f"An unexpected error occurred: {str(e)}"
 
-    def auto_turn_off_pump(self):
+    def wait_for_status(self, device_id, status, timeout):
+        """
+        Block on the catalog watch endpoint until the actuator reaches the given status or the timeout expires.
+        """
+        try:
+            response = requests.get(f"{self.home_catalog_url}/garden/watch/actuators/{device_id}",
+                                    params={"status": status, "timeout": timeout}, timeout=timeout + 5)
+            response.raise_for_status()
+            result = response.json()
+            logging.debug(f"Watch result for {device_id}: {result}")
+            return not result["timed_out"] and result["item"] is not None and result["item"].get("status") == status
+        except requests.RequestException as e:
+            logging.error(f"Error watching device status: {str(e)}")
+            return False
+
+    def auto_turn_off_pump(self, chat_ID=None):
         logging.info("Auto turning off pump after 10 minutes")
-        response = self.control_pump('turn_off', self.last_chat_id)
-        if self.last_chat_id:
-            self.bot.sendMessage(self.last_chat_id,
+        chat_ID = chat_ID or self.last_chat_id
+        response = self.control_pump('turn_off', chat_ID)
+        if chat_ID:
+            self.bot.sendMessage(chat_ID,
                                  "Irrigation completed. The water pump has been automatically turned off.")
-        self.irrigation_timer = None
 
     def update_command_history(self, device_id, command_type):
         try:
@@ -222,19 +242,10 @@ class IcscBot:
         logging.debug(f"Received MQTT message on topic {topic}: {payload}")
         if topic == self.topics["LED"]:
             try:
-                # First, decode the bytes to string if necessary
-                if isinstance(payload, bytes):
-                    payload = payload.decode('utf-8')
-
-                # Then, parse the JSON string
-                msg = json.loads(payload)
-
-                # If the message is still a string, parse it again
-                if isinstance(msg, str):
-                    msg = json.loads(msg)
-
-                led_state = msg["e"][0]["v"]
-                timestamp = msg["e"][0]["t"]
+                # Also accepts packs double-encoded by older publishers
+                record = SenML.decode(payload)[0]
+                led_state = record["v"]
+                timestamp = record["t"]
 
                 if led_state == 1:
                     alert_message = f"🚨 ALERT: LED Warning Activated! 🚨\n"
@@ -291,5 +302,6 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logging.info("Bot stopped by user.")
     finally:
+        bot.scheduler.stop()
         bot.client_mqtt.stop()
         logging.info("MQTT client stopped.")
\ No newline at end of file
@@ -1,7 +1,13 @@
 import time
-import json
-from statistics import mean
 from MyMQTT import MyMQTT
+import SenML
+from TopicRouter import TopicRouter
+from RollingStats import RollingWindow
+
+# The soil moisture sensors all publish once in the same round, every 10 minutes, so a 5 minute window of
+# SOIL_MOISTURE_SENSORS readings holds the last round
+SOIL_MOISTURE_WINDOW = 300
+SOIL_MOISTURE_SENSORS = 9
 
 
 class ThingSpeakAdapter:
@@ -12,37 +18,41 @@ class ThingSpeakAdapter:
         self.ts_client._paho_mqtt.username_pw_set(THINGSPEAK_MQTT_USERNAME, THINGSPEAK_MQTT_PASSWORD)
 
         self.data_buffer = {}
-        self.soil_moisture_values = []
+        self.soil_moisture = RollingWindow(window=SOIL_MOISTURE_WINDOW, capacity=SOIL_MOISTURE_SENSORS)
+        # Soil moisture sensor IDs heard from in the current round
+        self.soil_moisture_round = set()
         self.last_send_time = 0
 
+        self.router = TopicRouter()
+        self.router.add("Garden/sensors/soil_moisture/+", self.handle_soil_moisture)
+        self.router.add("Garden/sensors/temperature", lambda topic, value: self.buffer_field("field3", value))
+        self.router.add("Garden/sensors/humidity", lambda topic, value: self.buffer_field("field1", value))
+        self.router.add("Garden/sensors/light", lambda topic, value: self.buffer_field("field2", value))
+        self.router.add("Garden/sensors/rain", lambda topic, value: self.buffer_field("field5", value))
+        self.router.add("Garden/sensors/water_flow", lambda topic, value: self.buffer_field("field6", value))
+
     def notify(self, topic, payload):
-        print(f"Received message on topic {topic}: {payload.decode()}")
+        print(f"Received message on topic {topic}: {payload.decode(errors='replace')}")
         try:
-            payload = json.loads(payload.decode())
-            event = payload["e"][0]
-            value = event['v']
-
-            if "soil_moisture" in topic:
-                self.soil_moisture_values.append(value)
-                if len(self.soil_moisture_values) == 9:
-                    avg_soil_moisture = mean(self.soil_moisture_values)
-                    self.data_buffer["field4"] = f"{avg_soil_moisture:.2f}"
-                    self.soil_moisture_values.clear()
-            elif "temperature" in topic:
-                self.data_buffer["field3"] = f"{value:.2f}"
-            elif "humidity" in topic:
-                self.data_buffer["field1"] = f"{value:.2f}"
-            elif "light" in topic:
-                self.data_buffer["field2"] = f"{value:.2f}"
-            elif "rain" in topic:
-                self.data_buffer["field5"] = f"{value:.2f}"
-            elif "water_flow" in topic:
-                self.data_buffer["field6"] = f"{value:.2f}"
+            value = SenML.decode(payload)[0]["v"]
 
-            self.send_to_thingspeak()
+            self.router.dispatch(topic, value)
         except Exception as e:
             print(f"Error processing message: {e}")
 
+    def handle_soil_moisture(self, topic, value):
+        self.soil_moisture.add(value)
+        self.soil_moisture_round.add(topic.rsplit("/", 1)[1])
+        # Publish the average only once every sensor of the round has reported
+        if len(self.soil_moisture_round) == SOIL_MOISTURE_SENSORS:
+            self.data_buffer["field4"] = f"{self.soil_moisture.mean():.2f}"
+            self.soil_moisture_round.clear()
+            self.send_to_thingspeak()
+
+    def buffer_field(self, field, value):
+        self.data_buffer[field] = f"{value:.2f}"
+        self.send_to_thingspeak()
+
     def send_to_thingspeak(self):
         current_time = time.time()
         if current_time - self.last_send_time >= 15 and self.data_buffer:  # ThingSpeak limits updates to once every 15 seconds
@@ -0,0 +1,339 @@
+import os
+import time
+import bisect
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set GARDEN_METRICS=0 to turn instrumentation off: metrics are then created as a shared no-op object
+# and timed() returns functions unchanged, so instrumented code runs as if it was not instrumented
+ENABLED = os.environ.get("GARDEN_METRICS", "1") != "0"
+
+# Latency buckets in seconds, from 0.1 ms to 10 s
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterValue:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class GaugeValue(CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return Span(self)
+
+
+class Span:
+    """
+    Times a block, as a context manager, and records its duration in a histogram when it ends.
+    """
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Metric:
+    """
+    A named metric with optional labels. Without labels it is used directly (inc, set, observe, time);
+    with labels, labels(*values) returns the value of one label combination, to be looked up once and kept.
+    """
+    kind = None
+
+    def __init__(self, name, help_text, label_names=(), value_factory=None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.value_factory = value_factory
+        self.values = {}
+        self.lock = threading.Lock()
+        if not self.label_names:
+            self.default = self.labels()
+            for method in ("inc", "dec", "set", "observe", "time"):
+                if hasattr(self.default, method):
+                    setattr(self, method, getattr(self.default, method))
+
+    def labels(self, *values):
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        value = self.values.get(values)
+        if value is None:
+            with self.lock:
+                value = self.values.setdefault(values, self.value_factory())
+        return value
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name, format_labels(self.label_names, label_values), value.value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names, CounterValue)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names, GaugeValue)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, label_names, lambda: HistogramValue(self.buckets))
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            with value.lock:
+                counts, total, count = list(value.counts), value.sum, value.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names + ("le",), label_values + (format_value(bound),))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class NullMetric:
+    """
+    Stand-in for every metric and metric value when instrumentation is disabled.
+    """
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_METRIC = NullMetric()
+
+
+class Registry:
+    """
+    The metrics of one process, rendered in the Prometheus text exposition format.
+
+    Collectors are functions called at every scrape that return (name, kind, help, labels, value) tuples,
+    for figures an object already keeps (a cache hit count, a queue depth) and that need no instrumentation.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def add_collector(self, collector):
+        with self.lock:
+            self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self.lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+
+        described = set()
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Error in metrics collector: {e}")
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{format_labels(tuple(labels), tuple(labels.values()))} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, label_names=()):
+    return REGISTRY.register(Counter(name, help_text, label_names)) if ENABLED else NULL_METRIC
+
+
+def gauge(name, help_text, label_names=()):
+    return REGISTRY.register(Gauge(name, help_text, label_names)) if ENABLED else NULL_METRIC
+
+
+def histogram(name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, label_names, buckets)) if ENABLED else NULL_METRIC
+
+
+def add_collector(collector):
+    if ENABLED:
+        REGISTRY.add_collector(collector)
+
+
+def remove_collector(collector):
+    REGISTRY.remove_collector(collector)
+
+
+def timed(histogram_value):
+    """
+    Decorator recording the duration of every call in a histogram (or one labelled value of it).
+    With instrumentation disabled the function is returned as it is.
+    """
+    def decorator(function):
+        if histogram_value is NULL_METRIC:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram_value.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class MetricsPage:
+    """
+    CherryPy resource serving the process metrics, to be mounted on /metrics with the MethodDispatcher.
+    """
+    exposed = True
+
+    def GET(self, *uri, **params):
+        import cherrypy
+        cherrypy.response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        if not ENABLED:
+            return "# Metrics are disabled (GARDEN_METRICS=0)\n"
+        return REGISTRY.render()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = (REGISTRY.render() if ENABLED else "# Metrics are disabled (GARDEN_METRICS=0)\n").encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    """
+    Serve /metrics on a background thread, for services without a CherryPy app. Returns the server.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,279 @@
+import json
+import time
+import struct
+import threading
+from collections import deque
+import paho.mqtt.client as PahoMQTT
+import SenML
+import Metrics
+
+MQTT_PUBLISHED = Metrics.counter("mqtt_published_total", "MQTT messages published", ["client"])
+MQTT_RECEIVED = Metrics.counter("mqtt_received_total", "MQTT messages received, a batch counting as its readings",
+                                ["client"])
+MQTT_HANDLER_SECONDS = Metrics.histogram("mqtt_handler_seconds", "notify call duration on the dispatcher workers",
+                                         ["client"])
+
+
+def pack_batch(base_topic, messages):
+    """
+    Pack the SenML messages of one sampling round, given as (topic, message) pairs, into a single
+    pack to be published on base_topic + "/batch". Each record is named after its topic relative to base_topic.
+    """
+    prefix = base_topic.rstrip("/") + "/"
+    records = []
+    for topic, message in messages:
+        if not topic.startswith(prefix):
+            raise ValueError(f"Topic {topic} is not under {base_topic}")
+        for record in message["e"]:
+            records.append(dict(record, n=topic[len(prefix):]))
+    return {"bn": prefix, "e": records}
+
+
+def unpack_batch(payload):
+    """
+    Split a pack built by pack_batch back into the (topic, payload) pairs of the single messages.
+    """
+    pack = SenML.loads(payload)
+    for record in pack["e"]:
+        topic = pack["bn"] + record["n"]
+        yield topic, json.dumps({"bn": topic, "e": [record]}).encode('utf-8')
+
+
+class Dispatcher:
+    """
+    Runs notify callbacks on a pool of worker threads so that a slow handler does not stall paho's
+    network thread (socket reads, keepalive and acks of every subscription of the client).
+
+    Every topic has its own bounded queue and is handled by one worker at a time, so the messages of
+    a topic keep their order. When a queue is full, overflow selects what happens:
+    "drop_oldest" discards the oldest queued message, "block" makes the network thread wait for room,
+    and "coalesce" keeps only the latest message of each topic.
+    """
+
+    def __init__(self, handler, workers=2, queue_size=100, overflow="drop_oldest", handler_seconds=Metrics.NULL_METRIC):
+        if overflow not in ("drop_oldest", "block", "coalesce"):
+            raise ValueError(f"Unknown overflow policy {overflow}")
+        self.handler = handler
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.queues = {}
+        self.ready = deque()
+        self.active = set()
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.space_available = threading.Condition(self.lock)
+        self.running = True
+        # Metrics
+        self.queued = 0
+        self.dropped = 0
+        self.handled = 0
+        self.errors = 0
+        self.handler_time = 0.0
+        self.handler_time_max = 0.0
+        self.wait_time = 0.0
+        self.handler_seconds = handler_seconds
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, topic, payload):
+        with self.lock:
+            queue = self.queues.setdefault(topic, deque())
+            if self.overflow == "coalesce" and queue:
+                self.dropped += len(queue)
+                self.queued -= len(queue)
+                queue.clear()
+            elif len(queue) >= self.queue_size:
+                if self.overflow == "drop_oldest":
+                    queue.popleft()
+                    self.dropped += 1
+                    self.queued -= 1
+                else:
+                    while len(queue) >= self.queue_size and self.running:
+                        self.space_available.wait()
+                        # A worker deletes the queue of a topic it drained while we were waiting
+                        queue = self.queues.setdefault(topic, queue)
+            queue.append((payload, time.perf_counter()))
+            self.queued += 1
+            if topic not in self.active:
+                self.active.add(topic)
+                self.ready.append(topic)
+                self.work_available.notify()
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.ready and self.running:
+                    self.work_available.wait()
+                if not self.ready:
+                    return
+                topic = self.ready.popleft()
+                payload, queued_at = self.queues[topic].popleft()
+                self.queued -= 1
+                self.space_available.notify_all()
+
+            started = time.perf_counter()
+            failed = False
+            try:
+                self.handler(topic, payload)
+            except Exception as e:
+                failed = True
+                print(f"Error in notify for topic {topic}: {e}")
+            elapsed = time.perf_counter() - started
+            self.handler_seconds.observe(elapsed)
+
+            with self.lock:
+                self.handled += 1
+                self.errors += failed
+                self.handler_time += elapsed
+                self.handler_time_max = max(self.handler_time_max, elapsed)
+                self.wait_time += started - queued_at
+                if self.queues[topic]:
+                    # Back of the line, so one busy topic cannot starve the others
+                    self.ready.append(topic)
+                else:
+                    self.active.discard(topic)
+                    del self.queues[topic]
+
+    def metrics(self):
+        """
+        Return queue depth, drop count and handler latency figures.
+        """
+        with self.lock:
+            handled = self.handled or 1
+            return {
+                "queue_depth": self.queued,
+                "max_topic_queue_depth": max((len(queue) for queue in self.queues.values()), default=0),
+                "dropped": self.dropped,
+                "handled": self.handled,
+                "errors": self.errors,
+                "handler_latency_avg": self.handler_time / handled,
+                "handler_latency_max": self.handler_time_max,
+                "queue_wait_avg": self.wait_time / handled,
+            }
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.work_available.notify_all()
+            self.space_available.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+
+class MyMQTT:
+    def __init__(self, clientID, broker, port, notifier, qos_policy=None, default_qos=2,
+                 workers=0, queue_size=100, overflow="drop_oldest"):
+        self.broker = broker
+        self.port = port
+        self.notifier = notifier
+        self.clientID = clientID
+        self._topics = []
+        self._isSubscriber = False
+        # QoS per topic filter (e.g. {"Garden/sensors/#": 0}), the first matching filter wins
+        self.qos_policy = qos_policy or {}
+        self.default_qos = default_qos
+        self._qos_cache = {}
+        # With workers, notify runs on a Dispatcher pool instead of paho's network thread
+        self.dispatcher = None
+        if workers > 0 and notifier is not None:
+            self.dispatcher = Dispatcher(notifier.notify, workers, queue_size, overflow,
+                                         MQTT_HANDLER_SECONDS.labels(clientID))
+            Metrics.add_collector(self.dispatcher_samples)
+        self.published_metric = MQTT_PUBLISHED.labels(clientID)
+        self.received_metric = MQTT_RECEIVED.labels(clientID)
+        # create an instance of paho.mqtt.client
+        self._paho_mqtt = PahoMQTT.Client(clientID, True)
+        # register the callback
+        self._paho_mqtt.on_connect = self.myOnConnect
+        self._paho_mqtt.on_message = self.myOnMessageReceived
+
+    def myOnConnect(self, paho_mqtt, userdata, flags, rc):
+        print("Connected to %s with result code: %d" % (self.broker, rc))
+
+    def myOnMessageReceived(self, paho_mqtt, userdata, msg):
+        # A new message is received
+        deliver = self.dispatcher.submit if self.dispatcher is not None else self.notifier.notify
+        if msg.topic.endswith("/batch"):
+            try:
+                messages = list(unpack_batch(msg.payload))
+            except (ValueError, KeyError, IndexError, TypeError, struct.error) as e:
+                # Raising here would stop paho's network loop, and with it every subscription of the client
+                print(f"Dropping malformed batch on topic {msg.topic}: {e}")
+                return
+            for topic, payload in messages:
+                self.received_metric.inc()
+                deliver(topic, payload)
+        else:
+            self.received_metric.inc()
+            deliver(msg.topic, msg.payload)
+
+    def dispatcher_samples(self):
+        """
+        Dispatcher figures as metrics collector samples.
+        """
+        figures = self.dispatcher.metrics()
+        labels = {"client": self.clientID}
+        return [
+            ("mqtt_dispatcher_queue_depth", "gauge", "Messages waiting for a notify worker", labels,
+             figures["queue_depth"]),
+            ("mqtt_dispatcher_dropped_total", "counter", "Messages dropped or coalesced on a full queue", labels,
+             figures["dropped"]),
+            ("mqtt_dispatcher_handled_total", "counter", "Messages handled by the notify workers", labels,
+             figures["handled"]),
+            ("mqtt_dispatcher_errors_total", "counter", "notify calls that raised", labels, figures["errors"]),
+            ("mqtt_dispatcher_handler_latency_avg_seconds", "gauge", "Average notify call", labels,
+             figures["handler_latency_avg"]),
+            ("mqtt_dispatcher_handler_latency_max_seconds", "gauge", "Longest notify call", labels,
+             figures["handler_latency_max"]),
+            ("mqtt_dispatcher_queue_wait_avg_seconds", "gauge", "Average time a message waited in its queue",
+             labels, figures["queue_wait_avg"]),
+        ]
+
+    def qos_for(self, topic):
+        qos = self._qos_cache.get(topic)
+        if qos is None:
+            qos = self.default_qos
+            for topic_filter, filter_qos in self.qos_policy.items():
+                if PahoMQTT.topic_matches_sub(topic_filter, topic):
+                    qos = filter_qos
+                    break
+            self._qos_cache[topic] = qos
+        return qos
+
+    def myPublish(self, topic, msg):
+        # publish a message with a certain topic, at the QoS configured for it
+        # str and bytes are already encoded (e.g. SenML.dumps output) and are sent as they are
+        payload = msg if isinstance(msg, (str, bytes)) else json.dumps(msg)
+        self._paho_mqtt.publish(topic, payload, self.qos_for(topic))
+        self.published_metric.inc()
+
+    def mySubscribe(self, topic):
+
+        # subscribe for a topic
+        self._paho_mqtt.subscribe(topic, 2)
+        # just to remember that it works also as a subscriber
+        self._isSubscriber = True
+        self._topics.append(topic)
+        print("subscribed to %s" % (topic))
+
+    def start(self):
+        # manage connection to broker
+        self._paho_mqtt.connect(self.broker, self.port)
+        self._paho_mqtt.loop_start()
+
+    def unsubscribe(self):
+        if (self._isSubscriber):
+            # remember to unsuscribe if it is working also as subscriber
+            self._paho_mqtt.unsubscribe(self._topics)
+
+    def stop(self):
+        if (self._isSubscriber):
+            # remember to unsuscribe if it is working also as subscriber
+            self._paho_mqtt.unsubscribe(self._topics)
+
+        self._paho_mqtt.loop_stop()
+        self._paho_mqtt.disconnect()
+        if self.dispatcher is not None:
+            Metrics.remove_collector(self.dispatcher_samples)
+            self.dispatcher.stop()
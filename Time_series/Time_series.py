@@ -0,0 +1,142 @@
+import time
+import math
+import threading
+import cherrypy
+from MyMQTT import MyMQTT
+import SenML
+from Time_series_store import TimeSeriesStore, ROLLUP_LEVELS
+import Metrics
+
+NOTIFY_SECONDS = Metrics.histogram("time_series_notify_seconds", "TimeSeriesService.notify duration")
+REQUEST_SECONDS = Metrics.histogram("time_series_request_seconds", "History REST request duration")
+READINGS_STORED = Metrics.counter("time_series_readings_stored_total", "Readings appended to the store")
+READINGS_REJECTED = Metrics.counter("time_series_readings_rejected_total", "Readings the store refused", ["reason"])
+FLUSH_SECONDS = Metrics.histogram("time_series_flush_seconds", "Time to flush the store to disk")
+
+
+class TimeSeriesService:
+    """
+    Keeps a local history of every reading published under Garden/sensors/ and serves it over REST.
+
+    GET /history                                   names of the stored series
+    GET /history/raw/<series>?start&end            raw readings
+    GET /history/rollup/<series>?start&end&resolution=60|3600|86400   rollup buckets
+    GET /history/summary/<series>?start&end        count, mean, min and max from the rollups
+    Series are named after their topic relative to Garden/sensors/ (e.g. soil_moisture/1), and times are
+    epoch seconds; start defaults to one day ago and end to now.
+
+    A series only moves forward in time, a late reading being stored at the time of the previous one, so
+    readings with a non-finite time or a time more than max_clock_skew seconds ahead of their reception
+    are dropped rather than pinning the series in the future.
+    """
+    exposed = True
+
+    def __init__(self, clientID, broker, port, directory, flush_interval=10, max_clock_skew=300):
+        self.topic_prefix = "Garden/sensors/"
+        self.max_clock_skew = max_clock_skew
+        self.store = TimeSeriesStore(directory)
+        self.lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self.running = True
+        self.client = MyMQTT(clientID, broker, port, self)
+        self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+
+    def start(self):
+        self.client.start()
+        self.client.mySubscribe(self.topic_prefix + "#")
+        self.flusher.start()
+
+    def stop(self):
+        self.running = False
+        self.client.stop()
+        with self.lock:
+            self.store.flush()
+
+    def flush_loop(self):
+        while self.running:
+            time.sleep(self.flush_interval)
+            with self.lock, FLUSH_SECONDS.time():
+                self.store.flush()
+
+    @Metrics.timed(NOTIFY_SECONDS)
+    def notify(self, topic, payload):
+        if not topic.startswith(self.topic_prefix):
+            return
+        try:
+            records = SenML.decode(payload)
+        except Exception as e:
+            print(f"Error decoding reading on {topic}: {e}")
+            return
+        received = time.time()
+        with self.lock:
+            for record in records:
+                value = record.get("v")
+                if not isinstance(value, (int, float)) or not math.isfinite(value):
+                    continue
+                # The device connectors send formatted local times, only numeric SenML times are used as they are
+                timestamp = record.get("t")
+                if not isinstance(timestamp, (int, float)):
+                    timestamp = received
+                elif not math.isfinite(timestamp) or timestamp > received + self.max_clock_skew:
+                    # e.g. a time in milliseconds, every later reading of the series would be stored at it
+                    print(f"Dropping reading on {topic} with time {timestamp}, received at {received:.0f}")
+                    READINGS_REJECTED.labels("timestamp").inc()
+                    continue
+                try:
+                    self.store.append(topic[len(self.topic_prefix):], timestamp, value)
+                except ValueError as e:
+                    # An invalid series name, or one more series than the store allows
+                    print(f"Not storing reading on {topic}: {e}")
+                    READINGS_REJECTED.labels("series").inc()
+                    continue
+                READINGS_STORED.inc()
+
+    @cherrypy.tools.json_out()
+    @Metrics.timed(REQUEST_SECONDS)
+    def GET(self, *uri, **params):
+        if len(uri) == 0:
+            with self.lock:
+                return {"series": self.store.names()}
+        if len(uri) < 2 or uri[0] not in ("raw", "rollup", "summary"):
+            raise cherrypy.HTTPError(404, "Unknown history resource")
+
+        name = "/".join(uri[1:])
+        try:
+            end = float(params.get("end", time.time()))
+            start = float(params.get("start", end - 86400))
+            resolution = int(params.get("resolution", 3600))
+        except ValueError:
+            raise cherrypy.HTTPError(400, "start, end and resolution must be numbers")
+
+        try:
+            with self.lock:
+                if uri[0] == "raw":
+                    timestamps, values = self.store.range(name, start, end)
+                    return {"series": name, "t": timestamps.tolist(), "v": values.tolist()}
+                if uri[0] == "rollup":
+                    if resolution not in ROLLUP_LEVELS:
+                        raise cherrypy.HTTPError(400, f"resolution must be one of {ROLLUP_LEVELS}")
+                    buckets = self.store.rollup(name, start, end, resolution)
+                    return dict({"series": name, "resolution": resolution},
+                                **{key: column.tolist() for key, column in buckets.items()})
+                return dict({"series": name, "start": start, "end": end}, **self.store.summary(name, start, end))
+        except KeyError:
+            raise cherrypy.HTTPError(404, f"Series {name} not found")
+
+
+if __name__ == '__main__':
+    conf = {
+        '/': {
+            'request.dispatch': cherrypy.dispatch.MethodDispatcher(),
+            'tools.sessions.on': True
+        }
+    }
+    service = TimeSeriesService("GardenTimeSeries", "mqtt.eclipseprojects.io", 1883, "time_series")
+    service.start()
+    cherrypy.tree.mount(service, '/history', conf)
+    cherrypy.tree.mount(Metrics.MetricsPage(), '/metrics', conf)
+    cherrypy.config.update({'server.socket_host': '127.0.0.1'})
+    cherrypy.config.update({'server.socket_port': 8082})
+    cherrypy.engine.subscribe('stop', service.stop)
+    cherrypy.engine.start()
+    cherrypy.engine.block()
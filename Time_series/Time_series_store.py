@@ -0,0 +1,259 @@
+import os
+import math
+from urllib.parse import quote, unquote
+import numpy as np
+
+# Rollup resolutions in seconds: 1 minute, 1 hour, 1 day
+ROLLUP_LEVELS = [60, 3600, 86400]
+
+RAW_COLUMNS = {"t": "<f8", "v": "<f4"}
+ROLLUP_COLUMNS = {"t": "<f8", "count": "<i8", "sum": "<f8", "min": "<f4", "max": "<f4"}
+
+
+class ColumnSegments:
+    """
+    Append-only table stored as fixed-size segments, one memory-mapped file per column and segment.
+
+    The first column "t" holds ascending times and is NaN past the last row, so the number of rows is
+    recovered from the files alone after a restart. The last row can be updated in place.
+    """
+
+    def __init__(self, directory, name, columns, segment_rows=65536):
+        self.directory = directory
+        self.name = name
+        self.columns = columns
+        self.segment_rows = segment_rows
+        self.segments = []
+        # Time of the first row of every segment, for locating a time range
+        self.first_times = []
+        self.length = 0
+        os.makedirs(directory, exist_ok=True)
+
+        number = 0
+        while os.path.exists(self.path(number, "t")):
+            self.segments.append(self.open_segment(number, 'r+'))
+            number += 1
+        if self.segments:
+            self.first_times = [float(segment["t"][0]) for segment in self.segments]
+            last = self.segments[-1]["t"]
+            # Rows are filled from the start, so the NaN tail is found by bisection
+            low, high = 0, self.segment_rows
+            while low < high:
+                middle = (low + high) // 2
+                if np.isnan(last[middle]):
+                    high = middle
+                else:
+                    low = middle + 1
+            self.length = (len(self.segments) - 1) * self.segment_rows + low
+
+    def path(self, number, column):
+        return os.path.join(self.directory, f"{self.name}.{number:05d}.{column}")
+
+    def open_segment(self, number, mode):
+        segment = {column: np.memmap(self.path(number, column), dtype=dtype, mode=mode, shape=(self.segment_rows,))
+                   for column, dtype in self.columns.items()}
+        if mode == 'w+':
+            segment["t"][:] = np.nan
+        return segment
+
+    def append(self, row):
+        number, position = divmod(self.length, self.segment_rows)
+        if number == len(self.segments):
+            self.segments.append(self.open_segment(number, 'w+'))
+            self.first_times.append(row["t"])
+        segment = self.segments[number]
+        # Time last, so a row is only counted once all its columns are written
+        for column, value in row.items():
+            if column != "t":
+                segment[column][position] = value
+        segment["t"][position] = row["t"]
+        self.length += 1
+
+    def last(self, column):
+        if not self.length:
+            return None
+        number, position = divmod(self.length - 1, self.segment_rows)
+        return self.segments[number][column][position].item()
+
+    def update_last(self, column, value):
+        number, position = divmod(self.length - 1, self.segment_rows)
+        self.segments[number][column][position] = value
+
+    def select(self, start, end, columns=None):
+        """
+        Return {column: array} of the rows with start <= t < end, for the given columns (default: all).
+        """
+        columns = columns or list(self.columns)
+        first = max(np.searchsorted(self.first_times, start, side='right') - 1, 0)
+        parts = {column: [] for column in columns}
+        for number in range(first, len(self.segments)):
+            if self.first_times[number] >= end:
+                break
+            rows = min(self.length - number * self.segment_rows, self.segment_rows)
+            times = self.segments[number]["t"][:rows]
+            low = np.searchsorted(times, start, side='left')
+            high = np.searchsorted(times, end, side='left')
+            if low < high:
+                for column in columns:
+                    parts[column].append(np.asarray(self.segments[number][column][low:high]))
+        return {column: np.concatenate(values) if values else np.empty(0, dtype=self.columns[column])
+                for column, values in parts.items()}
+
+    def flush(self):
+        for segment in self.segments[-1:]:
+            for column in segment.values():
+                column.flush()
+
+
+class Series:
+    """
+    Raw readings of one sensor plus their 1 minute, 1 hour and 1 day rollups.
+    """
+
+    def __init__(self, directory, segment_rows=65536):
+        self.raw = ColumnSegments(directory, "raw", RAW_COLUMNS, segment_rows)
+        self.rollups = {level: ColumnSegments(directory, f"rollup{level}", ROLLUP_COLUMNS, 4096)
+                        for level in ROLLUP_LEVELS}
+
+    def append(self, timestamp, value):
+        if not math.isfinite(timestamp):
+            # Checked before anything is written, a NaN would otherwise fail in the middle of the rollups
+            raise ValueError(f"Invalid timestamp {timestamp}")
+        last_time = self.raw.last("t")
+        if last_time is not None and timestamp < last_time:
+            # Segments must stay sorted, a late reading is stored at the time of the previous one
+            timestamp = last_time
+        self.raw.append({"t": timestamp, "v": value})
+        for level, rollup in self.rollups.items():
+            bucket = math.floor(timestamp / level) * level
+            if rollup.last("t") == bucket:
+                rollup.update_last("count", rollup.last("count") + 1)
+                rollup.update_last("sum", rollup.last("sum") + value)
+                rollup.update_last("min", min(rollup.last("min"), value))
+                rollup.update_last("max", max(rollup.last("max"), value))
+            else:
+                rollup.append({"t": bucket, "count": 1, "sum": value, "min": value, "max": value})
+
+    def flush(self):
+        self.raw.flush()
+        for rollup in self.rollups.values():
+            rollup.flush()
+
+
+class TimeSeriesStore:
+    """
+    Local history of sensor readings, one Series directory per sensor name.
+
+    Raw readings are kept as float64 timestamps and float32 values. Aggregate queries are answered from
+    the rollups only: a range is covered by whole day buckets in the middle, hour buckets next to them
+    and minute buckets at the edges, so its cost does not grow with the number of raw readings.
+
+    Names come from MQTT topics, so they are checked and encoded before they become directory names, and
+    at most max_series series are created, each one preallocating its segment files.
+    """
+
+    def __init__(self, directory, segment_rows=65536, max_series=1000):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.max_series = max_series
+        self.series = {}
+        os.makedirs(directory, exist_ok=True)
+        for entry in sorted(os.listdir(directory)):
+            if os.path.isdir(os.path.join(directory, entry)):
+                self.series[self.series_name(entry)] = Series(os.path.join(directory, entry), segment_rows)
+
+    @staticmethod
+    def directory_name(name):
+        """
+        Encode a series name as one directory name: levels are percent-encoded and joined with "~".
+        Raises ValueError for a name with an empty, "." or ".." level.
+        """
+        levels = name.split("/")
+        if any(level in ("", ".", "..") for level in levels):
+            raise ValueError(f"Invalid series name {name!r}")
+        directory_name = "~".join(quote(level, safe="").replace("~", "%7E") for level in levels)
+        if len(directory_name) > 200:
+            raise ValueError(f"Series name {name[:50]!r}... is too long")
+        return directory_name
+
+    @staticmethod
+    def series_name(directory_name):
+        return "/".join(unquote(level) for level in directory_name.split("~"))
+
+    def names(self):
+        return sorted(self.series)
+
+    def append(self, name, timestamp, value):
+        series = self.series.get(name)
+        if series is None:
+            if len(self.series) >= self.max_series:
+                raise ValueError(f"Series limit of {self.max_series} reached, {name!r} is not stored")
+            series = Series(os.path.join(self.directory, self.directory_name(name)), self.segment_rows)
+            self.series[name] = series
+        series.append(timestamp, value)
+
+    def range(self, name, start, end):
+        """
+        Raw readings of a series with start <= time < end, as (timestamps, values) arrays.
+        """
+        series = self.series.get(name)
+        if series is None:
+            raise KeyError(name)
+        rows = series.raw.select(start, end)
+        return rows["t"], rows["v"]
+
+    def rollup(self, name, start, end, resolution):
+        """
+        Buckets of one rollup level starting in [start, end): {"t", "count", "mean", "min", "max"} arrays.
+        """
+        if resolution not in ROLLUP_LEVELS:
+            raise ValueError(f"Resolution must be one of {ROLLUP_LEVELS}")
+        series = self.series.get(name)
+        if series is None:
+            raise KeyError(name)
+        rows = series.rollups[resolution].select(start, end)
+        return {"t": rows["t"], "count": rows["count"], "mean": rows["sum"] / np.maximum(rows["count"], 1),
+                "min": rows["min"], "max": rows["max"]}
+
+    def summary(self, name, start, end):
+        """
+        Count, mean, min and max of a series over [start, end), widened to whole minutes.
+        """
+        series = self.series.get(name)
+        if series is None:
+            raise KeyError(name)
+        smallest = ROLLUP_LEVELS[0]
+        start = math.floor(start / smallest) * smallest
+        end = math.ceil(end / smallest) * smallest
+
+        count, total, minimum, maximum = 0, 0.0, math.inf, -math.inf
+        for level, bucket_start, bucket_end in self.cover(start, end, len(ROLLUP_LEVELS) - 1):
+            rows = series.rollups[level].select(bucket_start, bucket_end, ["count", "sum", "min", "max"])
+            if len(rows["count"]):
+                count += int(rows["count"].sum())
+                total += float(rows["sum"].sum())
+                minimum = min(minimum, float(rows["min"].min()))
+                maximum = max(maximum, float(rows["max"].max()))
+        if not count:
+            return {"count": 0, "mean": None, "min": None, "max": None}
+        return {"count": count, "mean": total / count, "min": minimum, "max": maximum}
+
+    def cover(self, start, end, level_index):
+        """
+        Split [start, end) into (level, start, end) ranges of whole buckets, the largest levels first.
+        """
+        if start >= end:
+            return []
+        level = ROLLUP_LEVELS[level_index]
+        if level_index == 0:
+            return [(level, start, end)]
+        inner_start = math.ceil(start / level) * level
+        inner_end = math.floor(end / level) * level
+        if inner_start >= inner_end:
+            return self.cover(start, end, level_index - 1)
+        return (self.cover(start, inner_start, level_index - 1) + [(level, inner_start, inner_end)] +
+                self.cover(inner_end, end, level_index - 1))
+
+    def flush(self):
+        for series in self.series.values():
+            series.flush()
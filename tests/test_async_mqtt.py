@@ -0,0 +1,160 @@
+import os
+import sys
+import socket
+import asyncio
+import paho.mqtt.client as PahoMQTT
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from AsyncMQTT import AsyncMQTT
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakePaho:
+    """
+    Stands in for paho.mqtt.client.Client: opens a local socket pair instead of a broker connection and
+    records the subscriptions.
+    """
+
+    def __init__(self, client, failed_reconnects=0):
+        self.client = client
+        self.failed_reconnects = failed_reconnects
+        self.connected = False
+        self.subscriptions = []
+        self.sockets = []
+        self.reconnects = 0
+
+    def connect(self, broker, port):
+        self.open()
+
+    def reconnect(self):
+        self.reconnects += 1
+        if self.failed_reconnects:
+            self.failed_reconnects -= 1
+            raise ConnectionRefusedError("broker is down")
+        self.open()
+
+    def open(self):
+        sock, peer = socket.socketpair()
+        self.sockets += [sock, peer]
+        self.connected = True
+        self.client._on_socket_open(self, None, sock)
+        self.client.myOnConnect(self, None, {}, 0)
+
+    def drop(self):
+        self.connected = False
+        self.client._on_socket_close(self, None, self.client._socket)
+
+    def loop_misc(self):
+        return PahoMQTT.MQTT_ERR_SUCCESS if self.connected else PahoMQTT.MQTT_ERR_NO_CONN
+
+    def loop_read(self):
+        pass
+
+    def subscribe(self, topic, qos):
+        self.subscriptions.append(topic)
+
+    def unsubscribe(self, topic):
+        pass
+
+    def disconnect(self):
+        self.connected = False
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+
+class SlowNotifier:
+    # Coroutine notifier that holds every message until released
+    def __init__(self):
+        self.received = []
+        self.release = asyncio.Event()
+
+    async def notify(self, topic, payload):
+        await self.release.wait()
+        self.received.append(payload)
+
+
+async def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_full_queue_pauses_reading_until_coroutine_notifier_catches_up():
+    async def scenario():
+        notifier = SlowNotifier()
+        client = AsyncMQTT("test_client", "localhost", 1883, notifier, queue_size=2)
+        fake = client._paho_mqtt = FakePaho(client)
+        await client.start()
+        for i in range(6):
+            client.myOnMessageReceived(None, None, Message("Garden/sensors/rain", i))
+        # One message is held by the notifier, two fill the queue, the rest wait in the overflow
+        await wait_for(lambda: len(client._overflow) == 3)
+        assert client._queue.full()
+        assert client._reading_paused
+
+        notifier.release.set()
+        await wait_for(lambda: len(notifier.received) == 6)
+        assert notifier.received == list(range(6))
+        assert not client._overflow
+        assert not client._reading_paused
+        await client.stop()
+        fake.close()
+
+    asyncio.run(scenario())
+
+
+def test_plain_and_failing_notifiers_keep_the_dispatch_running():
+    class Notifier:
+        def __init__(self):
+            self.received = []
+
+        def notify(self, topic, payload):
+            if payload == b"bad":
+                raise ValueError("cannot parse")
+            self.received.append(payload)
+
+    async def scenario():
+        notifier = Notifier()
+        client = AsyncMQTT("test_client", "localhost", 1883, notifier)
+        fake = client._paho_mqtt = FakePaho(client)
+        await client.start()
+        for payload in (b"1", b"bad", b"2"):
+            client.myOnMessageReceived(None, None, Message("Garden/sensors/rain", payload))
+        await wait_for(lambda: len(notifier.received) == 2)
+        assert notifier.received == [b"1", b"2"]
+        await client.stop()
+        fake.close()
+
+    asyncio.run(scenario())
+
+
+def test_reconnects_with_backoff_and_subscribes_again():
+    async def scenario():
+        client = AsyncMQTT("test_client", "localhost", 1883, SlowNotifier(),
+                           min_reconnect_delay=0.01, max_reconnect_delay=0.04)
+        fake = client._paho_mqtt = FakePaho(client, failed_reconnects=3)
+        await client.start()
+        client.mySubscribe("Garden/sensors/#")
+        first_socket = client._socket
+
+        fake.drop()
+        assert client._socket is None
+        await wait_for(lambda: fake.connected)
+        assert fake.reconnects == 4
+        assert client._socket is not None and client._socket is not first_socket
+        assert fake.subscriptions == ["Garden/sensors/#", "Garden/sensors/#"]
+        # A successful connection resets the backoff
+        assert client._reconnect_delay == 0.01
+        await client.stop()
+        fake.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import signal
+import subprocess
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Catalog_storage import JournalStorage, SQLiteStorage
+
+# Appends sensors with large bodies until killed, printing the number of each one once it is flushed
+WRITER = """
+import sys
+sys.path.insert(0, sys.argv[2])
+from Catalog_storage import JournalStorage
+storage = JournalStorage(sys.argv[1])
+data = storage.load()
+number = 0
+while True:
+    number += 1
+    storage.append({"op": "add", "section": "sensors",
+                    "item": {"sensorID": f"sensor{number}", "padding": "x" * 200000}})
+    storage.flush(data)
+    print(number, flush=True)
+"""
+
+
+def write_snapshot(file_path):
+    catalog = {
+        "actuators": [{"actuatorID": "waterpump", "status": "OFF"}],
+        "sensors": [{"sensorID": "soil_moisture1", "status": "active"}],
+        "commands": []
+    }
+    with open(file_path, 'w') as file:
+        json.dump(catalog, file)
+
+
+def test_torn_final_journal_line_is_discarded(tmp_path):
+    json_file = str(tmp_path / "catalog.json")
+    write_snapshot(json_file)
+    storage = JournalStorage(json_file)
+    data = storage.load()
+    storage.append({"op": "update", "section": "actuators", "id": "waterpump", "changes": {"status": "ON"}})
+    storage.flush(data)
+    storage.journal.close()
+
+    # A crash in the middle of the next append leaves half a line behind
+    with open(storage.journal_file, 'ab') as file:
+        file.write(b'{"op":"delete","section":"sensors","id":"soil_mo')
+
+    recovered = JournalStorage(json_file)
+    data = recovered.load()
+    assert data["actuators"][0]["status"] == "ON"
+    assert [sensor["sensorID"] for sensor in data["sensors"]] == ["soil_moisture1"]
+    assert recovered.journal_length == 1
+
+    # The torn tail is truncated, so new entries are not appended behind it
+    recovered.append({"op": "add", "section": "sensors", "item": {"sensorID": "rain", "status": "active"}})
+    recovered.flush(data)
+    recovered.journal.close()
+    data = JournalStorage(json_file).load()
+    assert [sensor["sensorID"] for sensor in data["sensors"]] == ["soil_moisture1", "rain"]
+
+
+def test_snapshot_then_journal_replay(tmp_path):
+    json_file = str(tmp_path / "catalog.json")
+    write_snapshot(json_file)
+    storage = JournalStorage(json_file, compact_every=2)
+    data = storage.load()
+    data["sensors"].append({"sensorID": "temperature", "status": "active"})
+    storage.append({"op": "add", "section": "sensors", "item": {"sensorID": "temperature", "status": "active"}})
+    data["actuators"][0]["status"] = "ON"
+    storage.append({"op": "update", "section": "actuators", "id": "waterpump", "changes": {"status": "ON"}})
+    storage.flush(data)
+    # Two entries reached compact_every, so they are in the snapshot and the journal is empty
+    assert storage.journal_length == 0
+    with open(json_file) as file:
+        assert len(json.load(file)["sensors"]) == 2
+
+    storage.append({"op": "delete", "section": "sensors", "id": "soil_moisture1"})
+    storage.flush(data)
+    storage.journal.close()
+
+    data = JournalStorage(json_file).load()
+    assert [sensor["sensorID"] for sensor in data["sensors"]] == ["temperature"]
+    assert data["actuators"][0]["status"] == "ON"
+
+
+def test_failed_flush_keeps_entries_pending(tmp_path, monkeypatch):
+    json_file = str(tmp_path / "catalog.json")
+    write_snapshot(json_file)
+    storage = JournalStorage(json_file)
+    data = storage.load()
+    storage.append({"op": "update", "section": "actuators", "id": "waterpump", "changes": {"status": "ON"}})
+
+    def failing_fsync(descriptor):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "fsync", failing_fsync)
+        with pytest.raises(OSError):
+            storage.flush(data)
+    assert len(storage.pending) == 1
+    assert os.path.getsize(storage.journal_file) == 0
+
+    storage.flush(data)
+    storage.journal.close()
+    assert JournalStorage(json_file).load()["actuators"][0]["status"] == "ON"
+
+
+def test_sync_write_failure_returns_500(tmp_path, monkeypatch):
+    import cherrypy
+    from Home_Catalog import HomeCatalog
+
+    json_file = str(tmp_path / "catalog.json")
+    write_snapshot(json_file)
+    catalog = HomeCatalog(json_file, flush_interval=0)
+
+    def failing_flush(data):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(catalog.storage, "flush", failing_flush)
+    monkeypatch.setattr(cherrypy.request, "json", {"status": "ON"}, raising=False)
+    with pytest.raises(cherrypy.HTTPError) as error:
+        catalog.PUT("actuators", "waterpump")
+    assert error.value.status == 500
+    assert catalog.dirty
+
+    for section, body in (("commands", {"targetDeviceID": "waterpump", "commandType": "turn_on"}),
+                          ("sensors", {"sensorID": "rain", "status": "active"})):
+        monkeypatch.setattr(cherrypy.request, "json", body, raising=False)
+        with pytest.raises(cherrypy.HTTPError) as error:
+            catalog.POST(section)
+        assert error.value.status == 500
+
+
+def test_replay_after_writer_is_killed(tmp_path):
+    json_file = str(tmp_path / "catalog.json")
+    write_snapshot(json_file)
+    writer = subprocess.Popen([sys.executable, "-c", WRITER, json_file,
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')],
+                              stdout=subprocess.PIPE, text=True)
+    acknowledged = 0
+    try:
+        # Kill it while it is busy appending, after a few entries have been acknowledged
+        while acknowledged < 20:
+            acknowledged = int(writer.stdout.readline())
+    finally:
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+    for line in writer.stdout:
+        acknowledged = int(line)
+
+    storage = JournalStorage(json_file)
+    data = storage.load()
+    numbers = [int(sensor["sensorID"][len("sensor"):]) for sensor in data["sensors"][1:]]
+    # Every acknowledged entry is replayed, in order, and nothing after a torn line
+    assert numbers == list(range(1, len(numbers) + 1))
+    assert len(numbers) >= acknowledged
+    assert all(len(sensor["padding"]) == 200000 for sensor in data["sensors"][1:])
+    assert os.path.getsize(storage.journal_file) == storage.journal.tell()
+    storage.journal.close()
+
+
+def test_sqlite_drops_entries_that_always_fail(tmp_path):
+    json_file = str(tmp_path / "catalog.json")
+    write_snapshot(json_file)
+    storage = SQLiteStorage(str(tmp_path / "catalog.db"), json_file)
+    data = storage.load()
+    storage.append({"op": "add", "section": "sensors", "item": {"sensorID": "rain", "status": "active"}})
+    storage.flush(data)
+
+    # Renaming onto an existing ID violates the primary key on every attempt
+    storage.append({"op": "update", "section": "sensors", "id": "rain", "changes": {"sensorID": "soil_moisture1"}})
+    storage.append({"op": "update", "section": "actuators", "id": "waterpump", "changes": {"status": "ON"}})
+    storage.flush(data)
+    assert storage.pending == []
+
+    storage.append({"op": "update", "section": "sensors", "id": "rain", "changes": {"status": "inactive"}})
+    storage.flush(data)
+    storage.close(data)
+
+    data = SQLiteStorage(str(tmp_path / "catalog.db"), json_file).load()
+    assert data["actuators"][0]["status"] == "ON"
+    assert [(sensor["sensorID"], sensor["status"]) for sensor in data["sensors"]] == \
+        [("soil_moisture1", "active"), ("rain", "inactive")]
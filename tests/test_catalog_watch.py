@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import socket
+import threading
+import cherrypy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Home_Catalog import HomeCatalog
+from Catalog_watch import WatchServer
+
+
+def start(tmp_path):
+    json_file = str(tmp_path / "catalog.json")
+    with open(json_file, 'w') as file:
+        json.dump({"actuators": [{"actuatorID": "waterpump", "status": "OFF"}], "sensors": [], "commands": []}, file)
+    catalog = HomeCatalog(json_file, max_watchers=1)
+    server = WatchServer(catalog, port=0)
+    server.start()
+    return catalog, server
+
+
+def send(server, path):
+    connection = socket.create_connection(("127.0.0.1", server.port))
+    connection.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+    return connection
+
+
+def receive(connection):
+    data = b""
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    connection.close()
+    head, body = data.split(b"\r\n\r\n", 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_many_watchers_without_server_threads(tmp_path, monkeypatch):
+    catalog, server = start(tmp_path)
+    try:
+        threads_before = threading.active_count()
+        connections = [send(server, "/garden/watch/actuators/waterpump?status=ON&timeout=30") for _ in range(300)]
+        # Far more waiters than the catalog's max_watchers, and no thread for any of them
+        while server.watchers < 300:
+            threading.Event().wait(0.01)
+        assert threading.active_count() == threads_before
+
+        monkeypatch.setattr(cherrypy.request, "json", {"status": "ON"}, raising=False)
+        catalog.PUT("actuators", "waterpump")
+        for connection in connections:
+            status, body = receive(connection)
+            assert status == 200
+            assert not body["timed_out"]
+            assert body["item"]["status"] == "ON"
+            assert body["revision"] == 1
+    finally:
+        server.stop()
+        catalog.stop()
+
+
+def test_watch_timeout_and_errors(tmp_path):
+    catalog, server = start(tmp_path)
+    try:
+        status, body = receive(send(server, "/garden/watch/actuators/waterpump?timeout=0.1"))
+        assert status == 200 and body["timed_out"] and body["item"]["status"] == "OFF"
+        assert receive(send(server, "/garden/watch/users/waterpump"))[0] == 404
+        assert receive(send(server, "/garden/watch/actuators/waterpump?since=x"))[0] == 400
+        # A waiter still waiting at shutdown is answered
+        connection = send(server, "/garden/watch/actuators/waterpump?timeout=30")
+        while server.watchers < 1:
+            threading.Event().wait(0.01)
+    finally:
+        server.stop()
+        catalog.stop()
+    assert receive(connection)[0] == 200
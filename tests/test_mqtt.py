@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from MyMQTT import Dispatcher, MyMQTT, pack_batch
+
+
+class Recorder:
+    def __init__(self):
+        self.received = []
+
+    def notify(self, topic, payload):
+        self.received.append(topic)
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def test_malformed_batch_is_dropped():
+    recorder = Recorder()
+    client = MyMQTT("test_client", "localhost", 1883, recorder)
+    for payload in (b'{"bn":', b'\xa1', b'{"e":[{"v":1}]}', b'[1, 2]'):
+        client.myOnMessageReceived(None, None, Message("Garden/sensors/batch", payload))
+    assert recorder.received == []
+
+    batch = pack_batch("Garden/sensors", [("Garden/sensors/rain", {"e": [{"v": 2}]})])
+    client.myOnMessageReceived(None, None, Message("Garden/sensors/batch", json.dumps(batch).encode('utf-8')))
+    assert recorder.received == ["Garden/sensors/rain"]
+
+
+def test_block_mode_survives_drained_queue():
+    # With room for one message the producer keeps waiting while the worker drains and deletes the topic queue
+    handled = []
+    dispatcher = Dispatcher(lambda topic, payload: handled.append(payload), workers=1, queue_size=1,
+                            overflow="block")
+
+    def produce():
+        for i in range(5000):
+            dispatcher.submit("Garden/sensors/rain", i)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    producer.join(10)
+    assert not producer.is_alive()
+    dispatcher.stop()
+    assert handled == list(range(5000))
+    assert dispatcher.metrics()["handled"] == 5000
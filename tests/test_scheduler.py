@@ -0,0 +1,60 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from Clock import VirtualClock
+from Scheduler import Scheduler
+
+
+def start_scheduler(state_file, clock, ran, compact_every=1000):
+    scheduler = Scheduler(state_file, clock, compact_every=compact_every)
+    scheduler.register("stop_irrigation", lambda zone_id: ran.append(zone_id))
+    scheduler.start()
+    return scheduler
+
+
+def pending_state(scheduler):
+    return sorted((job.when, job.args, job.key) for job in scheduler.persistent_jobs)
+
+
+def test_journal_replay_restores_pending_jobs(tmp_path):
+    state_file = str(tmp_path / "schedule.json")
+    clock = VirtualClock(1000)
+    ran = []
+    rng = random.Random(3)
+    scheduler = start_scheduler(state_file, clock, ran, compact_every=500)
+    jobs = [scheduler.schedule(rng.uniform(1, 100), "stop_irrigation", f"zone{i}", key=f"stop/{i % 1500}")
+            for i in range(2000)]
+    for job in rng.sample(jobs, 300):
+        scheduler.cancel(job)
+    clock.advance_to(1030)
+    assert ran
+    # More changes than compact_every, so the state is in a snapshot plus a journal
+    assert 0 < scheduler.journal_length < 500
+    expected = pending_state(scheduler)
+    assert len(expected) > 500
+
+    # The process dies without stop(), in the middle of an append
+    with open(scheduler.journal_file, 'ab') as file:
+        file.write(b'{"op":"remove","id":')
+    restarted = start_scheduler(state_file, VirtualClock(1030), [])
+    assert pending_state(restarted) == expected
+    assert restarted.journal_length == 0
+    assert os.path.getsize(restarted.journal_file) == 0
+
+    restarted.cancel_key("stop/7")
+    restarted.stop()
+    assert len(Scheduler(state_file).saved_jobs()[0]) == len(expected) - 1
+
+
+def test_each_change_appends_one_journal_line(tmp_path):
+    state_file = str(tmp_path / "schedule.json")
+    scheduler = start_scheduler(state_file, VirtualClock(1000), [])
+    for i in range(1000):
+        scheduler.schedule(60, "stop_irrigation", f"zone{i}")
+    size = os.path.getsize(scheduler.journal_file)
+    scheduler.schedule(60, "stop_irrigation", "zone1000")
+    # A change writes its own line, not the thousand pending jobs
+    assert os.path.getsize(scheduler.journal_file) - size < 200
+    assert scheduler.journal_length == 1
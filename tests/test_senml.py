@@ -0,0 +1,57 @@
+import os
+import sys
+import math
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+import SenML
+
+
+def cbor_round_trip(value):
+    payload = SenML.dumps({"bn": "Garden/sensors/", "e": [{"n": "rain", "v": value}]}, binary=True)
+    return SenML.decode(payload)[0]["v"]
+
+
+def test_cbor_floats_round_trip():
+    for value in (0.0, -0.0, 0.5, 21.3, 65504.0, 70000.0, 1e-40, 1e39, -1e300, 2.0 ** -24,
+                  float('inf'), float('-inf')):
+        decoded = cbor_round_trip(value)
+        assert decoded == value
+        assert math.copysign(1, decoded) == math.copysign(1, value)
+    assert math.isnan(cbor_round_trip(float('nan')))
+
+
+def test_cbor_uses_shortest_exact_float():
+    sizes = [len(SenML.dumps({"e": [{"v": value}]}, binary=True)) for value in (0.5, 70000.0, 1e39)]
+    # Half, single and double precision
+    assert sizes[1] - sizes[0] == 2
+    assert sizes[2] - sizes[1] == 4
+
+
+def test_malformed_packs_raise_value_error():
+    malformed = [
+        b'[{"n": "rain", "v": 1}]',                     # list instead of a pack
+        b'"{\\"e\\": 5}"',                               # double-encoded pack with a bad e
+        b'{"bn": "Garden/sensors/", "e": {"v": 1}}',     # e is not a list
+        b'{"bn": "Garden/sensors/", "e": [1, 2]}',       # records are not objects
+        b'{"bn": 7, "e": [{"n": "rain", "v": 1}]}',      # base name is not a string
+        b'{"e": [{"n": "rain", "v": "wet"}]}',           # value is not a number
+        b'{"e": [{"n": "rain", "v": true}]}',
+        b'{"bt": 100, "e": [{"n": "rain", "v": 1, "t": "2024-09-01 05:00:00"}]}',
+        b'{"e": [{"v": 1}]}',                            # no name even with the base name applied
+        b'{"bn": "Garden/sensors/rain"}',                # no records
+        b'\x82\x01\x02',                                 # CBOR array of integers
+        b'\x81\xa2\x00',                                 # truncated CBOR
+    ]
+    for payload in malformed:
+        with pytest.raises(ValueError):
+            SenML.decode(payload)
+    with pytest.raises(ValueError):
+        SenML.decode({"e": [None]})
+
+
+def test_loads_keeps_packs_without_records():
+    # Plain JSON commands such as {"command": "ON"} still parse
+    assert SenML.loads(b'{"command": "ON"}') == {"command": "ON"}
+    records = SenML.decode(b'{"bn": "Garden/sensors/rain", "bt": 100, "e": [{"v": 2, "t": 5}]}')
+    assert records == [{"n": "Garden/sensors/rain", "v": 2, "t": 105}]
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ThingSpeak'))
+import SenML
+import ThingSpeak
+
+
+class RecordingClient:
+    def __init__(self):
+        self.published = []
+
+    def myPublish(self, topic, msg):
+        self.published.append(msg)
+
+
+def test_soil_moisture_field_is_the_round_average(monkeypatch):
+    for name, value in (("LOCAL_MQTT_HOST", "localhost"), ("LOCAL_MQTT_PORT", 1883),
+                        ("THINGSPEAK_MQTT_CLIENT_ID", "test"), ("THINGSPEAK_MQTT_HOST", "localhost"),
+                        ("THINGSPEAK_MQTT_PORT", 1883), ("THINGSPEAK_MQTT_USERNAME", "user"),
+                        ("THINGSPEAK_MQTT_PASSWORD", "password"), ("THINGSPEAK_MQTT_TOPIC", "channels/1/publish")):
+        monkeypatch.setattr(ThingSpeak, name, value, raising=False)
+    adapter = ThingSpeak.ThingSpeakAdapter()
+    adapter.ts_client = RecordingClient()
+
+    random.seed(0)
+    for _ in range(2):
+        values = [round(random.uniform(20, 80), 1) for _ in range(9)]
+        adapter.last_send_time = 0
+        for sensor, value in enumerate(values, start=1):
+            topic = f"Garden/sensors/soil_moisture/{sensor}"
+            payload = json.dumps(SenML.create_message(topic, f"soil_moisture{sensor}", value, '%',
+                                                      '2024-09-01 12:00:00'))
+            adapter.notify(topic, payload.encode('utf-8'))
+            if sensor < 9:
+                assert adapter.ts_client.published == []
+        assert adapter.ts_client.published == [f"field4={sum(values) / 9:.2f}"]
+        adapter.ts_client.published.clear()
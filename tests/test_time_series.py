@@ -0,0 +1,60 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Time_series'))
+from Time_series_store import TimeSeriesStore
+
+
+def test_series_names_stay_inside_the_store(tmp_path):
+    store = TimeSeriesStore(str(tmp_path / "store"), segment_rows=16)
+    for name in ("..", "soil_moisture/..", "../../etc", "soil_moisture//1", "/rain", "rain/", ".", ""):
+        with pytest.raises(ValueError):
+            store.append(name, 1000.0, 1.0)
+    assert os.listdir(tmp_path) == ["store"]
+
+    names = ["soil_moisture/1", "odd~name/50%/x y", "...", "soil_moisture~1"]
+    for name in names:
+        store.append(name, 1000.0, 2.0)
+    assert len(os.listdir(tmp_path / "store")) == len(names)
+    store.flush()
+    # Names come back from the directory names after a restart
+    reopened = TimeSeriesStore(str(tmp_path / "store"), segment_rows=16)
+    assert reopened.names() == sorted(names)
+    assert reopened.range("odd~name/50%/x y", 0, 2000)[1].tolist() == [2.0]
+
+
+def test_series_count_is_capped(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), segment_rows=16, max_series=3)
+    for i in range(3):
+        store.append(f"sensor{i}", 1000.0, 1.0)
+    with pytest.raises(ValueError):
+        store.append("sensor3", 1000.0, 1.0)
+    # Existing series still take readings
+    store.append("sensor0", 1001.0, 2.0)
+    assert store.names() == ["sensor0", "sensor1", "sensor2"]
+    assert store.range("sensor0", 0, 2000)[1].tolist() == [1.0, 2.0]
+
+
+def test_service_drops_readings_from_the_future(tmp_path):
+    import time
+    from Time_series import TimeSeriesService
+
+    service = TimeSeriesService("test_client", "localhost", 1883, str(tmp_path))
+    now = time.time()
+    for t in (now - 10, now * 1000, "NaN", "Infinity", now + 60, now - 5):
+        service.notify("Garden/sensors/rain", f'{{"bn":"Garden/sensors/rain","e":[{{"v":1,"t":{t}}}]}}'.encode())
+    service.notify("Garden/sensors/rain", b'{"bn":"Garden/sensors/rain","e":[{"v":NaN,"t":1}]}')
+    timestamps, values = service.store.range("rain", 0, now * 2000)
+    # The late reading is stored at the time of the previous one, not pinned to the millisecond time
+    assert timestamps.tolist() == [now - 10, now + 60, now + 60]
+    assert values.tolist() == [1, 1, 1]
+
+
+def test_nan_timestamp_leaves_the_series_untouched(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), segment_rows=16)
+    store.append("rain", 1000.0, 1.0)
+    with pytest.raises(ValueError):
+        store.append("rain", float("nan"), 2.0)
+    assert store.range("rain", 0, 2000)[1].tolist() == [1.0]
+    assert store.summary("rain", 0, 2000)["count"] == 1
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from Clock import VirtualClock
+from Scheduler import Scheduler
+from Zone_control_unit import ZoneControlUnit
+
+
+class RecordingClient:
+    def __init__(self):
+        self.published = []
+
+    def mySubscribe(self, topic):
+        pass
+
+    def myPublish(self, topic, msg):
+        self.published.append((topic, msg["e"][0]["v"]))
+
+    def stop(self):
+        pass
+
+
+def start_engine(state_file, clock, client):
+    scheduler = Scheduler(state_file, clock)
+    engine = ZoneControlUnit(None, None, [{"zoneID": "zone1", "soilSensors": 2}], client=client,
+                             scheduler=scheduler, irrigation_duration=30)
+    scheduler.start()
+    return engine
+
+
+def test_irrigation_stop_survives_restart(tmp_path):
+    state_file = str(tmp_path / "zone_control_unit_schedule.json")
+    clock = VirtualClock()
+    engine = start_engine(state_file, clock, RecordingClient())
+    zone = engine.zones["zone1"]
+    zone.soil_moisture[:] = [10, 12]
+    zone.temperature = 20
+    zone.light_level = 50
+    zone.rain_level = 0
+    zone.sunrise_counter = 30
+    with engine.lock:
+        engine.evaluate(zone)
+    assert zone.irrigating
+    assert [job["action"] for job in Scheduler(state_file).saved_jobs()[0]] == ["stop_irrigation"]
+
+    # The process dies with the pump ON; the restarted engine switches it off when the stop comes due
+    restarted_clock = VirtualClock(clock.time())
+    restarted_client = RecordingClient()
+    restarted = start_engine(state_file, restarted_clock, restarted_client)
+    restarted_clock.advance_to(restarted_clock.time() + 31)
+    assert restarted_client.published == [("Garden/zones/zone1/commands/waterpump", 0)]
+    assert not restarted.zones["zone1"].irrigating
+    assert not restarted.zones["zone1"].has_irrigated_today
+    assert Scheduler(state_file).saved_jobs()[0] == []
@@ -0,0 +1,75 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Control_units (Raspberry Pi)'))
+from Control_unit import irrigation_decision
+from Zone_evaluator import ZoneEvaluator, reasons_from_flags, MISSING_DATA
+
+
+def scalar_decisions(evaluator):
+    decisions = []
+    for position in range(len(evaluator.temperature)):
+        soil_values = [value for value in evaluator.moisture[position].tolist() if value == value]
+        temperature = evaluator.temperature[position].item()
+        rain_level = evaluator.rain_level[position].item()
+        light_level = evaluator.light_level[position].item()
+        if not soil_values or temperature != temperature or rain_level != rain_level or light_level != light_level:
+            decisions.append((False, reasons_from_flags(MISSING_DATA)))
+            continue
+        decisions.append(irrigation_decision(
+            bool(evaluator.has_irrigated_today[position]), evaluator.sunrise_counter[position].item(),
+            sum(soil_values) / len(soil_values), temperature, rain_level, evaluator.moisture_threshold,
+            evaluator.temperature_threshold, evaluator.rain_detected_level, evaluator.do_not_water_temp,
+            evaluator.sunrise_buffer))
+    return decisions
+
+
+def test_matches_irrigation_decision_at_threshold_boundaries():
+    rng = np.random.default_rng(1)
+    zone_count = 5000
+    evaluator = ZoneEvaluator(zone_count, soil_sensors=3)
+    # Every reading sits on or right next to a threshold of the default settings
+    evaluator.moisture[:] = rng.choice([29.9, 30.0, 30.1], (zone_count, 1))
+    evaluator.moisture[rng.random((zone_count, 3)) < 0.05] = np.nan
+    evaluator.temperature[:] = rng.choice([3.9, 4.0, 4.1, 29.9, 30.0, 30.1], zone_count)
+    evaluator.rain_level[:] = rng.choice([3, 4, 5], zone_count)
+    evaluator.light_level[:] = rng.uniform(0, 500, zone_count)
+    evaluator.sunrise_counter[:] = rng.choice([0, 0.1, 59.9, 60], zone_count)
+    evaluator.has_irrigated_today[:] = rng.random(zone_count) < 0.2
+    for column in (evaluator.temperature, evaluator.rain_level, evaluator.light_level):
+        column[rng.random(zone_count) < 0.02] = np.nan
+
+    irrigate, flags = evaluator.evaluate()
+    for position, (should_irrigate, reasons) in enumerate(scalar_decisions(evaluator)):
+        assert should_irrigate == irrigate[position], position
+        assert reasons == reasons_from_flags(flags[position]), position
+    assert irrigate.any()
+
+
+def test_average_moisture_rounds_like_the_scalar_sum():
+    rng = np.random.default_rng(2)
+    zone_count = 5000
+    evaluator = ZoneEvaluator(zone_count, soil_sensors=9)
+    # Distinct one-decimal readings per sensor whose mean is 30 up to rounding, the last one balancing the others
+    readings = np.round(rng.uniform(5, 56, (zone_count, 8)), 1)
+    last = np.round(270 - readings.sum(axis=1), 1)
+    evaluator.moisture[:] = np.column_stack([readings, last])
+    evaluator.moisture[rng.random((zone_count, 9)) < 0.05] = np.nan
+    # Pairwise summation gives 30.0 for this zone, the left-to-right sum 29.999999999999993
+    evaluator.moisture[0] = [44.1, 13.0, 55.4, 55.9, 44.6, 29.7, 10.7, 10.7, 5.9]
+    evaluator.temperature[:] = 20
+    evaluator.rain_level[:] = 0
+    evaluator.light_level[:] = 50
+    evaluator.sunrise_counter[:] = 30
+
+    average = evaluator.average_moisture()
+    for position in range(zone_count):
+        soil_values = [value for value in evaluator.moisture[position].tolist() if value == value]
+        assert average[position] == sum(soil_values) / len(soil_values), position
+    assert average[0] < 30
+
+    irrigate, flags = evaluator.evaluate()
+    for position, (should_irrigate, reasons) in enumerate(scalar_decisions(evaluator)):
+        assert should_irrigate == irrigate[position], position
+        assert reasons == reasons_from_flags(flags[position]), position